@@ -0,0 +1,131 @@
+""" Headless runs of the simulation, without the matplotlib window of render.
+    run_headless simulates one community and returns its time series, sweep spreads many
+    parameter configurations (and replicas of each) over a process pool.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import itertools
+import math
+import random
+
+import numpy as np
+import simpy
+
+import instrument
+import world
+
+# parameters that can be changed while simulating (sliders in render)
+PARAMETERS = ("walk_range", "stop_duration", "popular_place_probability",
+              "infect_range", "infect_probability")
+NUM_PEOPLE = 100  # default population of make_community
+
+
+def parameter_ranges(boundaries):
+    """{parameter: (lowest, highest)} allowed for the PARAMETERS of a community with these
+    boundaries, the ranges of the sliders of render"""
+    (start_x, end_x), (start_y, end_y) = boundaries
+    max_walk_range = round(math.sqrt((end_x - start_x)**2 + (end_y - start_y)**2))
+    return {"walk_range": (1, max_walk_range),
+            "stop_duration": (1, 1000),
+            "popular_place_probability": (0, 1),
+            "infect_range": (0, max_walk_range/2),
+            "infect_probability": (0, 0.5)}
+
+
+def make_community(env, seed=None, num_people=NUM_PEOPLE, num_popular_places=10,
+                   boundaries=((0, 200), (0, 200)), vectorized=True, event_driven=False,
+                   first_id=0, **parameters):
+    """Builds a community like engine.main does, but reproducible from seed.
+    parameters are the people attributes to set (see PARAMETERS). event_driven only
+    applies to the object based community (vectorized=False), first_id (the id of the
+    first person) only to the vectorized one.
+    """
+    rng = np.random.default_rng(seed)
+    popular_places = [(int(rng.integers(boundaries[0][0], boundaries[0][1])),
+                       int(rng.integers(boundaries[1][0], boundaries[1][1])))
+                      for _ in range(num_popular_places)]
+    community_seed = int(rng.integers(2**63))
+    if vectorized:
+        community = world.VectorCommunity(boundaries, env,
+                                          no_of_people=num_people,
+                                          popular_places=popular_places,
+                                          seed=community_seed, first_id=first_id)
+    else:
+        # Person and Community use the random module
+        random.seed(community_seed)
+        community = world.Community(boundaries, env,
+                                    no_of_people=num_people,
+                                    popular_places=popular_places,
+                                    event_driven=event_driven)
+    for attr_name, value in parameters.items():
+        if attr_name not in PARAMETERS:
+            raise ValueError("Unknown parameter: {}".format(attr_name))
+        community.set_people_attribute(attr_name, value)
+    return community
+
+
+def run_headless(steps, seed=None, **kwargs):
+    """Simulates a community for the given number of SimPy steps without rendering.
+    kwargs are passed to make_community.
+
+    Returns a dict with the arrays "infected_percent" and "r_value", one value per step
+    """
+    env = simpy.Environment()
+    community = make_community(env, seed=seed, **kwargs)
+    community.activate()
+    infected_percent = np.empty(steps)
+    r_value = np.empty(steps)
+    data = None
+    for step in range(steps):
+        instrument.run_step(env)
+        data, r_value[step], infected_percent[step] = community.get_all_positions_colors(
+            0, 1, nparray_to_fill=data)
+    return {"infected_percent": infected_percent, "r_value": r_value}
+
+
+def grid(**values):
+    """Every combination of the given parameter values, as a list of configurations
+    e.g. grid(infect_range=[1, 2], infect_probability=[0.01, 0.05]) gives 4 configurations
+    """
+    names = list(values)
+    return [dict(zip(names, combination))
+            for combination in itertools.product(*(values[name] for name in names))]
+
+
+def _run_replica(job):
+    """Worker for sweep, needs to be at module level to be picklable"""
+    config, seed, steps = job
+    return run_headless(steps, seed=seed, **config)
+
+
+def sweep(configs, steps, replicas=1, seed=None, processes=None, chunksize=1):
+    """Runs every configuration (dict of make_community arguments) replicas times in a
+    process pool. Every run gets its own RNG stream spawned from seed.
+
+    Returns one table (NumPy structured array) with a row per run: the configuration
+    index, replica number, seed, the configuration values and the infected_percent and
+    r_value series of length steps.
+    """
+    configs = list(configs)
+    seeds = [int(child.generate_state(1, np.uint64)[0])
+             for child in np.random.SeedSequence(seed).spawn(len(configs) * replicas)]
+    jobs = [(config, seeds[index * replicas + replica], steps)
+            for index, config in enumerate(configs)
+            for replica in range(replicas)]
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        results = list(executor.map(_run_replica, jobs, chunksize=chunksize))
+
+    names = sorted({name for config in configs for name in config})
+    columns = [np.array([config.get(name) for config in configs]) for name in names]
+    dtype = ([("config", np.int64), ("replica", np.int64), ("seed", np.uint64)]
+             + [(name, column.dtype) for name, column in zip(names, columns)]
+             + [("infected_percent", float, (steps,)), ("r_value", float, (steps,))])
+    table = np.empty(len(jobs), dtype=dtype)
+    table["config"] = np.repeat(np.arange(len(configs)), replicas)
+    table["replica"] = np.tile(np.arange(replicas), len(configs))
+    table["seed"] = seeds
+    for name, column in zip(names, columns):
+        table[name] = np.repeat(column, replicas)
+    table["infected_percent"] = [result["infected_percent"] for result in results]
+    table["r_value"] = [result["r_value"] for result in results]
+    return table
@@ -0,0 +1,224 @@
+""" Benchmarks of the simulation hot paths, run headless:
+
+        python bench.py --output results.json
+        python bench.py --baseline                    # compare, exit code 1 on regressions
+        python bench.py --save-baseline bench_baseline.json  # store a new baseline
+        python -m pytest -m benchmark                  # the same check from pytest
+
+    Every benchmark is run for every population size and reports a rate (operations,
+    steps or ticks per second, higher is better). bench_baseline.json holds the rates of
+    the default run (every size, no --max-object-size) on the reference machine (one
+    core), save a new one when the machine changes. The check is wall clock, so it is a
+    CI step on that machine and not part of the default test run.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+import numpy as np
+import simpy
+
+import world
+from spatialhash import GridSpatialIndex, PersonSpatialHash
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASELINE = os.path.join(HERE, "bench_baseline.json")
+SIZES = (100, 1000, 10000, 100000)
+MIN_TIME = 0.2  # seconds spent on every measurement
+BOUNDARIES = ((0, 200), (0, 200))
+POPULAR_PLACES = [(20, 20), (100, 150), (180, 60)]
+
+
+def _rate(func, operations, min_time=MIN_TIME):
+    """Calls func() until min_time has passed, returns operations per second"""
+    calls = 0
+    begin = time.perf_counter()
+    while True:
+        func()
+        calls += 1
+        elapsed = time.perf_counter() - begin
+        if elapsed >= min_time:
+            return calls * operations / elapsed
+
+
+def _community(size, vectorized=False):
+    random.seed(0)
+    env = simpy.Environment()
+    if vectorized:
+        community = world.VectorCommunity(BOUNDARIES, env, no_of_people=size,
+                                          popular_places=POPULAR_PLACES, seed=0)
+    else:
+        community = world.Community(BOUNDARIES, env, no_of_people=size,
+                                    popular_places=POPULAR_PLACES)
+    return env, community
+
+
+def bench_spatialhash_update(size, index_class=PersonSpatialHash):
+    """updateObject calls per second"""
+    _, community = _community(size)
+    index = index_class(cell_size=3)
+    for person in community.population:
+        index.insertObject(person)
+    moves = [(person, person.position[0] + 1, person.position[1] + 1)
+             for person in community.population]
+
+    def update():
+        for person, new_x, new_y in moves:
+            index.updateObject(person, new_x, new_y)
+            person.position = new_x, new_y
+        for person, new_x, new_y in moves:
+            index.updateObject(person, new_x - 1, new_y - 1)
+            person.position = new_x - 1, new_y - 1
+    return _rate(update, 2 * size)
+
+
+def bench_spatialhash_search(size, index_class=PersonSpatialHash):
+    """search_nearby calls per second"""
+    _, community = _community(size)
+    index = index_class(cell_size=3)
+    for person in community.population:
+        index.insertObject(person)
+    people = community.population[:1000]
+
+    def search():
+        for person in people:
+            index.search_nearby(person, 2)
+    return _rate(search, len(people))
+
+
+def bench_grid_search_pairs(size):
+    """query points per second of the batch GridSpatialIndex.search_pairs"""
+    rng = np.random.default_rng(0)
+    positions = rng.uniform(0, 200, (size, 2))
+    index = GridSpatialIndex.from_positions(positions, cell_size=3)
+    index.rebuild()
+    return _rate(lambda: index.search_pairs(positions, 2), size)
+
+
+def bench_person_wander(size):
+    """Person.wander steps (one person moving once) per second"""
+    env, community = _community(size)
+    community.set_people_attribute("walk_range", 50)
+    community.set_people_attribute("popular_place_probability", 0)
+
+    def walk(person):
+        # wander again as soon as the walk ends, so everybody moves every tick
+        while True:
+            # the default batched infection does not keep the spatial hash up to date
+            yield env.process(person.wander(None))
+
+    for person in community.population:
+        env.process(walk(person))
+
+    def tick():
+        env.run(until=env.now+1)
+    return _rate(tick, size)
+
+
+def bench_positions_colors(size, vectorized=False):
+    """get_all_positions_colors calls per second"""
+    _, community = _community(size, vectorized)
+    data, _, _ = community.get_all_positions_colors(0.5, 0.9)
+    return _rate(lambda: community.get_all_positions_colors(0.5, 0.9, nparray_to_fill=data), 1)
+
+
+def bench_ticks(size, vectorized=False):
+    """End to end SimPy ticks per second"""
+    env, community = _community(size, vectorized)
+    community.activate()
+    return _rate(lambda: env.run(until=env.now+1), 1)
+
+
+SKIPPED = "skipped"  # results key of the sizes left out by max_object_size
+BENCHMARKS = {
+    "spatialhash_update": bench_spatialhash_update,
+    "spatialhash_search_nearby": bench_spatialhash_search,
+    "grid_search_pairs": bench_grid_search_pairs,
+    "person_wander_steps": bench_person_wander,
+    "positions_colors": bench_positions_colors,
+    "positions_colors_vectorized": lambda size: bench_positions_colors(size, True),
+    "ticks": bench_ticks,
+    "ticks_vectorized": lambda size: bench_ticks(size, True),
+}
+# benchmarks building one Person per person, slow to set up for big populations
+OBJECT_BASED = {"spatialhash_update", "spatialhash_search_nearby", "person_wander_steps",
+                "positions_colors", "ticks"}
+
+
+def run(sizes=SIZES, names=None, max_object_size=None):
+    """Runs the benchmarks, returns {benchmark name: {population size: rate}}
+    max_object_size skips the object based (Person) benchmarks above that size, the
+    sizes skipped are then listed in results["skipped"] as {benchmark name: [sizes]}.
+    """
+    results = {}
+    skipped = {}
+    for name in names or BENCHMARKS:
+        results[name] = {}
+        for size in sizes:
+            if max_object_size and name in OBJECT_BASED and size > max_object_size:
+                skipped.setdefault(name, []).append(str(size))
+                continue
+            results[name][str(size)] = BENCHMARKS[name](size)
+    if skipped:
+        results[SKIPPED] = skipped
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Returns the (name, size, rate, baseline rate) of every result slower than the
+    baseline by more than tolerance (a fraction)"""
+    regressions = []
+    for name, rates in results.items():
+        if name == SKIPPED:
+            continue
+        for size, rate in rates.items():
+            expected = baseline.get(name, {}).get(size)
+            if expected and rate < expected * (1 - tolerance):
+                regressions.append((name, size, rate, expected))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), help="benchmarks to run")
+    parser.add_argument("--max-object-size", type=int, default=0,
+                        help="skip Person based benchmarks above this size (0, the default, "
+                             "for no limit), the skipped sizes are listed under \"skipped\"")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", nargs="?", const=BASELINE,
+                        help="compare against this JSON file (bench_baseline.json by default)")
+    parser.add_argument("--save-baseline", help="write the results as a baseline JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="slowdown (fraction) allowed before reporting a regression")
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.only, args.max_object_size)
+    for name, rates in results.items():
+        if name == SKIPPED:
+            continue
+        for size, rate in rates.items():
+            print("{:30s} {:>7s} {:14.1f}/s".format(name, size, rate))
+    for name, sizes in results.get(SKIPPED, {}).items():
+        print("{:30s} skipped {}".format(name, ", ".join(sizes)))
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as output:
+                json.dump(results, output, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        for name, size, rate, expected in regressions:
+            print("REGRESSION {} at {}: {:.1f}/s, baseline {:.1f}/s".format(
+                name, size, rate, expected))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
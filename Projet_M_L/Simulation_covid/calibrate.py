@@ -0,0 +1,218 @@
+""" Calibration of the simulation against an observed curve of active cases.
+    Searches the parameters of the community (infect_probability and infect_range by
+    default) for which the simulated active cases follow the observed ones, e.g. the
+    active cases of dataset_morocco.csv:
+
+        python calibrate.py [days]
+
+    People never recover in the simulation, the active cases of a day are the people
+    infected during the last recovery_days days. The observed curve is scaled so its peak
+    is peak_percent of the simulated population, and the error of a run is the sum over
+    the days of the squared difference of the two curves (in percent).
+
+    Every parameter point is simulated replicas times in a process pool (the replicas of all
+    points use the same seeds, so the points are compared on the same draws). The search
+    samples points in a box around the best point found so far, shrinking it every round.
+    Points are snapped to RESOLUTION, so a point close to one already simulated reuses its
+    result (also across runs with a cache file), and a replica is stopped as soon as its
+    error exceeds early_stop times the error of the best point: the error only grows with
+    the days, it cannot come back.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import csv
+from datetime import datetime
+import hashlib
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import simpy
+
+import batch
+import instrument
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+MOROCCO_CSV = os.path.join(HERE, "..", "Prophet_data", "dataset_morocco.csv")
+PARAMETER_BOUNDS = {"infect_probability": (0.001, 0.2), "infect_range": (0.5, 8.0)}
+RESOLUTION = {"infect_probability": 0.0005, "infect_range": 0.1, "walk_range": 1.0,
+              "stop_duration": 1.0, "popular_place_probability": 0.01}
+STEPS_PER_DAY = 10  # simulation steps for one day of the observations
+RECOVERY_DAYS = 14  # days an infected person counts as an active case
+PEAK_PERCENT = 20.0  # percent of the simulated people active at the observed peak
+EARLY_STOP = 3.0
+
+
+def load_active_cases(path=MOROCCO_CSV):
+    """(dates, active cases) of dataset_morocco.csv. The cumulative counts are missing on
+    days without change, they keep the value of the day before."""
+    dates, rows = [], []
+    with open(path, newline="", encoding="utf-8-sig") as csv_file:
+        reader = csv.DictReader(csv_file)
+        for row in reader:
+            if not row["Date"]:
+                continue
+            dates.append(datetime.strptime(row["Date"], "%d/%m/%Y").date())
+            rows.append([float(row[name]) if row[name] else np.nan
+                         for name in ("Confirmed", "Recovered", "Deaths")])
+    counts = np.array(rows)
+    for day in range(len(counts)):
+        missing = np.isnan(counts[day])
+        counts[day, missing] = counts[day - 1, missing] if day else 0
+    return np.array(dates, dtype="datetime64[D]"), counts[:, 0] - counts[:, 1] - counts[:, 2]
+
+
+def target_curve(active, peak_percent=PEAK_PERCENT):
+    """Observed active cases scaled to percent of the simulated population"""
+    active = np.asarray(active, dtype=float)
+    return peak_percent * active / active.max()
+
+
+def simulated_active(infected_percent, recovery_days=RECOVERY_DAYS):
+    """Active cases (percent) from the percent of people ever infected, one value a day"""
+    infected_percent = np.asarray(infected_percent, dtype=float)
+    active = infected_percent.copy()
+    active[recovery_days:] -= infected_percent[:-recovery_days]
+    return active
+
+
+def snap(point):
+    """point rounded to RESOLUTION, points closer than that share their results"""
+    return tuple(sorted((name, round(round(value / RESOLUTION[name]) * RESOLUTION[name], 10))
+                        for name, value in point.items()))
+
+
+def _run_replica(job):
+    """Simulates one replica of a point, stopping when the error passes the budget.
+    Needs to be at module level to be picklable.
+    Returns (error, days simulated).
+    """
+    config, seed, target, steps_per_day, recovery_days, budget = job
+    env = simpy.Environment()
+    community = batch.make_community(env, seed=seed, **config)
+    community.activate()
+    infected_percent = np.zeros(len(target))
+    error = 0.0
+    data = None
+    for day in range(len(target)):
+        for _ in range(steps_per_day):
+            instrument.run_step(env)
+        data, _, infected_percent[day] = community.get_all_positions_colors(
+            0, 1, nparray_to_fill=data)
+        # same active cases as simulated_active gives for the whole run
+        active = simulated_active(infected_percent[:day + 1], recovery_days)[day]
+        error += (active - target[day]) ** 2
+        if error > budget:
+            break
+    return error, day + 1
+
+
+def _settings_hash(target, fixed, replicas, seed, steps_per_day, recovery_days):
+    """Identifies what the errors of a cache file were computed for"""
+    description = json.dumps([sorted(fixed.items()), replicas, seed, steps_per_day,
+                              recovery_days], sort_keys=True)
+    digest = hashlib.sha1(description.encode())
+    digest.update(np.asarray(target, dtype=float).tobytes())
+    return digest.hexdigest()
+
+
+def _read_cache(path, settings):
+    if path is None or not os.path.exists(path):
+        return {}
+    with open(path) as cache_file:
+        content = json.load(cache_file)
+    if content.get("settings") != settings:
+        return {}
+    return {tuple(map(tuple, point)): tuple(result) for point, result in content["points"]}
+
+
+def _write_cache(path, settings, results):
+    if path is None:
+        return
+    with open(path + ".tmp", "w") as cache_file:
+        json.dump({"settings": settings,
+                   "points": [[point, result] for point, result in results.items()]},
+                  cache_file)
+    os.replace(path + ".tmp", path)
+
+
+def calibrate(target, bounds=None, rounds=5, points=8, replicas=4, seed=None,
+              steps_per_day=STEPS_PER_DAY, recovery_days=RECOVERY_DAYS, early_stop=EARLY_STOP,
+              processes=None, cache=None, **fixed):
+    """Searches the parameters in bounds ({name: (low, high)}, PARAMETER_BOUNDS by default)
+    making the simulated active cases follow target (percent a day, see target_curve).
+    fixed are other arguments of batch.make_community (num_people, ...).
+    cache is a JSON file keeping the results of the points between runs.
+
+    Returns (best point, table): table is a NumPy structured array with a row per point
+    simulated: the parameters, the mean error of its replicas (inf for a point whose
+    replicas were stopped early), the replicas stopped and the days simulated.
+    """
+    bounds = dict(PARAMETER_BOUNDS if bounds is None else bounds)
+    names = sorted(bounds)
+    target = np.asarray(target, dtype=float)
+    rng = np.random.default_rng(seed)
+    seeds = [int(child.generate_state(1, np.uint64)[0])
+             for child in np.random.SeedSequence(seed).spawn(replicas)]
+    settings = _settings_hash(target, fixed, replicas, seed, steps_per_day, recovery_days)
+    # snapped point -> (mean error, replicas stopped, days simulated)
+    results = _read_cache(cache, settings)
+    low = np.array([bounds[name][0] for name in names])
+    high = np.array([bounds[name][1] for name in names])
+    center, width = (low + high) / 2, high - low
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        for _ in range(rounds):
+            candidates = np.clip(center + (rng.random((points, len(names))) - 0.5) * width,
+                                 low, high)
+            new = []
+            for candidate in candidates:
+                point = snap(dict(zip(names, candidate)))
+                if point not in results and point not in new:
+                    new.append(point)
+            finite = [result[0] for result in results.values() if np.isfinite(result[0])]
+            # a replica this much worse than the best point cannot be the best
+            budget = early_stop * min(finite) if finite else np.inf
+            jobs = [(dict(point, **fixed), replica_seed, target, steps_per_day,
+                     recovery_days, budget)
+                    for point in new for replica_seed in seeds]
+            runs = list(executor.map(_run_replica, jobs))
+            for index, point in enumerate(new):
+                point_runs = runs[index * replicas:(index + 1) * replicas]
+                stopped = sum(days < len(target) for _, days in point_runs)
+                error = np.inf if stopped else float(np.mean([run[0] for run in point_runs]))
+                results[point] = (error, stopped, sum(days for _, days in point_runs))
+            _write_cache(cache, settings, results)
+
+            best = min(results, key=lambda point: results[point][0])
+            center = np.array([dict(best)[name] for name in names])
+            width = width / 2
+
+    table = np.zeros(len(results), dtype=[(name, float) for name in names]
+                     + [("error", float), ("stopped", np.int64), ("days", np.int64)])
+    for row, (point, result) in enumerate(sorted(results.items(), key=lambda item: item[1][0])):
+        for name, value in point:
+            if name in names:
+                table[name][row] = value
+        table["error"][row], table["stopped"][row], table["days"][row] = result
+    return dict(best), table
+
+
+def main(argv):
+    """python calibrate.py [days]
+    Calibrates against the first days (all by default) of the active cases in Morocco.
+    """
+    dates, active = load_active_cases()
+    days = int(argv[0]) if argv else len(active)
+    begin = time.perf_counter()
+    best, table = calibrate(target_curve(active[:days]), seed=0,
+                            cache=os.path.join(HERE, "calibration_cache.json"))
+    print("Calibrated on {} days in {:.1f} s, {} points, {} replicas stopped early".format(
+        days, time.perf_counter() - begin, len(table), table["stopped"].sum()))
+    print("Best point: {} (error {:.1f})".format(best, table["error"][0]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
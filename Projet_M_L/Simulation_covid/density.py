@@ -0,0 +1,64 @@
+""" Level of detail for large populations: people counted in a grid of bins instead of
+    drawn one by one. The counts are kept from one frame to the next and only the people
+    who changed bin or state are moved, so a frame costs little more than finding the bin
+    of everyone. Used by render (in the window) and export (in the frames written).
+"""
+import numpy as np
+
+DENSITY_THRESHOLD = 5000  # more people than this are drawn as a density image
+DENSITY_BINS = 100  # bins along each axis of the density image
+
+
+class DensityGrid:
+    """
+    Number of susceptible and infected people in every bin of a community
+
+        grid = DensityGrid(community.position)
+        grid.update(data[:, 0:2], data[:, 2] == infected_color)
+        ax.imshow(grid.image(normal_rgb, infected_rgb), origin="lower", extent=grid.extent)
+
+    counts[0] are the susceptible people, counts[1] the infected ones, rows along y.
+    """
+    def __init__(self, position, bins=DENSITY_BINS):
+        (self.start_x, self.end_x), (self.start_y, self.end_y) = position
+        self.bins = bins
+        self.extent = (self.start_x, self.end_x, self.start_y, self.end_y)
+        self.counts = np.zeros((2, bins, bins), dtype=np.int64)
+        self._keys = None  # state * bins**2 + bin of every person at the last update
+
+    def keys(self, positions, infected):
+        """Index in counts.ravel() of every person"""
+        column = (positions[:, 0] - self.start_x) * (self.bins / (self.end_x - self.start_x))
+        row = (positions[:, 1] - self.start_y) * (self.bins / (self.end_y - self.start_y))
+        column = np.clip(column, 0, self.bins - 1).astype(np.int64)
+        row = np.clip(row, 0, self.bins - 1).astype(np.int64)
+        return (np.asarray(infected, dtype=np.int64) * self.bins + row) * self.bins + column
+
+    def update(self, positions, infected):
+        """Counts the people again from their positions and infected flags, only moving the
+        ones who changed since the last update (all of them when the population changed)"""
+        keys = self.keys(positions, infected)
+        counts = self.counts.reshape(-1)
+        if self._keys is None or len(keys) != len(self._keys):
+            counts[:] = np.bincount(keys, minlength=len(counts))
+        else:
+            changed = keys != self._keys
+            if changed.any():
+                counts -= np.bincount(self._keys[changed], minlength=len(counts))
+                counts += np.bincount(keys[changed], minlength=len(counts))
+        self._keys = keys
+        return self.counts
+
+    def image(self, normal_rgb, infected_rgb):
+        """RGBA image of the counts: the color goes from normal_rgb to infected_rgb with the
+        share of infected people of a bin, the opacity grows with its number of people"""
+        susceptible, infected = self.counts
+        total = susceptible + infected
+        image = np.zeros((self.bins, self.bins, 4))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            share = np.where(total > 0, infected / total, 0)[:, :, None]
+        image[:, :, 0:3] = (1 - share) * np.asarray(normal_rgb[:3]) \
+            + share * np.asarray(infected_rgb[:3])
+        # square root so that sparse bins stay visible next to crowded ones
+        image[:, :, 3] = np.sqrt(total / max(total.max(), 1))
+        return image
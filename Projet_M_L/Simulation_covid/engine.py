@@ -1,42 +1,93 @@
+import asyncio
 import random
 
 
 import simpy
 
+import instrument
 import world
 import render
+import recording
+import server
+import worker
 
 
-def main():
+def main(num_people=100, vectorized=False, profile=None, background=False, event_driven=False):
     """Entire simulation process, must make all the data here available to the gui
+
+        Parameters:
+            - num_people: number of people in the sample community
+            - vectorized: use world.VectorCommunity (NumPy arrays, one SimPy process)
+                instead of one Person object and process per person
+            - profile: file to dump the time spent in every phase of the loop to (JSON),
+                when the window is closed. See instrument
+            - background: simulate as fast as possible on a worker thread and render the
+                latest step, instead of one step per frame
+            - event_driven: only schedule SimPy events when people arrive or stop walking
+                (world.Community only, see world.PathTable)
     """
+    if profile:
+        instrument.enable()
     env = simpy.Environment()
 
     # simulating one (small) sample community for now
     boundaries = ((0, 200), (0, 200))  # boundaries for the sample community
     print(boundaries[1][0])
-    num_people = 100
     num_popular_places = 10
     popular_places = []
     for _ in range(num_popular_places):
         popular_places.append((random.randrange(boundaries[0][0], boundaries[0][1]),
                                random.randrange(boundaries[1][0], boundaries[1][1])))
 
-    sample_community = world.Community(boundaries,
-                                       env,
-                                       no_of_people=num_people,
-                                       popular_places=popular_places)
+    if vectorized:
+        sample_community = world.VectorCommunity(boundaries,
+                                                 env,
+                                                 no_of_people=num_people,
+                                                 popular_places=popular_places)
+    else:
+        sample_community = world.Community(boundaries,
+                                           env,
+                                           no_of_people=num_people,
+                                           popular_places=popular_places,
+                                           event_driven=event_driven)
     sample_community.activate()
 
     def before(env):
-        env.run(until=env.now+1)
-
-    render.render_community(-1, # number of steps
-                            env,
-                            sample_community,
-                            before_callback=before,
-                            before_kwargs={"env": env},
-                            interval=1000.0/60.0)
+        instrument.run_step(env)
+
+    if background:
+        simulation_worker = worker.SimulationWorker(env, sample_community)
+        simulation_worker.start()
+        render.render_community(-1, # number of steps
+                                env,
+                                sample_community,
+                                interval=1000.0/60.0,
+                                worker=simulation_worker)
+        simulation_worker.stop()
+    else:
+        render.render_community(-1, # number of steps
+                                env,
+                                sample_community,
+                                before_callback=before,
+                                before_kwargs={"env": env},
+                                interval=1000.0/60.0)
+    if profile:
+        print(instrument.summary())
+        instrument.dump(profile)
+
+def replay(path):
+    """Plays back a recording made with recording.TrajectoryRecorder, no simulation involved
+    """
+    render.render_community(-1, # play the whole recording
+                            None,
+                            None,
+                            interval=1000.0/60.0,
+                            replay=recording.TrajectoryReader(path))
+
+def stream(num_people=100, port=server.PORT):
+    """Streams the simulation to viewers over TCP (see server) instead of rendering it
+    """
+    asyncio.run(server.serve(num_people, port))
 
 # def test_main():
 #     # BUG , make it shut up for some time
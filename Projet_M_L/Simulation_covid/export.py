@@ -0,0 +1,175 @@
+""" Headless export of recorded runs (see recording) to an image sequence or a video.
+
+        python export.py run.traj frames/          # one PNG per frame
+        python export.py run.traj run.gif [fps]
+        python export.py run.traj run.mp4 [fps]    # any format of ffmpeg, when installed
+
+    Frames are drawn with the Agg backend of matplotlib (no window, no display needed) by a
+    pool of processes, each one rendering a range of frames straight from the memory mapped
+    recording. Like render, populations above a threshold are drawn as a density image.
+    export_run simulates a community, records it and exports it in one go.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import simpy
+
+import batch
+import density
+import recording
+
+FRAME_NAME = "frame_{:06d}.png"
+FPS = 30
+NORMAL_COLOR = 0.5  # colors of render
+INFECTED_COLOR = 0.9
+
+
+def _draw_frames(job):
+    """Worker rendering the frames start to stop of a recording to PNG files in directory,
+    numbered from first. Needs to be at module level to be picklable."""
+    # pyplot is never imported, the figures are drawn by the Agg canvas directly
+    from matplotlib import colormaps
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    path, start, stop, first, directory, density_threshold, bins, dpi = job
+    reader = recording.TrajectoryReader(path)
+    frames = reader.frames
+    infected_percent = np.asarray(frames["infected_percent"])
+
+    figure = Figure(figsize=(16, 9), dpi=dpi)
+    FigureCanvasAgg(figure)
+    ax = figure.subplots(1, 2)
+    (start_x, end_x), (start_y, end_y) = reader.position
+    ax[0].set_aspect('equal')
+    ax[0].set_xlim(start_x-2, end_x+2)
+    ax[0].set_ylim(start_y-2, end_y+2)
+    ax[1].set_ylim(0, 101)
+    ax[1].set_xlim(0, max(len(frames) - 1, 1))
+    ax[1].set_xlabel("Time")
+    ax[1].set_ylabel("Percent of infected")
+    infected_percent_plot, = ax[1].plot([], [])
+    if reader.popular_places:
+        places = np.array(reader.popular_places)
+        ax[0].scatter(places[:, 0], places[:, 1], marker="s", alpha=0.5)
+
+    grid = None
+    cmap = colormaps["jet"]
+    if reader.count > density_threshold:
+        grid = density.DensityGrid(reader.position, bins)
+        people = ax[0].imshow(np.zeros((bins, bins, 4)), origin="lower", extent=grid.extent,
+                              interpolation="nearest", zorder=0)
+        ax[0].set_xlim(start_x-2, end_x+2)
+        ax[0].set_ylim(start_y-2, end_y+2)
+    else:
+        people = ax[0].scatter(np.zeros(reader.count), np.zeros(reader.count),
+                               c=np.zeros(reader.count), vmin=0, vmax=1, cmap="jet",
+                               edgecolor="k")
+    title = figure.suptitle("")
+
+    for index in range(start, stop):
+        frame = frames[index]
+        if grid is not None:
+            # the first frame of the range counts everyone, the next ones the changes
+            grid.update(frame["positions"], frame["infected"])
+            people.set_data(grid.image(cmap(NORMAL_COLOR), cmap(INFECTED_COLOR)))
+        else:
+            people.set_offsets(frame["positions"])
+            people.set_array(np.where(frame["infected"], INFECTED_COLOR, NORMAL_COLOR))
+        infected_percent_plot.set_data(np.arange(index + 1), infected_percent[:index + 1])
+        r_value = "-" if np.isnan(frame["r_value"]) else "{:3.2f}".format(frame["r_value"])
+        title.set_text("Time {:g}    Rt: {}    Percent infected: {:3.2f}%".format(
+            frame["time"], r_value, frame["infected_percent"]))
+        figure.savefig(os.path.join(directory, FRAME_NAME.format(index - first)))
+    return stop - start
+
+
+def _ranges(start, stop, parts):
+    """start to stop cut in parts contiguous ranges"""
+    bounds = np.linspace(start, stop, parts + 1).round().astype(int)
+    return [(int(low), int(high)) for low, high in zip(bounds[:-1], bounds[1:]) if high > low]
+
+
+def _encode(directory, output, fps):
+    """Assembles the frames of directory into the video output (GIF or ffmpeg)"""
+    if output.lower().endswith(".gif"):
+        from PIL import Image
+        names = sorted(name for name in os.listdir(directory) if name.endswith(".png"))
+        images = [Image.open(os.path.join(directory, name)).convert("P") for name in names]
+        images[0].save(output, save_all=True, append_images=images[1:],
+                       duration=round(1000 / fps), loop=0)
+        return
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise RuntimeError("ffmpeg is needed to write {}, export to a directory or a .gif "
+                           "instead".format(output))
+    subprocess.run([ffmpeg, "-y", "-loglevel", "error", "-framerate", str(fps),
+                    "-i", os.path.join(directory, FRAME_NAME.replace("{:06d}", "%06d")),
+                    "-pix_fmt", "yuv420p", output], check=True)
+
+
+def export(path, output, fps=FPS, start=0, stop=None, processes=None,
+           density_threshold=density.DENSITY_THRESHOLD, bins=density.DENSITY_BINS, dpi=100):
+    """Renders the frames start to stop (all by default) of the recording path.
+    output is a directory (no extension) to write the PNG frames to, or a video file:
+    a .gif, or any format ffmpeg writes. The frames are split in contiguous ranges, a few
+    per process, rendered in a process pool.
+
+    Returns the number of frames rendered, raises ValueError when there are none.
+    """
+    num_frames = len(recording.TrajectoryReader(path))
+    stop = num_frames if stop is None else min(stop, num_frames)
+    if start >= stop:
+        raise ValueError("No frames to export: {} has {} frames, asked for {} to {}".format(
+            path, num_frames, start, stop))
+    is_video = bool(os.path.splitext(output.rstrip(os.sep))[1])
+    directory = tempfile.mkdtemp() if is_video else output
+    os.makedirs(directory, exist_ok=True)
+    try:
+        workers = processes or os.cpu_count() or 1
+        # a few ranges per process to balance them, not more: every range starts with a
+        # full count of the density grid and a new figure
+        ranges = _ranges(start, stop, 2 * workers)
+        jobs = [(path, low, high, start, directory, density_threshold, bins, dpi)
+                for low, high in ranges]
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            count = sum(executor.map(_draw_frames, jobs))
+        if is_video:
+            _encode(directory, output, fps)
+    finally:
+        if is_video:
+            shutil.rmtree(directory)
+    return count
+
+
+def export_run(output, steps, seed=None, fps=FPS, processes=None, **kwargs):
+    """Simulates a community (batch.make_community, with kwargs) for steps steps, recording
+    it to a temporary file, and exports the recording to output (see export)."""
+    env = simpy.Environment()
+    community = batch.make_community(env, seed=seed, **kwargs)
+    community.activate()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "run.traj")
+        recording.record_run(path, community, env, steps)
+        return export(path, output, fps=fps, processes=processes)
+
+
+def main(argv):
+    """python export.py recording output [fps]"""
+    if len(argv) < 2:
+        print(main.__doc__)
+        return 1
+    begin = time.perf_counter()
+    count = export(argv[0], argv[1], fps=int(argv[2]) if len(argv) > 2 else FPS)
+    print("{} frames exported in {:.1f} s".format(count, time.perf_counter() - begin))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,115 @@
+""" Log of every infection in a community: when it happened, who infected who.
+    Events are appended in time order to growable NumPy arrays, so counts over a time
+    window are two binary searches instead of a pass over the population.
+"""
+import numpy as np
+
+SEED_INFECTOR = -1  # infector id of the people infected at the start
+
+
+class InfectionLog:
+    """
+    Array backed infection event log
+
+    Functions
+    ------------
+
+    append(time, infector, infectee)
+        log one infection
+
+    extend(time, infectors, infectees)
+        log many infections at once
+
+    reproduction_number(now, window)
+        windowed cohort effective reproduction number Rt
+
+    save(path) / load(path)
+        export the log to (and read it from) a .npz file
+    """
+    def __init__(self, capacity=1024, start=0.0):
+        self.start = start  # time the log starts at, e.g. env.now of the community
+        self.times = np.empty(capacity)
+        self.infectors = np.empty(capacity, dtype=np.int64)
+        self.infectees = np.empty(capacity, dtype=np.int64)
+        self.count = 0  # number of infections logged
+
+    def __len__(self):
+        return self.count
+
+    def _reserve(self, extra):
+        """Makes room for extra more events, growing the arrays geometrically"""
+        needed = self.count + extra
+        if needed <= len(self.times):
+            return
+        capacity = max(needed, 2 * len(self.times))
+        for name in ("times", "infectors", "infectees"):
+            grown = np.empty(capacity, dtype=getattr(self, name).dtype)
+            grown[:self.count] = getattr(self, name)[:self.count]
+            setattr(self, name, grown)
+
+    def append(self, time, infector, infectee):
+        self._reserve(1)
+        self.times[self.count] = time
+        self.infectors[self.count] = infector
+        self.infectees[self.count] = infectee
+        self.count += 1
+
+    def extend(self, time, infectors, infectees):
+        num_events = len(infectees)
+        self._reserve(num_events)
+        end = self.count + num_events
+        self.times[self.count:end] = time
+        self.infectors[self.count:end] = infectors
+        self.infectees[self.count:end] = infectees
+        self.count = end
+
+    def infections_between(self, start, end):
+        """Number of infections with start < time <= end"""
+        times = self.times[:self.count]
+        return int(np.searchsorted(times, end, side="right")
+                   - np.searchsorted(times, start, side="right"))
+
+    def reproduction_number(self, now, window):
+        """Cohort effective reproduction number Rt: the mean number of people infected
+        by the cohort of people infected in (now - 2*window, now - window], counting the
+        infections they caused up to now. The cohort has had at least window steps to
+        infect others, so later infections of a person are missed only past that.
+        Only the events of the last two windows are read.
+        Returns NaN until two full windows have passed since start, and 0 when nobody
+        was infected in the cohort window.
+        """
+        if now - 2*window < self.start:
+            return float("nan")
+        times = self.times[:self.count]
+        first = np.searchsorted(times, now - 2*window, side="right")
+        cohort_end = np.searchsorted(times, now - window, side="right")
+        last = np.searchsorted(times, now, side="right")
+        cohort = self.infectees[first:cohort_end]
+        if not len(cohort):
+            return 0.0
+        secondary = np.isin(self.infectors[first:last], cohort).sum()
+        return float(secondary) / len(cohort)
+
+    def to_array(self):
+        """Copy of the log as a structured array with time, infector and infectee fields"""
+        events = np.empty(self.count, dtype=[("time", float), ("infector", np.int64),
+                                             ("infectee", np.int64)])
+        events["time"] = self.times[:self.count]
+        events["infector"] = self.infectors[:self.count]
+        events["infectee"] = self.infectees[:self.count]
+        return events
+
+    def save(self, path):
+        """Saves the log to a .npz file (start, time, infector and infectee arrays)"""
+        np.savez(path,
+                 start=self.start,
+                 time=self.times[:self.count],
+                 infector=self.infectors[:self.count],
+                 infectee=self.infectees[:self.count])
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as saved:
+            log = cls(capacity=max(1024, len(saved["time"])), start=saved["start"].item())
+            log.extend(saved["time"], saved["infector"], saved["infectee"])
+        return log
@@ -0,0 +1,120 @@
+""" Switchable timing of the phases of the simulation loop.
+    Disabled by default, the instrumented code then only checks instrument.enabled.
+
+        import instrument
+        instrument.enable()
+        ... run the simulation ...
+        print(instrument.summary())
+        instrument.dump("phases.json")
+
+    Phases recorded by the simulation:
+        - movement: people moving (Person.wander, VectorCommunity.step)
+        - spatialhash_update: updating the spatial hash after a move (only when people
+            search it themselves, Community(batched_infection=False))
+        - infection_search: searching and infecting people nearby
+        - event_scheduling: creating the SimPy events of the people
+        - tick: a whole env.run of one step (see run_step), what is left of it after the
+            phases above is spent dispatching events inside SimPy
+        - stats: get_all_positions_colors
+        - artists: updating the data of the matplotlib artists in render
+        - drawing: drawing them and blitting them to the window in render (most of the
+            frame time with many people)
+"""
+import json
+import time
+
+import numpy as np
+
+NUM_BUCKETS = 40  # histogram buckets, bucket i counts durations in [2**i, 2**(i+1)) ns
+
+enabled = False
+_phases = {}
+
+
+class PhaseStats:
+    """Count, total and log2 histogram of the durations of one phase"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0  # seconds
+        self.histogram = np.zeros(NUM_BUCKETS, dtype=np.int64)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        bucket = int(seconds * 1e9).bit_length() - 1
+        self.histogram[min(max(bucket, 0), NUM_BUCKETS - 1)] += 1
+
+    def as_dict(self):
+        return {"count": self.count,
+                "total": self.total,
+                "mean": self.total / self.count if self.count else 0.0,
+                "histogram_ns_log2": self.histogram.tolist()}
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def reset():
+    """Forgets everything recorded so far"""
+    _phases.clear()
+
+
+def record(phase, seconds):
+    """Adds one duration to a phase"""
+    stats = _phases.get(phase)
+    if stats is None:
+        stats = _phases[phase] = PhaseStats()
+    stats.add(seconds)
+
+
+def lap(phase, since):
+    """Records the time passed since a time.perf_counter() value and returns the current
+    one, to time consecutive phases:
+        clock = instrument.enabled and time.perf_counter()
+        ...
+        if clock:
+            clock = instrument.lap("movement", clock)
+    """
+    now = time.perf_counter()
+    record(phase, now - since)
+    return now
+
+
+def run_step(env):
+    """env.run for one step, timed as the tick phase"""
+    if not enabled:
+        env.run(until=env.now+1)
+        return
+    begin = time.perf_counter()
+    env.run(until=env.now+1)
+    record("tick", time.perf_counter() - begin)
+
+
+def stats():
+    """{phase: {count, total, mean, histogram_ns_log2}} of everything recorded"""
+    return {phase: phase_stats.as_dict() for phase, phase_stats in _phases.items()}
+
+
+def summary():
+    """Text table of the phases, longest total first"""
+    lines = ["{:20s} {:>10s} {:>12s} {:>12s}".format("phase", "count", "total (s)",
+                                                      "mean (us)")]
+    for phase, phase_stats in sorted(_phases.items(), key=lambda item: -item[1].total):
+        lines.append("{:20s} {:10d} {:12.4f} {:12.2f}".format(
+            phase, phase_stats.count, phase_stats.total,
+            1e6 * phase_stats.total / phase_stats.count))
+    return "\n".join(lines)
+
+
+def dump(path):
+    """Writes stats() to a JSON file"""
+    with open(path, "w") as output:
+        json.dump(stats(), output, indent=2)
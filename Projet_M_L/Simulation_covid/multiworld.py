@@ -0,0 +1,205 @@
+""" A world made of many communities with people travelling between them.
+    The communities are split in shards, every shard runs its communities in its own
+    SimPy environment in a worker process. The shards only talk at synchronisation
+    ticks (every sync_interval steps), when the travellers are exchanged.
+"""
+import multiprocessing
+import os
+
+import numpy as np
+import simpy
+
+import batch
+
+
+class _Shard:
+    """A group of communities simulated in one SimPy environment"""
+
+    def __init__(self, community_ids, configs, seeds, first_ids, travel_matrix, travel_seed):
+        self.env = simpy.Environment()
+        self.community_ids = community_ids
+        self.communities = {}
+        for community_id in community_ids:
+            config = dict(configs[community_id])
+            config["vectorized"] = True  # travelling needs the array based community
+            config["first_id"] = first_ids[community_id]  # ids unique in the whole world
+            self.communities[community_id] = batch.make_community(
+                self.env, seed=seeds[community_id], **config)
+            self.communities[community_id].activate()
+        self.travel_matrix = travel_matrix
+        self.rng = np.random.default_rng(travel_seed)
+
+    def advance(self, until, arrivals):
+        """Welcomes the arrivals, runs until the next synchronisation tick and picks the
+        people leaving.
+
+        Returns (departures, stats): departures maps a destination community to a list of
+        people dicts, stats maps a community to its (population, infected) counts
+        """
+        for community_id, people in arrivals.items():
+            self.communities[community_id].add_people(people)
+        self.env.run(until=until)
+
+        departures = {}
+        stats = {}
+        for community_id, community in self.communities.items():
+            probabilities = self.travel_matrix[community_id]
+            # last choice is staying home
+            stay = max(0.0, 1.0 - probabilities.sum())
+            choices = self.rng.choice(len(probabilities) + 1, size=community.count,
+                                      p=np.append(probabilities, stay)/(probabilities.sum()+stay))
+            travelling = np.flatnonzero(choices < len(probabilities))
+            if len(travelling):
+                travellers = community.remove_people(travelling)
+                destinations = choices[travelling]
+                for destination in np.unique(destinations):
+                    going = destinations == destination
+                    departures.setdefault(int(destination), []).append(
+                        {name: values[going] for name, values in travellers.items()})
+            stats[community_id] = (community.count, community.total_infected)
+        return departures, stats
+
+
+def _shard_worker(connection, shard_args):
+    """Worker process loop, answers every ("advance", until, arrivals) message"""
+    shard = _Shard(*shard_args)
+    while True:
+        message = connection.recv()
+        if message[0] == "close":
+            break
+        _, until, arrivals = message
+        connection.send(shard.advance(until, arrivals))
+    connection.close()
+
+
+def _merge(people_list):
+    """Concatenates a list of people dicts into one"""
+    return {name: np.concatenate([people[name] for people in people_list])
+            for name in people_list[0]}
+
+
+class World:
+    """ Many communities and a travel matrix between them.
+        travel_matrix[i][j] is the probability that a person of community i travels to
+        community j during one synchronisation interval (the diagonal is ignored).
+        Every community is given by a dict of batch.make_community arguments.
+
+        Use it as a context manager, or call start() and close():
+            with World(configs, travel_matrix, seed=0) as world:
+                history = world.run(1000)
+    """
+
+    def __init__(self, community_configs, travel_matrix, sync_interval=10, processes=None,
+                 seed=None):
+        self.community_configs = list(community_configs)
+        num_communities = len(self.community_configs)
+        self.travel_matrix = np.array(travel_matrix, dtype=float)
+        if self.travel_matrix.shape != (num_communities, num_communities):
+            raise ValueError("travel_matrix must be {0}x{0}".format(num_communities))
+        np.fill_diagonal(self.travel_matrix, 0)
+        if np.any(self.travel_matrix < 0) or np.any(self.travel_matrix.sum(axis=1) > 1):
+            raise ValueError("travel_matrix rows must be probabilities summing to at most 1")
+        self.sync_interval = sync_interval
+        if processes is None:
+            processes = os.cpu_count() or 1
+        # 0 processes runs every community in this process (useful for debugging)
+        self.processes = min(processes, num_communities)
+        # one RNG stream per community and one per shard (for the travel draws)
+        seed_sequences = np.random.SeedSequence(seed).spawn(num_communities
+                                                            + max(1, self.processes))
+        self._seeds = [int(sequence.generate_state(1, np.uint64)[0])
+                       for sequence in seed_sequences]
+        # every community numbers its people from its own offset, so a person id is unique
+        # in the world and travellers never collide with the people of their destination
+        sizes = [config.get("num_people", batch.NUM_PEOPLE) for config in self.community_configs]
+        self._first_ids = np.concatenate(([0], np.cumsum(sizes)[:-1])).astype(int).tolist()
+        self.now = 0
+        self._shards = []  # (connection, process) or _Shard
+        self._owner = {}  # community id -> shard index
+        self._arrivals = []  # arrivals per shard, delivered at the next synchronisation
+
+    def start(self):
+        """Builds the communities in their shards (starts the worker processes)"""
+        num_communities = len(self.community_configs)
+        num_shards = max(1, self.processes)
+        groups = [list(range(shard, num_communities, num_shards)) for shard in range(num_shards)]
+        for shard, community_ids in enumerate(groups):
+            shard_args = (community_ids, self.community_configs, self._seeds[:num_communities],
+                          self._first_ids, self.travel_matrix, self._seeds[num_communities + shard])
+            if self.processes:
+                parent, child = multiprocessing.Pipe()
+                process = multiprocessing.Process(target=_shard_worker, args=(child, shard_args),
+                                                  daemon=True)
+                process.start()
+                self._shards.append((parent, process))
+            else:
+                self._shards.append(_Shard(*shard_args))
+            for community_id in community_ids:
+                self._owner[community_id] = shard
+            self._arrivals.append({})
+        return self
+
+    def close(self):
+        """Stops the worker processes"""
+        for shard in self._shards:
+            if isinstance(shard, tuple):
+                connection, process = shard
+                connection.send(("close",))
+                process.join()
+        self._shards = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *_):
+        self.close()
+
+    def _advance(self, until):
+        """Runs every shard to until, exchanging travellers. Returns the stats per community"""
+        for shard, arrivals in zip(self._shards, self._arrivals):
+            if isinstance(shard, tuple):
+                shard[0].send(("advance", until, arrivals))
+        results = []
+        for shard, arrivals in zip(self._shards, self._arrivals):
+            if isinstance(shard, tuple):
+                results.append(shard[0].recv())
+            else:
+                results.append(shard.advance(until, arrivals))
+
+        self._arrivals = [{} for _ in self._shards]
+        stats = {}
+        for departures, shard_stats in results:
+            stats.update(shard_stats)
+            for destination, people_list in departures.items():
+                self._arrivals[self._owner[destination]].setdefault(destination, []).extend(
+                    people_list)
+        for arrivals in self._arrivals:
+            for destination, people_list in arrivals.items():
+                arrivals[destination] = _merge(people_list)
+        # people on their way are counted in the community they are going to
+        for arrivals in self._arrivals:
+            for destination, people in arrivals.items():
+                population, infected = stats[destination]
+                stats[destination] = (population + len(people["infected"]),
+                                      infected + int(people["infected"].sum()))
+        self.now = until
+        return stats
+
+    def run(self, steps):
+        """Simulates the world for the given number of steps.
+
+        Returns a dict with "time" (one value per synchronisation tick) and the
+        "population" and "infected" counts of every community at those ticks
+        """
+        if not self._shards:
+            raise RuntimeError("World is not started")
+        end = self.now + steps
+        times, population, infected = [], [], []
+        while self.now < end:
+            stats = self._advance(min(self.now + self.sync_interval, end))
+            times.append(self.now)
+            population.append([stats[index][0] for index in range(len(self.community_configs))])
+            infected.append([stats[index][1] for index in range(len(self.community_configs))])
+        return {"time": np.array(times),
+                "population": np.array(population),
+                "infected": np.array(infected)}
@@ -0,0 +1,141 @@
+""" Recording of simulation runs to disk, and reading them back for replays.
+    A recording is a small header followed by fixed size frames, appended one per step.
+    Frames are read through a NumPy memory map, so any frame can be reached without
+    reading the ones before it and without copying the file into memory.
+"""
+import struct
+
+import numpy as np
+
+MAGIC = b"ANDROMED"
+VERSION = 1
+# magic, version, number of people, number of popular places, boundaries
+_HEADER = struct.Struct("<8sIQI4d")
+
+
+def frame_dtype(num_people):
+    """dtype of one recorded frame"""
+    return np.dtype([("time", "<f8"),
+                     ("infected_percent", "<f8"),
+                     ("r_value", "<f8"),
+                     ("positions", "<f4", (num_people, 2)),
+                     ("infected", "u1", (num_people,))])
+
+
+class TrajectoryRecorder:
+    """
+    Appends one frame per call to record() to a recording file
+
+    Usage:
+        with TrajectoryRecorder("run.traj", community) as recorder:
+            for _ in range(steps):
+                env.run(until=env.now+1)
+                recorder.record()
+    """
+    def __init__(self, path, community):
+        self.community = community
+        self.count = community.count
+        self.dtype = frame_dtype(self.count)
+        self._frame = np.zeros(1, dtype=self.dtype)
+        self._data = None
+        self.frames_written = 0
+        popular_places = np.array(community.popular_places, dtype="<f8").reshape(-1, 2)
+        (start_x, end_x), (start_y, end_y) = community.position
+        self.file = open(path, "wb")
+        self.file.write(_HEADER.pack(MAGIC, VERSION, self.count, len(popular_places),
+                                     start_x, end_x, start_y, end_y))
+        self.file.write(popular_places.tobytes())
+
+    def record(self):
+        """Appends the current state of the community as a new frame"""
+        if self.community.count != self.count:
+            raise ValueError("Population changed from {} to {} people".format(
+                self.count, self.community.count))
+        self._data, r_value, infected_percent = self.community.get_all_positions_colors(
+            0, 1, nparray_to_fill=self._data)
+        frame = self._frame[0]
+        frame["time"] = self.community.env.now
+        frame["infected_percent"] = infected_percent
+        frame["r_value"] = r_value
+        frame["positions"] = self._data[:, 0:2]
+        frame["infected"] = self._data[:, 2]
+        self.file.write(self._frame.tobytes())
+        self.frames_written += 1
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+class TrajectoryReader:
+    """
+    Memory mapped view of a recording. frames[i] is frame i (fields time, infected_percent,
+    r_value, positions and infected). It also looks like a community to
+    render.render_community: seek() to a frame then call get_all_positions_colors.
+    """
+    def __init__(self, path):
+        with open(path, "rb") as recording:
+            header = recording.read(_HEADER.size)
+            magic, version, count, num_places, start_x, end_x, start_y, end_y = \
+                _HEADER.unpack(header)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError("{} is not a recording".format(path))
+            places = np.frombuffer(recording.read(16 * num_places), dtype="<f8")
+        self.path = path
+        self.count = count
+        self.position = ((start_x, end_x), (start_y, end_y))
+        self.popular_places = [tuple(place) for place in places.reshape(-1, 2).tolist()]
+        self.dtype = frame_dtype(count)
+        self._offset = _HEADER.size + 16 * num_places
+        self.frames = None
+        self.current = 0  # frame returned by get_all_positions_colors
+        self.refresh()
+
+    def refresh(self):
+        """Maps the frames again, to see the ones appended since (the file only grows)"""
+        with open(self.path, "rb") as recording:
+            recording.seek(0, 2)
+            num_frames = (recording.tell() - self._offset) // self.dtype.itemsize
+        # np.memmap can not map 0 frames
+        if num_frames:
+            self.frames = np.memmap(self.path, dtype=self.dtype, mode="r",
+                                    offset=self._offset, shape=(num_frames,))
+        else:
+            self.frames = np.zeros(0, dtype=self.dtype)
+        return num_frames
+
+    def __len__(self):
+        return len(self.frames)
+
+    def seek(self, frame):
+        """Selects the frame returned by get_all_positions_colors"""
+        if not 0 <= frame < len(self.frames):
+            raise IndexError("Frame {} out of {} frames".format(frame, len(self.frames)))
+        self.current = frame
+
+    def get_all_positions_colors(self, normal_color, infected_color, nparray_to_fill=None):
+        """Same as Community.get_all_positions_colors, for the current frame"""
+        if nparray_to_fill is None:
+            data = np.empty((self.count, 3))  # initialise data array
+        else:
+            data = nparray_to_fill  # use data array if given
+        frame = self.frames[self.current]
+        data[:, 0:2] = frame["positions"]
+        data[:, 2] = np.where(frame["infected"], infected_color, normal_color)
+        return data, float(frame["r_value"]), float(frame["infected_percent"])
+
+
+def record_run(path, community, env, steps):
+    """Simulates steps env steps headless, recording every one of them.
+    The community must already be activated. Returns the number of frames written.
+    """
+    with TrajectoryRecorder(path, community) as recorder:
+        for _ in range(steps):
+            env.run(until=env.now+1)
+            recorder.record()
+    return recorder.frames_written
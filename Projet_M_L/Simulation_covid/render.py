@@ -9,13 +9,19 @@ import matplotlib.animation as animation
 from matplotlib.widgets import Slider, CheckButtons
 import numpy as np
 
+import batch
+import density
+import instrument
 import world
 
+
 def render_community(steps, env,
                      community: world.Community,
                      before_callback=None, before_args=None, before_kwargs=None,
                      after_callback=None, after_args=None, after_kwargs=None,
-                     interval=100):
+                     interval=100, replay=None, worker=None,
+                     density_threshold=density.DENSITY_THRESHOLD,
+                     density_bins=density.DENSITY_BINS):
     """Renders a single community
 
         Parameters:
@@ -27,7 +33,24 @@ def render_community(steps, env,
             - after_callback: a function to call after rendering each frame. Arguments to this
                 function can be given using after_args and after_kwargs
             - interval: time between each frame in ms
+            - replay: a recording.TrajectoryReader to play back instead of simulating. The
+                community and env are not used, the sliders are replaced by a frame slider
+            - worker: a started worker.SimulationWorker simulating the community on its own
+                thread. Frames show its latest step and sliders are forwarded to it, the
+                before_callback should not step the simulation then
+            - density_threshold: above this number of people, the community is drawn as an
+                image of density_bins x density_bins bins (see density.DensityGrid) instead
+                of one marker per person
     """
+    # sliders change the people through the worker thread when there is one
+    people = worker if worker is not None else community
+    if replay is not None:
+        if not len(replay):
+            raise ValueError("{} has no frames to replay".format(replay.path))
+        community = replay
+        if steps <= 0 or steps > len(replay):
+            steps = len(replay)
+
     # initialize optional args here to avoid python quirks
     if not before_args:
         before_args = []
@@ -73,7 +96,7 @@ def render_community(steps, env,
     ax_left_1 = plt.axes([0.025, 0.5, 0.15, 0.10], facecolor=axcolor)
 
 
-    # For displaying R value
+    # For displaying R value (cohort effective reproduction number, see InfectionLog)
     ax_left_2 = plt.axes([0.01, 0.8, 0.2, 0.05])
     ax_left_2.get_xaxis().set_visible(False)
     ax_left_2.get_yaxis().set_visible(False)
@@ -81,7 +104,7 @@ def render_community(steps, env,
     r_value_x = (ax_left_2_bbox[0][0] + ax_left_2_bbox[0][1]) / 2.0
     r_value_y = (ax_left_2_bbox[1][0] + ax_left_2_bbox[1][1]) / 2.0
     r_text = ax_left_2.text(r_value_x, r_value_y,
-                            "R value:",
+                            "Rt:",
                             horizontalalignment='center',
                             verticalalignment='center')
 
@@ -97,49 +120,75 @@ def render_community(steps, env,
                                            horizontalalignment='center',
                                            verticalalignment='center')
 
-    max_walk_range = round(math.sqrt((community.position[0][1]-community.position[0][0])**2
-                                     + (community.position[1][1]-community.position[1][0])**2))
-    initial_walk_range = max_walk_range / 2
-    community.set_people_attribute("walk_range", initial_walk_range)
-    # slider to control walk_range
-    walk_range_slider = Slider(ax_slider_1, "Walk Range", 1, max_walk_range,
-                               valinit=initial_walk_range,
-                               valstep=1)
-    # slider to control stop_duration
-    stop_duration_slider = Slider(ax_slider_2, "Stop Duration", 1, 1000, valinit=25, valstep=1)
-    # slider to control probability of going to a popular place
-    pop_place_slider = Slider(ax_slider_3, "Prob of going to popular place", 0, 1, valinit=0.3)
-    # slider to control infect range
-    infect_range_slider = Slider(ax_slider_4, "Infect range", 0, max_walk_range/2, valinit=2, valstep=0.5)
-    # slider to control infect probability
-    infect_prob_slider = Slider(ax_slider_5, "Infect prob", 0, 0.5, valinit=0.01, valstep=0.001)
-
-    # common function to upload all sliders
-    def update_sliders(_):
-        community.set_people_attribute("walk_range", walk_range_slider.val)
-        community.set_people_attribute("stop_duration", stop_duration_slider.val)
-        community.set_people_attribute("popular_place_probability", pop_place_slider.val)
-    def update_infect_sliders(_):
-        community.set_people_attribute("infect_range", infect_range_slider.val)
-        community.set_people_attribute("infect_probability", infect_prob_slider.val)
-    # attach sliders to update function
-    walk_range_slider.on_changed(update_sliders)
-    stop_duration_slider.on_changed(update_sliders)
-    pop_place_slider.on_changed(update_sliders)
-    infect_range_slider.on_changed(update_infect_sliders)
-    infect_prob_slider.on_changed(update_infect_sliders)
-
-    num_people = len(community.population)
+    if replay is None:
+        ranges = batch.parameter_ranges(community.position)
+        max_walk_range = ranges["walk_range"][1]
+        initial_walk_range = max_walk_range / 2
+        people.set_people_attribute("walk_range", initial_walk_range)
+        # slider to control walk_range
+        walk_range_slider = Slider(ax_slider_1, "Walk Range", *ranges["walk_range"],
+                                   valinit=initial_walk_range,
+                                   valstep=1)
+        # slider to control stop_duration
+        stop_duration_slider = Slider(ax_slider_2, "Stop Duration", *ranges["stop_duration"],
+                                      valinit=25, valstep=1)
+        # slider to control probability of going to a popular place
+        pop_place_slider = Slider(ax_slider_3, "Prob of going to popular place",
+                                  *ranges["popular_place_probability"], valinit=0.3)
+        # slider to control infect range
+        infect_range_slider = Slider(ax_slider_4, "Infect range", *ranges["infect_range"],
+                                     valinit=2, valstep=0.5)
+        # slider to control infect probability
+        infect_prob_slider = Slider(ax_slider_5, "Infect prob", *ranges["infect_probability"],
+                                    valinit=0.01, valstep=0.001)
+
+        # common function to upload all sliders
+        def update_sliders(_):
+            people.set_people_attribute("walk_range", walk_range_slider.val)
+            people.set_people_attribute("stop_duration", stop_duration_slider.val)
+            people.set_people_attribute("popular_place_probability", pop_place_slider.val)
+        def update_infect_sliders(_):
+            people.set_people_attribute("infect_range", infect_range_slider.val)
+            people.set_people_attribute("infect_probability", infect_prob_slider.val)
+        # attach sliders to update function
+        walk_range_slider.on_changed(update_sliders)
+        stop_duration_slider.on_changed(update_sliders)
+        pop_place_slider.on_changed(update_sliders)
+        infect_range_slider.on_changed(update_infect_sliders)
+        infect_prob_slider.on_changed(update_infect_sliders)
+    else:
+        # slider to seek in the recording
+        frame_slider = Slider(ax_slider_1, "Frame", 0, len(replay) - 1, valinit=0, valstep=1)
+        frame_slider.on_changed(lambda value: replay.seek(int(value)))
+        for unused_ax in (ax_slider_2, ax_slider_3, ax_slider_4, ax_slider_5):
+            unused_ax.set_visible(False)
+
+    num_people = community.count
 
     # initialize the scatter plot
     normal_color = 0.5 # color of non-infected people (green)
     infected_color = 0.9 # color of infected people (red)
-    data, _, _ = community.get_all_positions_colors(normal_color, infected_color)
-    x = data[:, 0]
-    y = data[:, 1]
-    c = data[:, 2] # intialize color
-    scat = ax[0].scatter(x, y, c=c, vmin=0, vmax=1,
-                         cmap="jet", edgecolor="k")
+    if worker is not None:
+        data = worker.latest().data
+    else:
+        data, _, _ = community.get_all_positions_colors(normal_color, infected_color)
+    grid = None
+    if num_people > density_threshold:
+        # too many markers to draw every frame, draw the people per bin
+        grid = density.DensityGrid(community.position, density_bins)
+        cmap = plt.get_cmap("jet")
+        normal_rgb, infected_rgb = cmap(normal_color), cmap(infected_color)
+        grid.update(data[:, 0:2], data[:, 2] == infected_color)
+        scat = ax[0].imshow(grid.image(normal_rgb, infected_rgb), origin="lower",
+                            extent=grid.extent, interpolation="nearest")
+        ax[0].set_xlim(community.position[0][0]-2, community.position[0][1]+2)
+        ax[0].set_ylim(community.position[1][0]-2, community.position[1][1]+2)
+    else:
+        x = data[:, 0]
+        y = data[:, 1]
+        c = data[:, 2] # intialize color
+        scat = ax[0].scatter(x, y, c=c, vmin=0, vmax=1,
+                             cmap="jet", edgecolor="k")
     # plot popular places
     pop_places_x = [pos[0] for pos in community.popular_places]
     pop_places_y = [pos[1] for pos in community.popular_places]
@@ -154,9 +203,10 @@ def render_community(steps, env,
 
     frame_count = 0
     total_frametime = 0
+    draw_clock = False  # end of the artists phase of the frame being drawn
     def update(frame):
         """Update the scatter plot."""
-        nonlocal total_frametime, frame_count, data
+        nonlocal total_frametime, frame_count, data, draw_clock
 
         # store time at beginning of frame calc
         begin_time = time.perf_counter()
@@ -165,21 +215,38 @@ def render_community(steps, env,
         if before_callback:
             before_callback(*before_args, **before_kwargs)
 
-        data, r_value, infected_percent = community.get_all_positions_colors(normal_color,
-                                                                             infected_color,
-                                                                             nparray_to_fill=data)
+        if replay is not None and frame and replay.current + 1 < len(replay):
+            # play the recording, one recorded step per frame
+            replay.seek(replay.current + 1)
+            if frame % 10 == 0:
+                frame_slider.set_val(replay.current)
 
-        # Set x and y data (input in the form of a 2D np array)
-        scat.set_offsets(data[:, 0:2])
+        if worker is not None:
+            # whatever step the worker finished last, it keeps simulating meanwhile
+            latest = worker.latest()
+            data, r_value, infected_percent = latest.data, latest.r_value, latest.infected_percent
+        else:
+            data, r_value, infected_percent = community.get_all_positions_colors(
+                normal_color, infected_color, nparray_to_fill=data)
+
+        clock = instrument.enabled and time.perf_counter()
+        if grid is not None:
+            # only the people who changed bin or got infected are counted again
+            grid.update(data[:, 0:2], data[:, 2] == infected_color)
+            scat.set_data(grid.image(normal_rgb, infected_rgb))
+        else:
+            # Set x and y data (input in the form of a 2D np array)
+            scat.set_offsets(data[:, 0:2])
 
-        # Set sizes of dots (we might not need this)
-        # self.scat.set_sizes(300 * abs(data[:, 2])**1.5 + 100)
+            # Set sizes of dots (we might not need this)
+            # self.scat.set_sizes(300 * abs(data[:, 2])**1.5 + 100)
 
-        # Set colors of dots
-        scat.set_array(data[:, 2])
+            # Set colors of dots
+            scat.set_array(data[:, 2])
 
-        # update R value text
-        r_text.set_text("R Value: {:3.2f}".format(r_value))
+        # update R value text, NaN until the two windows of Rt have passed
+        r_text.set_text("Rt: {}".format(
+            "-" if math.isnan(r_value) else "{:3.2f}".format(r_value)))
         # updated infected percent text
         infected_percent_text.set_text("Percent infected: {:3.2f}%".format(infected_percent))
 
@@ -197,6 +264,9 @@ def render_community(steps, env,
                 ax[1].set_xlim(xlim_min, xlim_max + 500)
             # update infected percent plot
             infected_percent_plot.set_data(timesteps, infected_percentages)
+        if clock:
+            # the animation draws the returned artists next, see frame_drawn
+            draw_clock = instrument.lap("artists", clock)
 
         # time after major calcs
         total_time = time.perf_counter() - begin_time
@@ -224,6 +294,15 @@ def render_community(steps, env,
                                    repeat=infinite,
                                    frames=steps)
 
+    def frame_drawn():
+        """Records the drawing phase: the timer runs its callbacks in the order they were
+        added, so this one runs after the animation drew (and blitted) the frame"""
+        nonlocal draw_clock
+        if draw_clock:
+            instrument.lap("drawing", draw_clock)
+            draw_clock = False
+    anim.event_source.add_callback(frame_drawn)
+
     anim_running = True # to keep track of the animation state
 
     def onClick(_):
@@ -232,9 +311,13 @@ def render_community(steps, env,
         if anim_running:
             anim.event_source.stop()
             anim_running = False
+            if worker is not None:
+                worker.pause()
         else:
             anim.event_source.start()
             anim_running = True
+            if worker is not None:
+                worker.resume()
         ax[0].draw_artist(scat)
         ax[1].draw_artist(infected_percent_plot)
 
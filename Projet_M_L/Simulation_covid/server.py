@@ -0,0 +1,336 @@
+""" Streams a running simulation to many viewers over TCP, with asyncio.
+
+        python server.py serve [num_people] [port]
+        python server.py watch [host] [port]       # test client, prints what it receives
+
+    The community is simulated by a worker.SimulationWorker on its own thread, at its own
+    rate. The server picks up the latest step fps times a second, encodes it once and hands
+    it to every viewer, so the number of viewers does not slow down the simulation.
+
+    Messages are length prefixed (4 bytes, little endian), the first byte telling the kind:
+        I: JSON information sent on connection (number of people, boundaries, places)
+        K: key frame, the full state of the community
+        D: delta frame, the change since the frame broadcast just before
+        E: JSON error, e.g. an unknown parameter
+    K and D start with HEADER (frame number, time, infected percent, R value, number of
+    people) followed by zlib compressed positions (uint16 over the boundaries) and packed
+    infected flags. A delta frame has the differences of the positions (modulo 2**16) and
+    the xor of the flags, mostly zeros that compress well.
+
+    A viewer that reads slower than the frames come only gets the latest one when it is
+    ready again, the frames in between are dropped (and the next one is a key frame). The
+    viewers send parameter changes as JSON objects ({"infect_range": 3}), applied like the
+    sliders of render and only within their ranges (batch.parameter_ranges).
+"""
+import asyncio
+import json
+import struct
+import sys
+import time
+import zlib
+
+import numpy as np
+import simpy
+
+import batch
+import worker
+
+PORT = 8765
+FPS = 30
+SCALE = 2**16 - 1  # positions are sent as uint16 over the boundaries
+HEADER = struct.Struct("<Qdddi")  # frame number, time, infected percent, R value, people
+_LENGTH = struct.Struct("<I")
+MAX_MESSAGE = 2**16  # largest message accepted from a viewer
+
+
+def _message(kind, body):
+    return _LENGTH.pack(len(body) + 1) + kind + body
+
+
+class EncodedFrame:
+    """A broadcast step, as a key frame and as a delta from the step broadcast before it
+    (None when there is none)"""
+
+    def __init__(self, number, key, delta):
+        self.number = number
+        self.key = key
+        self.delta = delta
+
+
+class Encoder:
+    """Turns worker frames into messages, quantizing the positions over the boundaries"""
+
+    def __init__(self, position):
+        (start_x, end_x), (start_y, end_y) = position
+        self.start = np.array([start_x, start_y], dtype=float)
+        self.size = np.array([end_x - start_x, end_y - start_y], dtype=float)
+        self.number = 0
+        self._positions = None  # quantized positions of the last frame
+        self._infected = None  # packed flags of the last frame
+
+    def encode(self, data, time_, infected_percent, r_value,
+               infected_color=worker.INFECTED_COLOR):
+        """EncodedFrame of the (people, 3) data of get_all_positions_colors"""
+        self.number += 1
+        scaled = (data[:, 0:2] - self.start) * (SCALE / self.size)
+        positions = np.clip(np.rint(scaled), 0, SCALE).astype("<u2")
+        infected = np.packbits(data[:, 2] == infected_color)
+        header = HEADER.pack(self.number, time_, infected_percent, r_value, len(data))
+        key = _message(b"K", header + zlib.compress(positions.tobytes()
+                                                    + infected.tobytes(), 1))
+        delta = None
+        if self._positions is not None and len(self._positions) == len(positions):
+            # uint16 arithmetic wraps around, the viewer adds the difference back exactly
+            body = (positions - self._positions).tobytes() \
+                + np.bitwise_xor(infected, self._infected).tobytes()
+            delta = _message(b"D", header + zlib.compress(body, 1))
+        self._positions, self._infected = positions, infected
+        return EncodedFrame(self.number, key, delta)
+
+
+class Decoder:
+    """Rebuilds the state of the community from the messages, for viewers"""
+
+    def __init__(self):
+        self.info = None
+        self.number = None
+        self.positions = None  # quantized
+        self.infected = None  # packed
+
+    def decode(self, message):
+        """message without its length prefix. Returns (kind, content): the information or
+        error dict, or for frames a dict with frame, time, infected_percent, r_value,
+        positions ((people, 2) floats) and infected (bools)"""
+        kind, body = message[:1], message[1:]
+        if kind in (b"I", b"E"):
+            content = json.loads(body.decode())
+            if kind == b"I":
+                self.info = content
+            return kind, content
+        number, time_, infected_percent, r_value, count = HEADER.unpack_from(body)
+        payload = zlib.decompress(body[HEADER.size:])
+        positions = np.frombuffer(payload, dtype="<u2", count=2 * count).reshape(count, 2)
+        infected = np.frombuffer(payload, dtype=np.uint8, offset=4 * count)
+        if kind == b"D":
+            if self.number != number - 1:
+                raise ValueError("Delta frame {} after frame {}".format(number, self.number))
+            positions = self.positions + positions
+            infected = np.bitwise_xor(self.infected, infected)
+        self.number, self.positions, self.infected = number, positions, infected
+        (start_x, end_x), (start_y, end_y) = self.info["position"]
+        scale = np.array([end_x - start_x, end_y - start_y]) / SCALE
+        return kind, {"frame": number, "time": time_, "infected_percent": infected_percent,
+                      "r_value": r_value,
+                      "positions": positions * scale + (start_x, start_y),
+                      "infected": np.unpackbits(infected, count=count).astype(bool)}
+
+
+class _Viewer:
+    """A connected viewer: the latest frame it has not been sent yet, if any"""
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.pending = None
+        self.ready = asyncio.Event()
+        self.last = None  # number of the last frame sent
+        self.sent = 0
+        self.dropped = 0
+
+    def offer(self, frame):
+        if self.pending is not None:
+            self.dropped += 1
+        self.pending = frame
+        self.ready.set()
+
+    def next_message(self):
+        frame, self.pending = self.pending, None
+        self.ready.clear()
+        if frame.delta is not None and self.last == frame.number - 1:
+            message = frame.delta
+        else:
+            message = frame.key
+        self.last = frame.number
+        self.sent += 1
+        return message
+
+
+class FrameServer:
+    """
+    Broadcasts the latest step of a started SimulationWorker to the TCP viewers
+
+        server = FrameServer(simulation_worker, community)
+        await server.start()   # server.port is the port listened on
+        ...
+        await server.close()
+    """
+    def __init__(self, simulation_worker, community, host="127.0.0.1", port=PORT, fps=FPS):
+        self.worker = simulation_worker
+        self.host = host
+        self.port = port
+        self.fps = fps
+        self.encoder = Encoder(community.position)
+        self.ranges = batch.parameter_ranges(community.position)
+        self.info = {"count": community.count,
+                     "position": [list(bounds) for bounds in community.position],
+                     "popular_places": [list(place) for place in community.popular_places],
+                     "parameters": list(batch.PARAMETERS), "fps": fps,
+                     "ranges": self.ranges}
+        self.viewers = set()
+        self.frame = None  # latest EncodedFrame
+        self._server = None
+        self._broadcast = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._broadcast = asyncio.ensure_future(self._broadcast_loop())
+
+    async def _broadcast_loop(self):
+        last_time = None
+        while True:
+            begin = time.perf_counter()
+            latest = self.worker.latest()
+            if latest.time != last_time:
+                # encoded once for every viewer
+                last_time = latest.time
+                self.frame = self.encoder.encode(latest.data, latest.time,
+                                                 latest.infected_percent, latest.r_value)
+                for viewer in self.viewers:
+                    viewer.offer(self.frame)
+            await asyncio.sleep(max(0.0, 1.0/self.fps - (time.perf_counter() - begin)))
+
+    async def _send(self, viewer):
+        writer = viewer.writer
+        writer.write(_message(b"I", json.dumps(self.info).encode()))
+        if self.frame is not None:
+            viewer.offer(self.frame)
+        while True:
+            await viewer.ready.wait()
+            writer.write(viewer.next_message())
+            # waits while the viewer's buffer is full, newer frames replace the pending one
+            await writer.drain()
+
+    def apply(self, updates):
+        """Forwards {parameter: value} to the worker like render's sliders. Returns the
+        errors as a dict: "unknown" lists the names that are not parameters, "invalid" maps
+        the parameters given a value outside of their range to it, neither is applied"""
+        errors = {}
+        for name, value in updates.items():
+            if name not in self.ranges:
+                errors.setdefault("unknown", []).append(name)
+                continue
+            low, high = self.ranges[name]
+            try:
+                number = float(value)
+            except (TypeError, ValueError):
+                number = None
+            # NaN fails both comparisons
+            if number is None or not low <= number <= high:
+                errors.setdefault("invalid", {})[name] = value
+                continue
+            self.worker.set_people_attribute(name, number)
+        return errors
+
+    async def _handle(self, reader, writer):
+        viewer = _Viewer(writer)
+        self.viewers.add(viewer)
+        sender = asyncio.ensure_future(self._send(viewer))
+        try:
+            while not sender.done():
+                length, = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))
+                if length > MAX_MESSAGE:
+                    break
+                try:
+                    updates = json.loads((await reader.readexactly(length)).decode())
+                    errors = self.apply(updates)
+                except (ValueError, TypeError, AttributeError):
+                    errors = {"unknown": ["invalid update"]}
+                if errors:
+                    writer.write(_message(b"E", json.dumps(errors).encode()))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.viewers.discard(viewer)
+            sender.cancel()
+            writer.close()
+
+    async def close(self):
+        self._broadcast.cancel()
+        self._server.close()
+        for viewer in list(self.viewers):
+            viewer.writer.close()
+        await self._server.wait_closed()
+
+
+async def _read_message(reader):
+    length, = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))
+    return await reader.readexactly(length)
+
+
+async def watch(host="127.0.0.1", port=PORT, frames=None, updates=None, callback=None):
+    """Test viewer: receives frames (forever when None), sending the updates dict first.
+    callback(kind, content) is called for every message decoded.
+    Returns the Decoder, with the last state received."""
+    reader, writer = await asyncio.open_connection(host, port)
+    decoder = Decoder()
+    if updates:
+        body = json.dumps(updates).encode()
+        writer.write(_LENGTH.pack(len(body)) + body)
+    received = 0
+    try:
+        while frames is None or received < frames:
+            kind, content = decoder.decode(await _read_message(reader))
+            if kind in (b"K", b"D"):
+                received += 1
+            if callback:
+                callback(kind, content)
+    finally:
+        writer.close()
+    return decoder
+
+
+async def serve(num_people=1000, port=PORT, steps_per_second=60):
+    """Simulates a community like engine.main on a worker thread and streams it until
+    cancelled"""
+    env = simpy.Environment()
+    community = batch.make_community(env, num_people=num_people)
+    community.activate()
+    simulation_worker = worker.SimulationWorker(env, community, steps_per_second)
+    simulation_worker.start()
+    server = FrameServer(simulation_worker, community, host="0.0.0.0", port=port)
+    await server.start()
+    print("Streaming {} people on port {}".format(num_people, server.port))
+    try:
+        while True:
+            await asyncio.sleep(10)
+            print("{} steps, {} viewers".format(simulation_worker.steps, len(server.viewers)))
+    finally:
+        await server.close()
+        simulation_worker.stop()
+
+
+def main(argv):
+    """python server.py serve [num_people] [port]
+    python server.py watch [host] [port]"""
+    if argv[:1] == ["serve"]:
+        num_people = int(argv[1]) if len(argv) > 1 else 1000
+        port = int(argv[2]) if len(argv) > 2 else PORT
+        asyncio.run(serve(num_people, port))
+    elif argv[:1] == ["watch"]:
+        def show(kind, content):
+            if kind in (b"K", b"D"):
+                print("{} frame {:6d}  time {:6g}  infected {:6.2f}%  R {:4.2f}".format(
+                    kind.decode(), content["frame"], content["time"],
+                    content["infected_percent"], content["r_value"]))
+            else:
+                print(content)
+        asyncio.run(watch(argv[1] if len(argv) > 1 else "127.0.0.1",
+                          int(argv[2]) if len(argv) > 2 else PORT, callback=show))
+    else:
+        print(main.__doc__)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,5 +1,7 @@
 from collections import defaultdict
 
+import numpy as np
+
 class SpatialHashTable():
     """
     Creates a spatial hash table
@@ -64,3 +66,187 @@ class PersonSpatialHash(SpatialHashTable):
 
     def get_y(self, person):
         return person.position[1]
+
+
+class GridSpatialIndex():
+    """
+    Uniform grid spatial index backed by arrays instead of lists.
+
+    Positions live in NumPy arrays and are sorted by cell (CSR layout: one order
+    array, plus key, start and count per occupied cell) by rebuild(), an O(n log n)
+    stable sort. Only occupied cells are stored, so the cost depends on the number of
+    objects and not on the area they are spread over.
+    Inserts, removals and updates mark the grid dirty, the next search rebuilds it,
+    so many updates followed by many searches (one tick) cost a single rebuild.
+    Only use it in such update-all-then-search-all phases: alternating updateObject
+    and a search, like Person.wander does, rebuilds the whole grid on every search,
+    keep SpatialHashTable for that.
+
+    Cells are floored (cell i holds [i*cell_size, (i+1)*cell_size)), while
+    SpatialHashTable truncates towards zero, so for negative coordinates the two
+    pick different cells and search_nearby returns different candidates.
+
+    Functions
+    ------------
+
+    insertObject(obj)
+        insert an object into the index
+
+    updateObject(obj, new_x, new_y)
+        record the new position of an object, O(1) but the next search rebuilds
+
+    search_nearby(obj, half_range)
+        objects in the cells covering the box of half width half_range around an object
+
+    search_pairs(points, half_range)
+        every (point, object) pair within half_range for many points at once
+    """
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.objects = []  # object stored in each slot
+        self._slots = {}  # id of object -> slot
+        self.positions = np.empty((0, 2))
+        self._origin = np.zeros(2, dtype=np.int64)  # lowest cell of the grid
+        self._shape = (0, 0)  # number of cells along x and y
+        self._order = np.empty(0, dtype=np.int64)
+        # sorted keys of the occupied cells, their starts in _order and their counts,
+        # followed by an empty cell looked up for the keys that are not occupied
+        self._keys = np.empty(0, dtype=np.int64)
+        self._starts = np.zeros(1, dtype=np.int64)
+        self._counts = np.zeros(1, dtype=np.int64)
+        self._dirty = True
+
+    @classmethod
+    def from_positions(cls, positions, cell_size):
+        """Index of a (n, 2) array of positions, the objects are the row numbers.
+        Move them by writing to index.positions and calling rebuild().
+        """
+        index = cls(cell_size)
+        index.positions = np.array(positions, dtype=float).reshape(-1, 2)
+        index.objects = list(range(len(index.positions)))
+        return index
+
+    def _hash(self, x, y):
+        return int(x//self.cell_size), int(y//self.cell_size)
+
+    def get_x(self, obj):
+        return obj.x
+
+    def get_y(self, obj):
+        return obj.y
+
+    def insertObject(self, obj):
+        self.insertObject_pos(obj, self.get_x(obj), self.get_y(obj))
+
+    def insertObject_pos(self, obj, x, y):
+        self._slots[id(obj)] = len(self.objects)
+        self.objects.append(obj)
+        if len(self.objects) > len(self.positions):
+            # grow the position array geometrically
+            grown = np.empty((max(16, 2*len(self.positions)), 2))
+            grown[:len(self.positions)] = self.positions
+            self.positions = grown
+        self.positions[len(self.objects)-1] = x, y
+        self._dirty = True
+
+    def removeObject(self, obj):
+        # move the last object in the freed slot
+        slot = self._slots.pop(id(obj))
+        last = self.objects.pop()
+        if last is not obj:
+            self.objects[slot] = last
+            self._slots[id(last)] = slot
+            self.positions[slot] = self.positions[len(self.objects)]
+        self._dirty = True
+
+    def updateObject(self, obj, new_x, new_y):
+        self.positions[self._slots[id(obj)]] = new_x, new_y
+        self._dirty = True
+
+    def rebuild(self):
+        """Stable sort of all the objects by cell, done by the searches when needed"""
+        cells = (self.positions[:len(self.objects)] // self.cell_size).astype(np.int64)
+        if len(cells):
+            self._origin = cells.min(axis=0)
+            cells -= self._origin
+            self._shape = tuple(int(size) for size in cells.max(axis=0) + 1)
+        else:
+            self._shape = (0, 0)
+        keys = cells[:, 0] * self._shape[1] + cells[:, 1]
+        self._order = np.argsort(keys, kind="stable")
+        self._keys, starts, counts = np.unique(keys[self._order], return_index=True,
+                                               return_counts=True)
+        self._starts = np.append(starts, len(keys))
+        self._counts = np.append(counts, 0)
+        self._dirty = False
+
+    def _cell_slots(self, cell_x, cell_y):
+        """Cells (indices in _starts and _counts) and object counts of the given cells
+        (arrays of cell coordinates)"""
+        cell_x = np.asarray(cell_x) - self._origin[0]
+        cell_y = np.asarray(cell_y) - self._origin[1]
+        valid = (cell_x >= 0) & (cell_x < self._shape[0]) & (cell_y >= 0) & (cell_y < self._shape[1])
+        keys = cell_x * self._shape[1] + cell_y
+        cells = np.searchsorted(self._keys, keys)
+        occupied = valid & (cells < len(self._keys))
+        occupied[occupied] = self._keys[cells[occupied]] == keys[occupied]
+        # cells not occupied point at the (always empty) last one
+        cells = np.where(occupied, cells, len(self._keys))
+        return cells, self._counts[cells]
+
+    def search_in_box(self, x_min, x_max, y_min, y_max):
+        if self._dirty:
+            self.rebuild()
+        (min_x, min_y), (max_x, max_y) = self._hash(x_min, y_min), self._hash(x_max, y_max)
+        cell_x, cell_y = np.meshgrid(np.arange(min_x, max_x+1), np.arange(min_y, max_y+1))
+        keys, counts = self._cell_slots(cell_x.ravel(), cell_y.ravel())
+        slots = np.concatenate([self._order[self._starts[key]:self._starts[key]+count]
+                                for key, count in zip(keys, counts) if count] or [[]])
+        return [self.objects[slot] for slot in slots.astype(np.int64)]
+
+    def search_nearby(self, obj, half_range):
+        x = self.get_x(obj)
+        y = self.get_y(obj)
+        return self.search_in_box(x - half_range, x + half_range,
+                                  y - half_range, y + half_range)
+
+    def search_pairs(self, points, half_range):
+        """Returns (point index, slot) arrays of every object whose position is in the box
+        of half width half_range around one of the points. Objects are self.objects[slot].
+        """
+        if self._dirty:
+            self.rebuild()
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        point_ids, slots = [], []
+        if len(points) and len(self.objects):
+            low = ((points - half_range) // self.cell_size).astype(np.int64)
+            high = ((points + half_range) // self.cell_size).astype(np.int64)
+            span = int((high - low).max())
+            for d_x in range(span + 1):
+                for d_y in range(span + 1):
+                    keys, counts = self._cell_slots(low[:, 0] + d_x, low[:, 1] + d_y)
+                    # cells beyond the box of a point are only there for wider boxes
+                    counts = np.where((low[:, 0] + d_x <= high[:, 0])
+                                      & (low[:, 1] + d_y <= high[:, 1]), counts, 0)
+                    total = int(counts.sum())
+                    if total == 0:
+                        continue
+                    # expand every (point, cell) into one row per object in that cell
+                    rows = np.repeat(np.arange(len(points)), counts)
+                    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+                    point_ids.append(rows)
+                    slots.append(self._order[self._starts[keys][rows] + offsets])
+        if not point_ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        point_ids = np.concatenate(point_ids)
+        slots = np.concatenate(slots)
+        inside = np.all(np.abs(points[point_ids] - self.positions[slots]) <= half_range, axis=1)
+        return point_ids[inside], slots[inside]
+
+
+def pairs_within(query_positions, target_positions, half_range):
+    """Returns (query index, target index) arrays of every target position inside the box
+    of half width half_range around a query position.
+    """
+    index = GridSpatialIndex.from_positions(target_positions, cell_size=max(half_range, 0.5))
+    return index.search_pairs(query_positions, half_range)
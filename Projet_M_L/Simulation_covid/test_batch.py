@@ -0,0 +1,21 @@
+import numpy as np
+
+import batch
+
+
+def test_run_headless_is_reproducible():
+    first = batch.run_headless(30, seed=7, num_people=200, infect_probability=0.1)
+    second = batch.run_headless(30, seed=7, num_people=200, infect_probability=0.1)
+    assert first["infected_percent"].shape == (30,)
+    assert np.array_equal(first["infected_percent"], second["infected_percent"])
+    assert np.array_equal(first["r_value"], second["r_value"], equal_nan=True)
+
+
+def test_sweep_table():
+    configs = batch.grid(infect_probability=[0.01, 0.1], num_people=[100])
+    table = batch.sweep(configs, steps=10, replicas=2, seed=0, processes=2)
+    assert len(table) == 4
+    assert list(table["config"]) == [0, 0, 1, 1]
+    assert list(table["infect_probability"]) == [0.01, 0.01, 0.1, 0.1]
+    assert len(set(table["seed"])) == 4
+    assert table["infected_percent"].shape == (4, 10)
@@ -0,0 +1,34 @@
+import json
+
+import pytest
+
+import bench
+
+
+def test_compare_reports_slowdowns_only():
+    baseline = {"ticks": {"100": 1000.0, "1000": 100.0}}
+    results = {"ticks": {"100": 700.0, "1000": 150.0, "10000": 5.0}}
+    assert bench.compare(results, baseline, tolerance=0.2) == [("ticks", "100", 700.0, 1000.0)]
+
+
+def test_run_lists_the_skipped_sizes():
+    results = bench.run(sizes=(100, 1000), names=["ticks", "ticks_vectorized"],
+                        max_object_size=100)
+    assert set(results["ticks_vectorized"]) == {"100", "1000"}
+    assert set(results["ticks"]) == {"100"}
+    assert results[bench.SKIPPED] == {"ticks": ["1000"]}
+    assert bench.compare(results, {"ticks": {"100": 0.0}}, tolerance=0.2) == []
+
+
+@pytest.mark.benchmark
+def test_no_regression_against_committed_baseline(tmp_path):
+    """Wall clock rates against bench_baseline.json, run with pytest -m benchmark on the
+    machine the baseline was recorded on"""
+    output = tmp_path / "results.json"
+    # only catches large slowdowns
+    assert bench.main(["--sizes", "100", "1000", "--only", "ticks_vectorized",
+                       "positions_colors_vectorized", "--output", str(output),
+                       "--baseline", "--tolerance", "0.8"]) == 0
+    with open(bench.BASELINE) as baseline_file:
+        baseline = json.load(baseline_file)
+    assert set(json.loads(output.read_text())) <= set(baseline)
@@ -0,0 +1,40 @@
+import numpy as np
+
+import calibrate
+
+
+def test_simulated_active():
+    infected = np.array([1, 2, 4, 8, 8, 8])
+    assert calibrate.simulated_active(infected, recovery_days=2).tolist() == [1, 2, 3, 6, 4, 0]
+
+
+def test_snap_shares_nearby_points():
+    assert calibrate.snap({"infect_range": 2.03, "infect_probability": 0.0101}) \
+        == calibrate.snap({"infect_range": 1.98, "infect_probability": 0.0099})
+
+
+def test_load_active_cases():
+    dates, active = calibrate.load_active_cases()
+    assert len(dates) == len(active) and active[0] == 1
+    assert not np.isnan(active).any()
+
+
+def test_replica_stops_early():
+    target = np.full(20, 50.0)
+    job = ({"num_people": 30}, 1, target, 2, 5, 0.0)
+    error, days = calibrate._run_replica(job)
+    assert days == 1 and error > 0
+    assert calibrate._run_replica(job[:-1] + (np.inf,))[1] == 20
+
+
+def test_calibrate_reuses_cached_points(tmp_path):
+    target = calibrate.target_curve(np.linspace(1, 10, 8), peak_percent=30)
+    cache = str(tmp_path / "cache.json")
+    kwargs = dict(points=3, replicas=2, seed=3, steps_per_day=2, recovery_days=3,
+                  processes=1, cache=cache, num_people=30)
+    best, table = calibrate.calibrate(target, rounds=2, **kwargs)
+    assert set(best) == {"infect_probability", "infect_range"}
+    assert table["error"][0] == table["error"].min()
+    # the first round samples the same points again, all in the cache
+    _, again = calibrate.calibrate(target, rounds=1, **kwargs)
+    assert len(again) == len(table)
@@ -0,0 +1,25 @@
+import numpy as np
+
+import density
+
+
+def test_incremental_update_matches_full_count():
+    rng = np.random.default_rng(0)
+    grid = density.DensityGrid(((0, 100), (0, 50)), bins=10)
+    positions = rng.uniform((0, 0), (100, 50), size=(1000, 2))
+    infected = rng.random(1000) < 0.1
+    grid.update(positions, infected)
+    for _ in range(5):
+        positions[:100] = rng.uniform((0, 0), (100, 50), size=(100, 2))
+        infected[rng.integers(1000, size=20)] = True
+        counts = grid.update(positions, infected).copy()
+        expected = density.DensityGrid(((0, 100), (0, 50)), bins=10).update(positions,
+                                                                            infected)
+        assert np.array_equal(counts, expected)
+    assert counts.sum() == 1000 and counts[1].sum() == infected.sum()
+    # x along the columns, y along the rows
+    assert grid.keys(np.array([[99.0, 1.0], [1.0, 49.0]]), [False, True]).tolist() == \
+        [9, 100 + 90]
+
+    image = grid.image((0, 1, 0, 1), (1, 0, 0, 1))
+    assert image.shape == (10, 10, 4) and image[:, :, 3].max() == 1
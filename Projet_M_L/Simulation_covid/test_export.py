@@ -0,0 +1,28 @@
+import os
+
+import pytest
+import simpy
+
+import export
+import recording
+import world
+
+
+def test_export_frames(tmp_path):
+    env = simpy.Environment()
+    community = world.VectorCommunity(((0, 40), (0, 40)), env, no_of_people=300,
+                                      popular_places=[(5, 5)], seed=1)
+    community.activate()
+    path = str(tmp_path / "run.traj")
+    recording.record_run(path, community, env, 6)
+
+    frames = str(tmp_path / "frames")
+    assert export.export(path, frames, processes=2, dpi=20) == 6
+    assert sorted(os.listdir(frames)) == [export.FRAME_NAME.format(i) for i in range(6)]
+    # density images above the threshold, a GIF assembled from the frames
+    assert export.export(path, str(tmp_path / "run.gif"), start=2, processes=1, dpi=20,
+                         density_threshold=100, bins=8) == 4
+    from PIL import Image
+    assert Image.open(tmp_path / "run.gif").n_frames == 4
+    with pytest.raises(ValueError):
+        export.export(path, str(tmp_path / "empty.gif"), start=6, processes=1)
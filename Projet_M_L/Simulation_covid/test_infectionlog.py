@@ -0,0 +1,43 @@
+import numpy as np
+
+from infectionlog import InfectionLog, SEED_INFECTOR
+
+
+def test_log_grows_and_counts_windows():
+    log = InfectionLog(capacity=2)
+    log.extend(0, SEED_INFECTOR, np.arange(4))
+    for time in range(1, 11):
+        log.append(time, 0, 10 + time)
+    assert len(log) == 14
+    assert log.infections_between(-1, 0) == 4
+    assert log.infections_between(5, 10) == 5
+    # not two full windows since the start yet
+    assert np.isnan(log.reproduction_number(9, 5))
+    assert np.isnan(InfectionLog(start=50).reproduction_number(55, 5))
+
+
+def test_reproduction_number_of_cohort():
+    log = InfectionLog()
+    log.extend(0, SEED_INFECTOR, [0, 1])
+    log.extend(1, [0, 0, 1], [2, 3, 4])
+    log.append(3, 2, 5)
+    log.extend(4, [3, 3], [6, 7])
+    log.extend(5, [6, 6], [9, 10])
+    log.append(6, 5, 8)
+    # cohort {2, 3, 4} infected in (0, 2] infects 5, 6 and 7 by time 4
+    assert log.reproduction_number(4, 2) == 1.0
+    # cohort {5} infected in (2, 3] infects nobody by time 4, 8 comes at time 6
+    assert log.reproduction_number(4, 1) == 0.0
+    # cohort {6, 7, 9, 10} infected in (3, 5]: only 6 infects, twice
+    assert log.reproduction_number(7, 2) == 0.5
+    # nobody infected in (5, 6]
+    assert log.reproduction_number(7, 1) == 0.0
+
+def test_log_save_and_load(tmp_path):
+    log = InfectionLog(start=2.0)
+    log.extend(3.0, [1, 2], [5, 6])
+    log.save(tmp_path / "log.npz")
+    loaded = InfectionLog.load(tmp_path / "log.npz")
+    assert np.array_equal(loaded.to_array(), log.to_array())
+    assert loaded.to_array()["infectee"].tolist() == [5, 6]
+    assert loaded.start == 2.0
@@ -0,0 +1,30 @@
+import simpy
+
+import instrument
+import batch
+import world
+
+
+def test_phases_are_recorded_only_when_enabled():
+    instrument.reset()
+    batch.run_headless(5, seed=0, num_people=100, vectorized=False)
+    assert instrument.stats() == {}
+
+    instrument.enable()
+    try:
+        batch.run_headless(5, seed=0, num_people=100, vectorized=False)
+        batch.run_headless(5, seed=0, num_people=100, vectorized=True)
+        # people only update the spatial hash when they search it themselves
+        assert "spatialhash_update" not in instrument.stats()
+        env = simpy.Environment()
+        world.Community(((0, 50), (0, 50)), env, no_of_people=50,
+                        batched_infection=False).activate()
+        env.run(until=2)
+    finally:
+        instrument.disable()
+    stats = instrument.stats()
+    for phase in ("movement", "spatialhash_update", "event_scheduling", "tick", "stats"):
+        assert stats[phase]["count"] > 0
+    assert stats["tick"]["count"] == 10  # the Community run did not use run_step
+    assert sum(stats["tick"]["histogram_ns_log2"]) == 10
+    instrument.reset()
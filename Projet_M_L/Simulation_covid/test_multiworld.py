@@ -0,0 +1,31 @@
+import numpy as np
+
+import multiworld
+
+
+def test_world_conserves_population():
+    configs = [dict(num_people=200, num_popular_places=2) for _ in range(3)]
+    travel_matrix = np.full((3, 3), 0.05)
+    for processes in (0, 2):
+        with multiworld.World(configs, travel_matrix, sync_interval=5, processes=processes,
+                              seed=0) as world:
+            history = world.run(50)
+        assert history["time"].tolist() == list(range(5, 55, 5))
+        assert np.all(history["population"].sum(axis=1) == 600)
+        # people did travel
+        assert np.any(history["population"] != 200)
+
+
+def test_person_ids_stay_unique_after_travel():
+    configs = [dict(num_people=100 + 50 * index, num_popular_places=2) for index in range(3)]
+    with multiworld.World(configs, np.full((3, 3), 0.2), sync_interval=5, processes=0,
+                          seed=0) as world:
+        world.run(20)
+        ids = [shard.communities[index].ids for shard in world._shards
+               for index in shard.community_ids]
+        ids += [people["ids"] for arrivals in world._arrivals for people in arrivals.values()]
+        logged = [shard.communities[index].infection_log.to_array()["infectee"]
+                  for shard in world._shards for index in shard.community_ids]
+    assert sorted(np.concatenate(ids).tolist()) == list(range(450))
+    logged = np.concatenate(logged)
+    assert len(np.unique(logged)) == len(logged)
@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+import simpy
+
+import recording
+import render
+import world
+
+
+def test_record_and_replay(tmp_path):
+    env = simpy.Environment()
+    community = world.VectorCommunity(((0, 40), (0, 40)), env, no_of_people=300,
+                                      popular_places=[(5, 5), (30, 20)], seed=1)
+    community.activate()
+    path = tmp_path / "run.traj"
+    assert recording.record_run(path, community, env, 25) == 25
+
+    reader = recording.TrajectoryReader(path)
+    assert len(reader) == 25
+    assert reader.position == ((0, 40), (0, 40))
+    assert reader.popular_places == [(5, 5), (30, 20)]
+    assert reader.frames["time"].tolist() == list(range(1, 26))
+    reader.seek(24)
+    data, _, infected_percent = reader.get_all_positions_colors(0.5, 0.9)
+    expected, _, expected_percent = community.get_all_positions_colors(0.5, 0.9)
+    assert np.allclose(data, expected, atol=1e-4)
+    assert infected_percent == expected_percent
+
+
+def test_replay_rejects_empty_recording(tmp_path):
+    env = simpy.Environment()
+    community = world.VectorCommunity(((0, 40), (0, 40)), env, no_of_people=10, seed=1)
+    path = tmp_path / "empty.traj"
+    assert recording.record_run(path, community, env, 0) == 0
+    with pytest.raises(ValueError):
+        render.render_community(0, env, None, replay=recording.TrajectoryReader(path))
@@ -0,0 +1,93 @@
+import asyncio
+
+import numpy as np
+import simpy
+
+import server
+import world
+import worker
+
+
+def _frames(rng, count, steps):
+    data = np.empty((count, 3))
+    data[:, 0:2] = rng.uniform(0, 50, size=(count, 2))
+    for _ in range(steps):
+        data[:, 0:2] = np.clip(data[:, 0:2] + rng.normal(0, 1, size=(count, 2)), 0, 50)
+        data[:, 2] = np.where(rng.random(count) < 0.3, worker.INFECTED_COLOR,
+                              worker.NORMAL_COLOR)
+        yield data
+
+
+def test_encoder_decoder_round_trip():
+    rng = np.random.default_rng(0)
+    encoder = server.Encoder(((0, 50), (0, 50)))
+    decoder = server.Decoder()
+    decoder.decode(server._message(b"I", b'{"position": [[0, 50], [0, 50]]}')[4:])
+    viewer = server._Viewer(None)
+    for step, data in enumerate(_frames(rng, 101, 6)):
+        viewer.offer(encoder.encode(data, step, 30.0, 1.5))
+        if step == 3:
+            continue  # a slow viewer, frame 4 is dropped
+        kind, content = decoder.decode(viewer.next_message()[4:])
+        # a delta follows the frame sent before, a key frame otherwise
+        assert kind == {0: b"K", 4: b"K"}.get(step, b"D")
+        assert np.allclose(content["positions"], data[:, 0:2], atol=50 / server.SCALE)
+        assert np.array_equal(content["infected"], data[:, 2] == worker.INFECTED_COLOR)
+        assert content["time"] == step and content["r_value"] == 1.5
+    assert viewer.dropped == 1 and viewer.sent == 5
+
+
+def test_stream_to_viewers():
+    env = simpy.Environment()
+    community = world.VectorCommunity(((0, 50), (0, 50)), env, no_of_people=300,
+                                      popular_places=[(10, 10)], seed=0)
+    community.activate()
+    simulation_worker = worker.SimulationWorker(env, community, steps_per_second=200)
+    simulation_worker.start()
+    errors = []
+
+    async def scenario():
+        frame_server = server.FrameServer(simulation_worker, community, port=0, fps=100)
+        await frame_server.start()
+        try:
+            return await asyncio.wait_for(asyncio.gather(
+                server.watch(port=frame_server.port, frames=5, updates={"infect_range": 4}),
+                server.watch(port=frame_server.port, frames=5, updates={"speed": 1},
+                             callback=lambda kind, content: kind == b"E"
+                             and errors.append(content))), 20)
+        finally:
+            await frame_server.close()
+
+    try:
+        decoders = asyncio.run(scenario())
+    finally:
+        simulation_worker.stop(timeout=5)
+    assert community.infect_range == 4
+    assert errors == [{"unknown": ["speed"]}]
+    for decoder in decoders:
+        assert decoder.info["count"] == 300 and decoder.positions.shape == (300, 2)
+
+
+def test_out_of_range_updates_are_rejected():
+    env = simpy.Environment()
+    community = world.VectorCommunity(((0, 50), (0, 50)), env, no_of_people=100, seed=0)
+    community.activate()
+    simulation_worker = worker.SimulationWorker(env, community)
+    frame_server = server.FrameServer(simulation_worker, community, port=0)
+    errors = frame_server.apply({"stop_duration": 0, "walk_range": -1,
+                                 "infect_range": float("inf"),
+                                 "infect_probability": float("nan"),
+                                 "popular_place_probability": "often", "speed": 1,
+                                 "stop_duration ": 5})
+    assert errors["unknown"] == ["speed", "stop_duration "]
+    assert set(errors["invalid"]) == {"stop_duration", "walk_range", "infect_range",
+                                      "infect_probability", "popular_place_probability"}
+    assert frame_server.apply({"stop_duration": 1, "infect_range": 35}) == {}
+    simulation_worker.start()
+    try:
+        while simulation_worker.steps < 5:
+            assert simulation_worker.is_alive()
+    finally:
+        simulation_worker.stop(timeout=5)
+    assert community.stop_duration == 1 and community.infect_range == 35
+    assert community.infect_probability == 0.01
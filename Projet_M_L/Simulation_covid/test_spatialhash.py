@@ -0,0 +1,94 @@
+import random
+
+import numpy as np
+
+from spatialhash import GridSpatialIndex, SpatialHashTable, pairs_within
+
+
+class Point:
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+
+def test_grid_index_matches_spatial_hash():
+    random.seed(0)
+    points = [Point(random.uniform(0, 50), random.uniform(0, 50)) for _ in range(300)]
+    table, grid = SpatialHashTable(cell_size=3), GridSpatialIndex(cell_size=3)
+    for point in points:
+        table.insertObject(point)
+        grid.insertObject(point)
+    for point in points[:100]:
+        new_x, new_y = random.uniform(0, 50), random.uniform(0, 50)
+        table.updateObject(point, new_x, new_y)
+        grid.updateObject(point, new_x, new_y)
+        point.x, point.y = new_x, new_y
+    # no rebuild() needed, the search sees the updates
+    for point in points:
+        assert {id(obj) for obj in grid.search_nearby(point, 2)} \
+            == {id(obj) for obj in table.search_nearby(point, 2)}
+
+
+def test_grid_index_floors_negative_coordinates():
+    random.seed(1)
+    points = [Point(random.uniform(-20, 20), random.uniform(-20, 20)) for _ in range(300)]
+    table, grid = SpatialHashTable(cell_size=3), GridSpatialIndex(cell_size=3)
+    for point in points:
+        table.insertObject(point)
+        grid.insertObject(point)
+    assert grid._hash(-0.5, 0.5) == (-1, 0)
+    assert table._hash(-0.5, 0.5) == (0, 0)
+
+    def inside(found, point):
+        return {id(obj) for obj in found
+                if abs(obj.x - point.x) <= 2 and abs(obj.y - point.y) <= 2}
+    for point in points:
+        found = grid.search_nearby(point, 2)
+        # every candidate is in a floored cell touching the box
+        assert all(abs(obj.x // 3 - point.x // 3) <= 1 and abs(obj.y // 3 - point.y // 3) <= 1
+                   for obj in found)
+        # the candidates differ, the objects really inside the box do not
+        assert inside(found, point) == inside(table.search_nearby(point, 2), point)
+        assert inside(found, point) == inside(points, point)
+
+
+def test_grid_index_remove():
+    grid = GridSpatialIndex(cell_size=1)
+    points = [Point(i, i) for i in range(5)]
+    for point in points:
+        grid.insertObject(point)
+    grid.removeObject(points[1])
+    found = grid.search_in_box(0, 5, 0, 5)
+    assert {id(obj) for obj in found} == {id(point) for point in points} - {id(points[1])}
+
+
+def test_pairs_within_brute_force():
+    rng = np.random.default_rng(0)
+    queries = rng.uniform(0, 20, (50, 2))
+    targets = rng.uniform(0, 20, (400, 2))
+    for half_range in (0.7, 2, 5):
+        query_ids, target_ids = pairs_within(queries, targets, half_range)
+        inside = np.all(np.abs(queries[:, None] - targets[None]) <= half_range, axis=2)
+        assert set(zip(query_ids, target_ids)) == set(zip(*np.nonzero(inside)))
+
+
+def test_search_pairs_with_range_wider_than_cells():
+    rng = np.random.default_rng(1)
+    queries = rng.uniform(0, 20, (30, 2))
+    targets = rng.uniform(0, 20, (200, 2))
+    grid = GridSpatialIndex.from_positions(targets, cell_size=1)
+    query_ids, target_ids = grid.search_pairs(queries, 4)
+    inside = np.all(np.abs(queries[:, None] - targets[None]) <= 4, axis=2)
+    assert set(zip(query_ids, target_ids)) == set(zip(*np.nonzero(inside)))
+
+
+def test_search_pairs_in_sparse_wide_world():
+    # 1e7 / 0.5 cells along each axis, far too many to allocate one count per cell
+    rng = np.random.default_rng(2)
+    targets = rng.uniform(-1e7, 1e7, (300, 2))
+    targets[:100] = targets[100:200] + rng.uniform(-1, 1, (100, 2))
+    queries = np.concatenate((targets[:50] + 0.3, rng.uniform(-1e7, 1e7, (20, 2))))
+    query_ids, target_ids = pairs_within(queries, targets, 0.5)
+    inside = np.all(np.abs(queries[:, None] - targets[None]) <= 0.5, axis=2)
+    assert set(zip(query_ids, target_ids)) == set(zip(*np.nonzero(inside)))
+    assert len(query_ids) >= 50
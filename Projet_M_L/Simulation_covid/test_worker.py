@@ -0,0 +1,28 @@
+import time
+
+import simpy
+
+import world
+import worker
+
+
+def test_worker_publishes_frames_and_applies_updates():
+    env = simpy.Environment()
+    community = world.VectorCommunity(((0, 50), (0, 50)), env, no_of_people=200, seed=0)
+    community.activate()
+    simulation_worker = worker.SimulationWorker(env, community, steps_per_second=500)
+    first = simulation_worker.latest()
+    assert first.time == 0 and first.data.shape == (200, 3)
+
+    simulation_worker.start()
+    simulation_worker.set_people_attribute("infect_range", 4)
+    deadline = time.time() + 5
+    while simulation_worker.steps < 20 and time.time() < deadline:
+        time.sleep(0.01)
+    simulation_worker.stop(timeout=5)
+
+    assert not simulation_worker.is_alive()
+    assert community.infect_range == 4
+    latest = simulation_worker.latest()
+    assert latest.time == env.now == simulation_worker.steps
+    assert latest is not first
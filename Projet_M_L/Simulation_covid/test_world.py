@@ -0,0 +1,155 @@
+import random
+
+import numpy as np
+import simpy
+
+import world
+
+
+def make_vector_community(num_people=500, seed=0):
+    env = simpy.Environment()
+    community = world.VectorCommunity(((0, 50), (0, 50)), env,
+                                      no_of_people=num_people,
+                                      popular_places=[(10, 10), (40, 40)],
+                                      seed=seed)
+    return env, community
+
+
+def test_vector_community_stays_in_boundaries():
+    env, community = make_vector_community()
+    community.activate()
+    env.run(until=200)
+    data, _, _ = community.get_all_positions_colors(0.5, 0.9)
+    assert data.shape == (500, 3)
+    # people can overshoot their target by at most one step
+    assert np.all(data[:, 0:2] >= -world.WALK_SPEED)
+    assert np.all(data[:, 0:2] <= 50 + world.WALK_SPEED)
+
+
+def test_vector_community_infections_are_credited():
+    env, community = make_vector_community()
+    community.set_people_attribute("infect_probability", 0.2)
+    initially_infected = int(community.infected.sum())
+    community.activate()
+    env.run(until=100)
+    newly_infected = int(community.infected.sum()) - initially_infected
+    assert newly_infected > 0
+    assert community.num_infected.sum() == newly_infected
+
+
+def test_vector_community_is_reproducible():
+    runs = []
+    for _ in range(2):
+        env, community = make_vector_community(seed=42)
+        community.activate()
+        env.run(until=50)
+        runs.append(community.get_all_positions_colors(0.5, 0.9)[0])
+    assert np.array_equal(runs[0], runs[1])
+
+
+def test_infection_log_matches_population():
+    env = simpy.Environment()
+    community = world.Community(((0, 30), (0, 30)), env, no_of_people=100)
+    community.set_people_attribute("infect_probability", 0.2)
+    community.activate()
+    env.run(until=50)
+    _, _, infected_percent = community.get_all_positions_colors(0.5, 0.9)
+    infected = sum(person.infected for person in community.population)
+    assert infected_percent == 100 * infected / 100
+    events = community.infection_log.to_array()
+    secondary = events[events["infector"] >= 0]
+    assert len(secondary) == sum(person.num_infected for person in community.population)
+
+    env, vector_community = make_vector_community()
+    vector_community.set_people_attribute("infect_probability", 0.2)
+    vector_community.activate()
+    env.run(until=50)
+    assert vector_community.total_infected == vector_community.infected.sum()
+    assert len(vector_community.infection_log) == vector_community.total_infected
+
+
+def test_vector_community_snapshot_resumes_deterministically(tmp_path):
+    env, community = make_vector_community(seed=3)
+    community.set_people_attribute("infect_probability", 0.1)
+    community.activate()
+    env.run(until=20)
+    community.save_snapshot(tmp_path / "snapshot.npz")
+
+    restored = world.VectorCommunity.load_snapshot(tmp_path / "snapshot.npz")
+    assert restored.env.now == 20
+    assert restored.infect_probability == 0.1
+    restored.activate()
+    env.run(until=60)
+    restored.env.run(until=60)
+    assert np.array_equal(community.positions, restored.positions)
+    assert np.array_equal(community.infected, restored.infected)
+    assert np.array_equal(community.infection_log.to_array(), restored.infection_log.to_array())
+
+
+def test_batched_infection_reaches_the_spatial_hash_neighbours():
+    random.seed(1)
+    env = simpy.Environment()
+    community = world.Community(((0, 30), (0, 30)), env, no_of_people=300)
+    for person in community.population:
+        person.infected = False
+    spreader = community.population[0]
+    spreader.infected = True
+    spreader.walking = True
+    community.set_people_attribute("infect_probability", 1.0)
+    expected = {person.id_ for person in community.spatialhash.search_nearby(spreader, 2)}
+    community.infect_nearby()
+    infected = {person.id_ for person in community.population if person.infected}
+    assert infected == expected | {spreader.id_}
+    assert spreader.num_infected == len(expected - {spreader.id_})
+
+
+def test_path_table_matches_step_by_step_walk():
+    paths = world.PathTable([(0.0, 0.0)])
+    start, target, speed = (3.0, 10.0), (17.2, 4.1), 0.7
+    duration = paths.start_walk(0, 5, start, target, speed)
+    cur_x, cur_y = start
+    steps = 0
+    while (abs(cur_x - target[0]) >= world.CLOSE_ENOUGH_THRESHOLD
+           or abs(cur_y - target[1]) >= world.CLOSE_ENOUGH_THRESHOLD):
+        if abs(cur_x - target[0]) >= world.CLOSE_ENOUGH_THRESHOLD:
+            cur_x += speed if cur_x < target[0] else -speed
+        if abs(cur_y - target[1]) >= world.CLOSE_ENOUGH_THRESHOLD:
+            cur_y += speed if cur_y < target[1] else -speed
+        steps += 1
+        assert np.allclose(paths.position(0, 5 + steps), (cur_x, cur_y))
+        assert paths.walking(5 + steps - 1)[0]
+    assert duration == steps
+    assert not paths.walking(5 + steps)[0]
+
+
+def test_event_driven_community():
+    random.seed(2)
+    env = simpy.Environment()
+    community = world.Community(((0, 50), (0, 50)), env, no_of_people=300, event_driven=True)
+    community.set_people_attribute("infect_probability", 0.2)
+    community.activate()
+    env.run(until=100)
+    data, _, infected_percent = community.get_all_positions_colors(0.5, 0.9)
+    assert np.all(data[:, 0:2] >= -world.WALK_SPEED)
+    assert np.all(data[:, 0:2] <= 50 + world.WALK_SPEED)
+    infected = sum(person.infected for person in community.population)
+    assert infected > 0.05 * 300
+    assert infected_percent == 100 * infected / 300
+
+
+def test_vector_community_spreads_like_community():
+    def final_infected_percent(community_class, seed):
+        random.seed(seed)
+        env = simpy.Environment()
+        kwargs = {"seed": seed} if community_class is world.VectorCommunity else {}
+        community = community_class(((0, 100), (0, 100)), env, no_of_people=300,
+                                    popular_places=[(10, 10), (50, 75), (90, 30)], **kwargs)
+        community.set_people_attribute("infect_probability", 0.02)
+        community.activate()
+        env.run(until=200)
+        return community.get_all_positions_colors(0.5, 0.9)[2]
+
+    # around 88% infected for both, infecting only inside the range box gave about 62%
+    vector = np.mean([final_infected_percent(world.VectorCommunity, seed) for seed in range(5)])
+    objects = np.mean([final_infected_percent(world.Community, seed) for seed in range(5)])
+    assert abs(vector - objects) < 8
@@ -0,0 +1,115 @@
+""" Runs the simulation on a background thread, away from the render loop.
+    The worker steps the SimPy environment as fast as it can (or at a set rate) and
+    publishes every step into a small ring of preallocated frames, the renderer picks
+    up the latest one at its own frame rate. Parameter changes (sliders) are queued
+    and applied by the worker between two steps.
+"""
+import queue
+import threading
+import time
+
+import numpy as np
+
+import instrument
+
+NORMAL_COLOR = 0.5  # colors written in the frames, same as render
+INFECTED_COLOR = 0.9
+
+
+class Frame:
+    """One published step: positions and colors (data), R value and infected percent"""
+
+    def __init__(self, num_people):
+        self.data = np.empty((num_people, 3))
+        self.r_value = float("nan")
+        self.infected_percent = 0.0
+        self.time = -1  # env.now of the step, -1 when never written
+
+
+class SimulationWorker(threading.Thread):
+    """
+    Background thread stepping a community
+
+        worker = SimulationWorker(env, community)
+        worker.start()
+        frame = worker.latest()  # from the render loop
+        worker.set_people_attribute("infect_range", 3)  # from a slider
+        worker.stop()
+
+    steps_per_second limits the simulation speed, None runs as fast as possible.
+    """
+    def __init__(self, env, community, steps_per_second=None, buffer_size=3):
+        super().__init__(daemon=True)
+        if buffer_size < 3:
+            # one being read, one being written and the latest complete one
+            raise ValueError("buffer_size must be at least 3")
+        self.env = env
+        self.community = community
+        self.steps_per_second = steps_per_second
+        self.frames = [Frame(community.count) for _ in range(buffer_size)]
+        self._lock = threading.Lock()
+        self._latest = None  # index of the last complete frame
+        self._reading = None  # index of the frame handed out by latest()
+        self._updates = queue.SimpleQueue()  # (attribute name, value) to apply
+        self._running = threading.Event()  # cleared while paused
+        self._running.set()
+        self._stopped = threading.Event()
+        self.steps = 0  # number of steps simulated
+        # publish the initial state so there is always a frame to show
+        self._publish(0)
+
+    def _publish(self, index):
+        frame = self.frames[index]
+        frame.data, frame.r_value, frame.infected_percent = \
+            self.community.get_all_positions_colors(NORMAL_COLOR, INFECTED_COLOR,
+                                                    nparray_to_fill=frame.data)
+        frame.time = self.env.now
+        with self._lock:
+            self._latest = index
+
+    def _free_index(self):
+        """A frame neither being read nor the latest one"""
+        with self._lock:
+            busy = (self._latest, self._reading)
+        return next(index for index in range(len(self.frames)) if index not in busy)
+
+    def run(self):
+        while not self._stopped.is_set():
+            self._running.wait()
+            if self._stopped.is_set():
+                break
+            begin = time.perf_counter()
+            while not self._updates.empty():
+                self.community.set_people_attribute(*self._updates.get())
+            instrument.run_step(self.env)
+            self._publish(self._free_index())
+            self.steps += 1
+            if self.steps_per_second:
+                time.sleep(max(0.0, 1.0/self.steps_per_second - (time.perf_counter()-begin)))
+
+    def latest(self):
+        """The most recent frame. It is not written to until the next call of latest()"""
+        with self._lock:
+            self._reading = self._latest
+            return self.frames[self._reading]
+
+    def set_people_attribute(self, attr_name, value):
+        """Sets an attribute for all people, applied by the worker before its next step"""
+        self._updates.put((attr_name, value))
+
+    def pause(self):
+        self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    def stop(self, timeout=None):
+        """Stops the worker and waits for it to finish its step"""
+        self._stopped.set()
+        self._running.set()
+        if self.is_alive():
+            self.join(timeout)
@@ -1,12 +1,18 @@
+import json
 import random
+import time
 
 import numpy as np
 import simpy
 
-from spatialhash import PersonSpatialHash
+import instrument
+from infectionlog import InfectionLog, SEED_INFECTOR
+from spatialhash import PersonSpatialHash, pairs_within
 
 CLOSE_ENOUGH_THRESHOLD = 0.5
 WALK_SPEED = 1.0
+RT_WINDOW = 100  # env steps per window of the effective reproduction number
+CELL_SIZE = 3  # cell size of the spatial hash, infections reach the cells around a person
 
 def random_tf(probability):
     """Returns True probability% of times (has been tested)
@@ -15,6 +21,22 @@ def random_tf(probability):
         return True
     return False
 
+def cell_cover_pairs(spreader_positions, target_positions, ranges, cell_size=CELL_SIZE):
+    """Returns (spreader index, target index) arrays of every target in the spatial hash
+    cells touching the box of half width ranges (one per spreader, or one for all) around a
+    spreader: the people spatialhash.search_nearby finds for Person.wander.
+    """
+    ranges = np.broadcast_to(np.asarray(ranges, dtype=float), (len(spreader_positions),))
+    # cells are truncated towards zero, so cell 0 is two cells wide: look two cells further
+    pair_spreaders, pair_targets = pairs_within(spreader_positions, target_positions,
+                                                ranges.max() + 2*cell_size)
+    # and keep the people in the same cells as the spatial hash search
+    low = np.trunc((spreader_positions - ranges[:, None]) / cell_size)[pair_spreaders]
+    high = np.trunc((spreader_positions + ranges[:, None]) / cell_size)[pair_spreaders]
+    cells = np.trunc(target_positions / cell_size)[pair_targets]
+    searched = np.all((cells >= low) & (cells <= high), axis=1)
+    return pair_spreaders[searched], pair_targets[searched]
+
 class Person:
     """ A person in our simulation model, these objects live the box models.
         They need these properties:
@@ -27,7 +49,8 @@ class Person:
         6. List of popular places in the community with the probability of going to such places
     """
 
-    def __init__(self, person_id, start_pos, boundaries, env: simpy.Environment, popular_places):
+    def __init__(self, person_id, start_pos, boundaries, env: simpy.Environment, popular_places,
+                 infection_log=None):
         self.id_ = person_id
         self.position = start_pos
         self.infected = False
@@ -44,20 +67,53 @@ class Person:
         self.boundaries = boundaries  # (x_min, x_max, y_min, y_max)
         self.popular_places = popular_places  # a list of popular places in the community
         self.popular_place_probability = 0.3  # probability of going to a popular place
+        self.infection_log = infection_log  # InfectionLog shared with the community
+        self.walking = False  # whether the person is moving to a target
+        # infect people nearby while walking, False when the community does it for everybody
+        self.infect_on_move = True
+        self.paths = None  # PathTable of the community in event driven mode
+
+    def choose_target(self):
+        """Picks where to wander to next: a popular place or a random location nearby"""
+        (start_x, end_x), (start_y, end_y) = self.boundaries
+        cur_x, cur_y = self.position
+
+        if self.popular_places and random_tf(self.popular_place_probability):
+            return random.choice(self.popular_places) # go to one of popular places
+        # go to random location in community
+        new_x = random.uniform(0, self.walk_range) + cur_x
+        new_y = random.uniform(0, self.walk_range) + cur_y
+        # Try to move within the correct boundaries
+        while not start_x <= new_x <= end_x or not start_y <= new_y <= end_y:
+            new_x = random.uniform(-self.walk_range, self.walk_range+1) + cur_x
+            new_y = random.uniform(-self.walk_range, self.walk_range+1) + cur_y
+        return new_x, new_y
 
     def activate(self, spatialhash):
-        """Activates an infinite loop of walking and stopping
+        """Activates an infinite loop of walking and stopping. spatialhash is None when
+        the community infects everybody at once (batched infection), nothing searches it
+        then so it is not kept up to date.
         """
+        # event driven mode walks in one go, see walk
+        move = self.wander if self.paths is None else self.walk
         while True:
-            yield self.env.process(self.wander(spatialhash))  # wander
-            yield self.env.timeout(random.randrange(self.stop_duration))  # stop wandering
+            yield self.env.process(move(spatialhash))  # wander
+            clock = instrument.enabled and time.perf_counter()
+            stop = self.env.timeout(random.randrange(self.stop_duration))
+            if clock:
+                instrument.lap("event_scheduling", clock)
+            yield stop  # stop wandering
 
-    def got_infected(self):
-        """Make person infected if not already infected"""
+    def got_infected(self, infector=None):
+        """Make person infected if not already infected, infector is the Person responsible"""
         if self.infected:
             return False
         self.infected = True
         self.time_infected = self.env.now
+        if self.infection_log is not None:
+            self.infection_log.append(self.env.now,
+                                      SEED_INFECTOR if infector is None else infector.id_,
+                                      self.id_)
         return True
 
     def wander(self, spatialhash):
@@ -70,19 +126,8 @@ class Person:
             It would be better if it moved one position per time step, instead
             of teleporting to the location.
         """
-        (start_x, end_x), (start_y, end_y) = self.boundaries
         cur_x, cur_y = self.position
-
-        if self.popular_places and random_tf(self.popular_place_probability):
-            new_x, new_y = random.choice(self.popular_places) # go to one of popular places
-        else:
-            # go to random location in community
-            new_x = random.uniform(0, self.walk_range) + cur_x
-            new_y = random.uniform(0, self.walk_range) + cur_y
-            # Try to move within the correct boundaries
-            while not start_x <= new_x <= end_x or not start_y <= new_y <= end_y:
-                new_x = random.uniform(-self.walk_range, self.walk_range+1) + cur_x
-                new_y = random.uniform(-self.walk_range, self.walk_range+1) + cur_y
+        new_x, new_y = self.choose_target()
 
         def get_direction(position, target):
             """Given current value and target value return direction of increase to reach target"""
@@ -100,23 +145,98 @@ class Person:
             return False
 
         # move slowly to target (not just teleport to it)
+        self.walking = True
         while not close_enough(cur_x, new_x) or not close_enough(cur_y, new_y):
+            clock = instrument.enabled and time.perf_counter()
             direction = (get_direction(cur_x, new_x), get_direction(cur_y, new_y))
             # increment position
             cur_x += direction[0] * self.walk_speed
             cur_y += direction[1] * self.walk_speed
-            if self.infected:
+            if clock:
+                clock = instrument.lap("movement", clock)
+            if self.infected and self.infect_on_move:
                 # if infected do a spatial search
                 nearby_people = spatialhash.search_nearby(self, self.infect_range)
                 for nearby_person in nearby_people:
                     # infect nearby people
                     if random_tf(self.infect_probability):
                         # infect successful
-                        self.num_infected += (nearby_person.got_infected())
-            # update position in spatial hash
-            spatialhash.updateObject(self, cur_x, cur_y)
+                        self.num_infected += (nearby_person.got_infected(self))
+                if clock:
+                    clock = instrument.lap("infection_search", clock)
+            if spatialhash is not None:
+                # update position in spatial hash
+                spatialhash.updateObject(self, cur_x, cur_y)
+                if clock:
+                    clock = instrument.lap("spatialhash_update", clock)
             self.position = cur_x, cur_y # update position in object
-            yield self.env.timeout(1)
+            step = self.env.timeout(1)
+            if clock:
+                instrument.lap("event_scheduling", clock)
+            yield step
+        self.walking = False
+
+    def walk(self, spatialhash):
+        """Same walk as wander, but computed in one go: the straight line path goes in
+        self.paths and the only SimPy event is the arrival. Until then self.position and
+        the spatial hash keep the starting point, self.paths has the current position.
+        """
+        target = self.choose_target()
+        self.walking = True
+        clock = instrument.enabled and time.perf_counter()
+        duration = self.paths.start_walk(self.id_, self.env.now, self.position, target,
+                                         self.walk_speed)
+        arrival = self.env.timeout(duration) if duration < float("inf") else self.env.event()
+        if clock:
+            instrument.lap("event_scheduling", clock)
+        yield arrival
+        cur_x, cur_y = self.paths.position(self.id_, self.env.now)
+        if spatialhash is not None:
+            spatialhash.updateObject(self, cur_x, cur_y)
+        self.position = cur_x, cur_y
+        self.walking = False
+
+class PathTable:
+    """ The straight line walks of all the people of a community in event driven mode.
+        A walk moves walk_speed along each axis every step, like Person.wander, until that
+        axis is close enough to the target, so the position at any time has a closed form:
+        start + step * min(time since departure, steps of that axis)
+    """
+
+    def __init__(self, positions):
+        self.start = np.array(positions, dtype=float).reshape(-1, 2)
+        self.step = np.zeros_like(self.start)  # move per env step along each axis
+        self.steps = np.zeros(self.start.shape)  # number of moves along each axis
+        self.departure = np.zeros(len(self.start))
+
+    def start_walk(self, person_id, now, start, target, speed):
+        """Stores a walk starting now, returns the number of steps it takes"""
+        distance = np.asarray(target, dtype=float) - start
+        far = np.abs(distance) >= CLOSE_ENOUGH_THRESHOLD
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # moves until the distance left is under the threshold
+            steps = np.where(far,
+                             np.floor((np.abs(distance) - CLOSE_ENOUGH_THRESHOLD)/speed) + 1, 0)
+        self.start[person_id] = start
+        self.step[person_id] = np.sign(distance) * far * speed
+        self.steps[person_id] = steps
+        self.departure[person_id] = now
+        return steps.max()
+
+    def position(self, person_id, now):
+        """Position of one person at time now"""
+        moves = np.minimum(max(now - self.departure[person_id], 0), self.steps[person_id])
+        return tuple(self.start[person_id] + self.step[person_id] * moves)
+
+    def positions(self, now):
+        """Positions of everybody at time now, as a (n, 2) array"""
+        elapsed = np.maximum(now - self.departure, 0)[:, None]
+        return self.start + self.step * np.minimum(elapsed, self.steps)
+
+    def walking(self, now):
+        """Whether each person still moves at step now"""
+        return now - self.departure < self.steps.max(axis=1)
+
 
 class Community:
     """ A community in our model world, they are represented by boxes.
@@ -129,7 +249,8 @@ class Community:
         3. Lockdown?
     """
 
-    def __init__(self, position, env: simpy.Environment, no_of_people=60, popular_places=None):
+    def __init__(self, position, env: simpy.Environment, no_of_people=60, popular_places=None,
+                 batched_infection=True, event_driven=False):
         self.position = position  # defines boundaries of the community
         self.env = env  # SimPy environment
         self.population = []
@@ -143,14 +264,19 @@ class Community:
 
         self.count = no_of_people
 
-        # initialise spatial hash table
-        self.spatialhash = PersonSpatialHash(cell_size=3)
+        # initialise spatial hash table, only kept up to date when people do their own
+        # infection search (batched_infection=False), infect_nearby does not use it
+        self.spatialhash = PersonSpatialHash(cell_size=CELL_SIZE)
+        # every infection is logged, the log keeps the running count of infected people
+        self.infection_log = InfectionLog(start=env.now)
+        self.rt_window = RT_WINDOW
 
         self.initial_infected_percent = 0.05
         for person_id in range(no_of_people):
             # randomly spawn person
             start_pos = (random.uniform(start_x, end_x), random.uniform(start_y, end_y))
-            new_person = Person(person_id, start_pos, position, env, popular_places)
+            new_person = Person(person_id, start_pos, position, env, popular_places,
+                                infection_log=self.infection_log)
             if random_tf(self.initial_infected_percent):
                 # randomly infect that person
                 new_person.got_infected()
@@ -159,27 +285,101 @@ class Community:
         self.population_processes = []  # to store the SimPy processes for each person
         # ^ this could be dict
 
+        # event driven mode: walks are stored in a PathTable and only their arrival is a
+        # SimPy event, infections can then only be done for everybody at once
+        self.paths = None
+        if event_driven:
+            self.paths = PathTable([person.position for person in self.population])
+            self.set_people_attribute("paths", self.paths)
+            batched_infection = True
+
+        # infect everybody once per step (infect_nearby) instead of a spatial search per
+        # infected person per move
+        self.batched_infection = batched_infection
+        if batched_infection:
+            self.set_people_attribute("infect_on_move", False)
+            self.rng = np.random.default_rng(random.getrandbits(64))
+        self.infection_process = None
+
+    def infect_nearby(self):
+        """Infection stage of one step for the whole community. Every walking infected
+        person infects each susceptible person found by spatialhash.search_nearby with
+        infect_probability, like Person.wander does, but with one batch pair search and
+        one vectorized draw for all of them.
+        """
+        now = self.env.now
+        if self.paths is None:
+            infected = np.fromiter((person.infected for person in self.population), bool,
+                                   self.count)
+            walking = np.fromiter((person.walking for person in self.population), bool,
+                                  self.count)
+        else:
+            # event driven mode, nobody needs to be looked at one by one
+            infected = self._infected_mask()
+            walking = self.paths.walking(now)
+        spreader_ids = np.flatnonzero(infected & walking)
+        susceptible_ids = np.flatnonzero(~infected)
+        if not len(spreader_ids) or not len(susceptible_ids):
+            return
+        if self.paths is None:
+            positions = np.array([person.position for person in self.population])
+        else:
+            positions = self.paths.positions(now)
+        spreader_positions = positions[spreader_ids]
+        susceptible_positions = positions[susceptible_ids]
+        spreaders = [self.population[index] for index in spreader_ids]
+        ranges = np.array([person.infect_range for person in spreaders], dtype=float)
+        probabilities = np.array([person.infect_probability for person in spreaders])
+
+        pair_spreaders, pair_susceptible = cell_cover_pairs(spreader_positions,
+                                                            susceptible_positions, ranges,
+                                                            self.spatialhash.cell_size)
+
+        success = self.rng.random(len(pair_spreaders)) < probabilities[pair_spreaders]
+        for spreader, susceptible in zip(pair_spreaders[success], pair_susceptible[success]):
+            spreader = spreaders[spreader]
+            susceptible = self.population[susceptible_ids[susceptible]]
+            spreader.num_infected += susceptible.got_infected(spreader)
+
+    def _infected_mask(self):
+        """Boolean array of the infected people, from the infection log"""
+        infected = np.zeros(self.count, dtype=bool)
+        infected[self.infection_log.infectees[:len(self.infection_log)]] = True
+        return infected
+
+    def spread(self):
+        """SimPy process running infect_nearby once per step"""
+        while True:
+            clock = instrument.enabled and time.perf_counter()
+            self.infect_nearby()
+            if clock:
+                instrument.lap("infection_search", clock)
+            yield self.env.timeout(1)
+
     def get_all_positions_colors(self, normal_color, infected_color, nparray_to_fill=None):
         """Get positions of all people in the form of two separate x and y lists.
         This is a helper function for plotting.
         """
-        num_infecteds = []  # to store number of people infected by each person
-        total_infected = 0  # to store number of infected people
+        clock = instrument.enabled and time.perf_counter()
         if nparray_to_fill is None:
             data = np.empty((self.count, 3))  # initialise data array
         else:
             data = nparray_to_fill  # use data array if given
-        for index, person in enumerate(self.population):
-            data[index] = (person.position[0],  # x value
-                           person.position[1],  # y value
-                           infected_color if person.infected else normal_color) # color
-            num_infecteds.append(person.num_infected)
-            total_infected += int(person.infected)
-        # TODO: Probably wrong calculation
-        # calculate R value
-        r_value = float(sum(num_infecteds))/total_infected
-        # calculate percent of infected people
-        infected_percent = 100 * float(total_infected)/self.count
+        if self.paths is not None:
+            # people are somewhere along their path, not at their last stored position
+            data[:, 0:2] = self.paths.positions(self.env.now)
+            data[:, 2] = np.where(self._infected_mask(), infected_color, normal_color)
+        else:
+            for index, person in enumerate(self.population):
+                data[index] = (person.position[0],  # x value
+                               person.position[1],  # y value
+                               infected_color if person.infected else normal_color) # color
+        # effective reproduction number over the last rt_window steps
+        r_value = self.infection_log.reproduction_number(self.env.now, self.rt_window)
+        # calculate percent of infected people, nobody is ever cured so it is the log size
+        infected_percent = 100 * float(len(self.infection_log))/self.count
+        if clock:
+            instrument.lap("stats", clock)
         return data, r_value, infected_percent
 
     def set_people_attribute(self, attr_name, value):
@@ -190,6 +390,270 @@ class Community:
     def activate(self):
         """Activates all the people in this community. This will not lock the thread.
         """
+        if self.batched_infection and self.infection_process is None:
+            # runs once per step, but SimPy runs the events of one time in the order they
+            # were scheduled: people whose timeout was scheduled before the last one of
+            # spread (e.g. at the start of a stop) move before it in that step
+            self.infection_process = self.env.process(self.spread())
+        # nobody searches the spatial hash with batched infection, people skip updating it
+        spatialhash = None if self.batched_infection else self.spatialhash
         for person in self.population:
-            self.population_processes.append(self.env.process(person.activate(self.spatialhash)))
+            self.population_processes.append(self.env.process(person.activate(spatialhash)))
         return self.population_processes
+
+
+class VectorCommunity:
+    """ Same model as Community, but the people are stored as columns of NumPy arrays
+        (struct of arrays) instead of one Person object and one SimPy process each.
+        A single SimPy process advances everybody by one step per env step, so
+        populations of 100k people stay interactive.
+        The walk / stop / popular place behaviour is the same as Person.activate:
+        1. Pick a target (a popular place or a random nearby location)
+        2. Walk towards it one step per env step, infecting people nearby while walking
+        3. Stop there for a random number of steps below stop_duration
+    """
+
+    # names of the arrays holding one value per person
+    person_arrays = ("ids", "positions", "targets", "walk_speed", "walking", "stop_left",
+                     "infected", "time_infected", "num_infected")
+    # scalar attributes saved in snapshots
+    snapshot_attributes = ("infect_range", "infect_probability", "walk_range", "stop_duration",
+                           "popular_place_probability", "initial_infected_percent",
+                           "rt_window", "total_infected")
+
+    def __init__(self, position, env: simpy.Environment, no_of_people=60, popular_places=None,
+                 seed=None, first_id=0):
+        self.position = position  # defines boundaries of the community
+        self.env = env  # SimPy environment
+        self.rng = np.random.default_rng(seed)
+        (start_x, end_x), (start_y, end_y) = position
+
+        if not popular_places:
+            popular_places = []
+        self.popular_places = popular_places
+        self._popular_places = np.array(popular_places, dtype=float).reshape(-1, 2)
+
+        self.count = no_of_people
+
+        # parameters shared by all the people, same defaults as Person
+        self.infect_range = 2
+        self.infect_probability = 0.01
+        self.walk_range = 5
+        self.stop_duration = 25
+        self.popular_place_probability = 0.3
+
+        # per person state
+        # ids stay the same when people travel, communities of one world get their own
+        # ranges (first_id) so that the infection logs stay unambiguous
+        self.ids = np.arange(first_id, first_id + no_of_people)
+        self.positions = np.column_stack((self.rng.uniform(start_x, end_x, no_of_people),
+                                          self.rng.uniform(start_y, end_y, no_of_people)))
+        self.targets = self.positions.copy()
+        self.walk_speed = self.rng.random(no_of_people) * WALK_SPEED
+        self.walking = np.zeros(no_of_people, dtype=bool)
+        self.stop_left = np.zeros(no_of_people, dtype=np.int64)  # steps left to stay stopped
+        self.infected = np.zeros(no_of_people, dtype=bool)
+        self.time_infected = np.full(no_of_people, -1.0)  # Invalid means not infected
+        self.num_infected = np.zeros(no_of_people, dtype=np.int64)
+
+        self.initial_infected_percent = 0.05
+        initial = self.rng.random(no_of_people) < self.initial_infected_percent
+        self.infected[initial] = True
+        self.time_infected[initial] = env.now
+        # every infection is logged, total_infected is the running count of infected people
+        self.infection_log = InfectionLog(start=env.now)
+        self.infection_log.extend(env.now, SEED_INFECTOR, self.ids[initial])
+        self.total_infected = int(initial.sum())
+        self.rt_window = RT_WINDOW
+        self.process = None  # the single SimPy process driving everybody
+
+    def _choose_targets(self, people):
+        """Pick the next target for the given people (indices), like Person.wander"""
+        (start_x, end_x), (start_y, end_y) = self.position
+        cur = self.positions[people]
+        # go to random location in community
+        new = cur + self.rng.uniform(0, self.walk_range, cur.shape)
+        # Try to move within the correct boundaries
+        outside = ((new[:, 0] < start_x) | (new[:, 0] > end_x)
+                   | (new[:, 1] < start_y) | (new[:, 1] > end_y))
+        while outside.any():
+            new[outside] = cur[outside] + self.rng.uniform(-self.walk_range, self.walk_range+1,
+                                                           (int(outside.sum()), 2))
+            outside = ((new[:, 0] < start_x) | (new[:, 0] > end_x)
+                       | (new[:, 1] < start_y) | (new[:, 1] > end_y))
+        if len(self._popular_places):
+            # go to one of popular places
+            popular = self.rng.random(len(people)) < self.popular_place_probability
+            choices = self.rng.integers(len(self._popular_places), size=int(popular.sum()))
+            new[popular] = self._popular_places[choices]
+        self.targets[people] = new
+
+    def _spread(self, spreaders):
+        """Every spreader infects each person in the spatial hash cells around it with
+        infect_probability, the contacts of Community (see cell_cover_pairs)"""
+        susceptible = np.flatnonzero(~self.infected)
+        infector, infectee = cell_cover_pairs(self.positions[spreaders],
+                                              self.positions[susceptible],
+                                              self.infect_range)
+        success = self.rng.random(len(infector)) < self.infect_probability
+        infector = spreaders[infector[success]]
+        infectee = susceptible[infectee[success]]
+        # somebody can only be infected once, the first successful contact gets the credit
+        infectee, first = np.unique(infectee, return_index=True)
+        self.infected[infectee] = True
+        self.time_infected[infectee] = self.env.now
+        np.add.at(self.num_infected, infector[first], 1)
+        self.infection_log.extend(self.env.now, self.ids[infector[first]], self.ids[infectee])
+        self.total_infected += len(infectee)
+
+    def step(self):
+        """Advance every person by one env step"""
+        clock = instrument.enabled and time.perf_counter()
+        close = np.abs(self.targets - self.positions) < CLOSE_ENOUGH_THRESHOLD
+        # people that reached their target stop wandering
+        arrived = self.walking & close.all(axis=1)
+        self.walking[arrived] = False
+        self.stop_left[arrived] = self.rng.integers(int(self.stop_duration),
+                                                    size=int(arrived.sum()))
+        # people done stopping start wandering again
+        ready = np.flatnonzero(~self.walking & (self.stop_left <= 0))
+        if len(ready):
+            self._choose_targets(ready)
+            self.walking[ready] = True
+            close[ready] = np.abs(self.targets[ready] - self.positions[ready]) \
+                < CLOSE_ENOUGH_THRESHOLD
+
+        moving = self.walking & ~close.all(axis=1)
+        if clock:
+            clock = instrument.lap("movement", clock)
+        # infected people do a spatial search from where they are before moving
+        spreaders = np.flatnonzero(moving & self.infected)
+        if len(spreaders):
+            self._spread(spreaders)
+        if clock:
+            clock = instrument.lap("infection_search", clock)
+        # move slowly to target (not just teleport to it)
+        direction = np.sign(self.targets - self.positions) * ~close
+        self.positions += direction * (self.walk_speed * moving)[:, None]
+        self.stop_left[~self.walking] -= 1
+        if clock:
+            instrument.lap("movement", clock)
+
+    def save_snapshot(self, path):
+        """Saves the whole state (people, parameters, infection log, RNG state and env.now)
+        to an uncompressed .npz file, see load_snapshot
+        """
+        log = self.infection_log
+        np.savez(path,
+                 now=self.env.now,
+                 boundaries=np.array(self.position, dtype=float),
+                 popular_places=self._popular_places,
+                 rng_state=json.dumps(self.rng.bit_generator.state),
+                 log_start=log.start,
+                 log_time=log.times[:log.count],
+                 log_infector=log.infectors[:log.count],
+                 log_infectee=log.infectees[:log.count],
+                 **{"attribute_" + name: getattr(self, name) for name in self.snapshot_attributes},
+                 **{name: getattr(self, name) for name in self.person_arrays})
+
+    @classmethod
+    def load_snapshot(cls, path, env=None):
+        """Restores a community saved by save_snapshot. Without env a new SimPy environment
+        starting at the saved env.now is made. Call activate() to continue the run, it goes
+        on exactly like the saved community would have.
+        """
+        with np.load(path) as snapshot:
+            now = snapshot["now"].item()
+            if env is None:
+                env = simpy.Environment(initial_time=now)
+            elif env.now != now:
+                raise ValueError("Snapshot was taken at {}, env is at {}".format(now, env.now))
+            boundaries = tuple(tuple(limits) for limits in snapshot["boundaries"].tolist())
+            popular_places = [tuple(place) for place in snapshot["popular_places"].tolist()]
+            community = cls(boundaries, env, no_of_people=0, popular_places=popular_places)
+            for name in cls.snapshot_attributes:
+                setattr(community, name, snapshot["attribute_" + name].item())
+            for name in cls.person_arrays:
+                setattr(community, name, snapshot[name])
+            community.count = len(community.ids)
+            community.infection_log = InfectionLog(capacity=max(1024, len(snapshot["log_time"])),
+                                                   start=snapshot["log_start"].item())
+            community.infection_log.extend(snapshot["log_time"], snapshot["log_infector"],
+                                           snapshot["log_infectee"])
+            community.rng.bit_generator.state = json.loads(snapshot["rng_state"].item())
+        return community
+
+    def remove_people(self, people):
+        """Removes the given people (indices) from the community, e.g. when travelling.
+        Returns their state as a dict of arrays that add_people accepts.
+        """
+        keep = np.ones(self.count, dtype=bool)
+        keep[people] = False
+        removed = {}
+        for name in self.person_arrays:
+            values = getattr(self, name)
+            removed[name] = values[~keep]
+            setattr(self, name, values[keep])
+        self.count = int(keep.sum())
+        self.total_infected -= int(removed["infected"].sum())
+        return removed
+
+    def add_people(self, people):
+        """Adds people (dict of arrays from remove_people) at random places in the community.
+        They arrive stopped and pick a target on the next step.
+        """
+        (start_x, end_x), (start_y, end_y) = self.position
+        num_people = len(people["infected"])
+        arrivals = dict(people)
+        arrivals["positions"] = np.column_stack((self.rng.uniform(start_x, end_x, num_people),
+                                                 self.rng.uniform(start_y, end_y, num_people)))
+        arrivals["targets"] = arrivals["positions"].copy()
+        arrivals["walking"] = np.zeros(num_people, dtype=bool)
+        arrivals["stop_left"] = np.zeros(num_people, dtype=np.int64)
+        for name in self.person_arrays:
+            setattr(self, name, np.concatenate((getattr(self, name), arrivals[name])))
+        self.count += num_people
+        self.total_infected += int(arrivals["infected"].sum())
+
+    def run(self):
+        """SimPy process advancing the whole population once per step"""
+        while True:
+            self.step()
+            clock = instrument.enabled and time.perf_counter()
+            step = self.env.timeout(1)
+            if clock:
+                instrument.lap("event_scheduling", clock)
+            yield step
+
+    def get_all_positions_colors(self, normal_color, infected_color, nparray_to_fill=None):
+        """Get positions of all people in the form of two separate x and y lists.
+        This is a helper function for plotting.
+        """
+        clock = instrument.enabled and time.perf_counter()
+        if nparray_to_fill is None or len(nparray_to_fill) != self.count:
+            data = np.empty((self.count, 3))  # initialise data array (size changes with travel)
+        else:
+            data = nparray_to_fill  # use data array if given
+        data[:, 0:2] = self.positions
+        data[:, 2] = np.where(self.infected, infected_color, normal_color)
+        # effective reproduction number over the last rt_window steps
+        r_value = self.infection_log.reproduction_number(self.env.now, self.rt_window)
+        # calculate percent of infected people
+        infected_percent = 100 * float(self.total_infected)/self.count if self.count else 0.0
+        if clock:
+            instrument.lap("stats", clock)
+        return data, r_value, infected_percent
+
+    def set_people_attribute(self, attr_name, value):
+        """Sets an attribute for all people in the population"""
+        current = getattr(self, attr_name, None)
+        if isinstance(current, np.ndarray):
+            current[:] = value
+        else:
+            setattr(self, attr_name, value)
+
+    def activate(self):
+        """Activates all the people in this community. This will not lock the thread.
+        """
+        self.process = self.env.process(self.run())
+        return [self.process]
@@ -0,0 +1,187 @@
+""" Rolling-origin backtest of the SIR (sir.py) and Prophet (forecasting.py) forecasts.
+    For every region and every cutoff day, the models are fitted on the days before the
+    cutoff only and forecast the active cases of the next horizon days, which are compared
+    to what happened. A naive forecast (the last known value) is scored as a baseline.
+
+        python backtest.py Morocco Tunisia Algeria
+
+    The fits run in a process pool. Every fitted model (SIR's beta and gamma, Prophet's
+    JSON) is cached on disk, keyed by the model, its settings and a hash of the days it was
+    fitted on, so fits shared between backtests (other horizons, other sets of regions, a
+    run on data with new days) are not redone, only their forecasts are computed again.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import hashlib
+import json
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+
+import casestore
+import forecasting
+import sir
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CACHE = os.path.join(HERE, "backtest_cache")
+MODELS = ("sir", "prophet", "naive")
+INITIAL = 60  # days of the first fit
+PERIOD = 14  # days between two cutoffs
+HORIZON = 14  # days forecast after every cutoff
+# one row per (model, region, horizon day) of backtest
+SCORES_DTYPE = [("model", "U16"), ("country", "U64"), ("province", "U64"),
+                ("horizon", np.int64), ("cutoffs", np.int64), ("mae", float),
+                ("mape", float)]
+
+
+def cutoffs(days, initial=INITIAL, period=PERIOD, horizon=HORIZON):
+    """Cutoff days (number of days fitted on) leaving horizon days to compare with"""
+    return list(range(initial, days - horizon + 1, period))
+
+
+def _fit_key(model, *arrays):
+    """Cache file name of a fit: the model, its settings and the data it is fitted on"""
+    digest = hashlib.sha1(json.dumps([model, sir.STEPS_PER_DAY,
+                                      forecasting.SETTINGS]).encode())
+    for array in arrays:
+        digest.update(np.ascontiguousarray(array).tobytes())
+    return digest.hexdigest() + ".json"
+
+
+def _forecast(job):
+    """Worker fitting one model on the days before a cutoff (unless fitted, the cached
+    fit, is given), needs to be at module level to be picklable.
+    Returns (the fit, the forecast of the active cases of the next horizon days)."""
+    model, horizon, dates, active, recovered, s_0, fitted = job
+    i_0, r_0 = max(active[0], 1), max(recovered[0], 0)
+    if model == "sir":
+        if fitted is None:
+            fitted = sir.fit(active, recovered, s_0, i_0, r_0).x.tolist()
+        beta, gamma = fitted
+        y = sir.integrate(beta, gamma, s_0, i_0, r_0, len(active) + horizon)
+        return fitted, y[len(active):, 1].tolist()
+    if model == "prophet":
+        if fitted is None:
+            fitted, forecast = forecasting.fit_forecast(dates, active, periods=horizon)
+        else:
+            forecast = forecasting.predict(forecasting.load_model(fitted), horizon)
+        return fitted, forecast["yhat"][len(active):]
+    raise ValueError("Unknown model: {}".format(model))
+
+
+def backtest(regions=None, store=None, models=MODELS, start_date='3/26/20', initial=INITIAL,
+             period=PERIOD, horizon=HORIZON, cache=DEFAULT_CACHE, processes=None,
+             chunksize=4):
+    """Scores the forecasts of the models for the regions (see sir.load_regions) at every
+    cutoff of cutoffs().
+
+    Returns a table (NumPy structured array, SCORES_DTYPE) with a row per model, region and
+    horizon day (1 is the day after the cutoff): the mean absolute error and the mean
+    absolute percentage error (over the cutoffs, days without active cases left out).
+    """
+    if store is None:
+        store = casestore.load()
+    keys, active, recovered = sir.load_regions(store, start_date, regions)
+    confirmed = store.open("confirmed")
+    start = datetime.strptime(start_date, '%m/%d/%y').date()
+    dates = confirmed.dates[confirmed.date_slice(start)]
+    days = cutoffs(len(dates), initial, period, horizon)
+    if cache is not None:
+        os.makedirs(cache, exist_ok=True)
+
+    # forecasts[model][region, cutoff, horizon day]
+    forecasts = {model: np.full((len(keys), len(days), horizon), np.nan) for model in models}
+    jobs, pending = [], []
+    for column in range(len(keys)):
+        for index, cutoff in enumerate(days):
+            if "naive" in forecasts:
+                forecasts["naive"][column, index] = active[cutoff - 1, column]
+            # susceptible population known at the cutoff, like sir.fit_regions
+            s_0 = max(2 * (active[:cutoff, column] + recovered[:cutoff, column]).max(),
+                      sir.MIN_SUSCEPTIBLE)
+            for model in models:
+                if model == "naive":
+                    continue
+                path, fitted = None, None
+                if cache is not None:
+                    path = os.path.join(cache, _fit_key(
+                        model, dates[:cutoff], active[:cutoff, column],
+                        recovered[:cutoff, column] if model == "sir" else []))
+                    if os.path.exists(path):
+                        with open(path) as cached:
+                            fitted = json.load(cached)
+                job = (model, horizon, dates[:cutoff], active[:cutoff, column],
+                       recovered[:cutoff, column], s_0, fitted)
+                if fitted is not None and model == "sir":
+                    # integrating a cached fit is cheaper than sending it to a process
+                    forecasts[model][column, index] = _forecast(job)[1]
+                    continue
+                jobs.append(job)
+                pending.append((model, column, index, None if fitted is not None else path))
+
+    if jobs:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            results = list(executor.map(_forecast, jobs, chunksize=chunksize))
+        for (model, column, index, path), (fitted, forecast) in zip(pending, results):
+            forecasts[model][column, index] = forecast
+            if path is not None:
+                with open(path, "w") as cached:
+                    json.dump(fitted, cached)
+
+    # actual[region, cutoff, horizon day]
+    actual = np.empty((len(keys), 0, horizon))
+    if days:
+        actual = np.stack([active[cutoff:cutoff + horizon] for cutoff in days]).transpose(2, 0, 1)
+    table = np.zeros(len(models) * len(keys) * horizon, dtype=SCORES_DTYPE)
+    for index, model in enumerate(models):
+        rows = slice(index * len(keys) * horizon, (index + 1) * len(keys) * horizon)
+        errors = np.abs(forecasts[model] - actual)
+        with np.errstate(invalid="ignore", divide="ignore"), warnings.catch_warnings():
+            # regions without active cases have no percentage error
+            warnings.simplefilter("ignore", RuntimeWarning)
+            percent = np.where(actual > 0, 100 * errors / actual, np.nan)
+            table["mae"][rows] = np.nanmean(errors, axis=1).ravel()
+            table["mape"][rows] = np.nanmean(percent, axis=1).ravel()
+        table["model"][rows] = model
+        table["country"][rows] = np.repeat([country for country, _ in keys], horizon)
+        table["province"][rows] = np.repeat([province for _, province in keys], horizon)
+        table["horizon"][rows] = np.tile(np.arange(1, horizon + 1), len(keys))
+        table["cutoffs"][rows] = len(days)
+    return table
+
+
+def summary(table, horizons=(1, 7, 14)):
+    """Text table comparing the models: median over the regions of their MAPE at some
+    horizon days"""
+    models = list(dict.fromkeys(table["model"]))
+    horizons = [horizon for horizon in horizons if horizon <= table["horizon"].max()]
+    lines = ["{:10s}".format("MAPE (%)") + "".join("{:>10s}".format("day {}".format(horizon))
+                                                   for horizon in horizons)]
+    for model in models:
+        cells = []
+        for horizon in horizons:
+            values = table["mape"][(table["model"] == model) & (table["horizon"] == horizon)]
+            values = values[~np.isnan(values)]
+            cells.append("{:10.1f}".format(np.median(values)) if len(values)
+                         else "{:>10s}".format("-"))
+        lines.append("{:10s}".format(model) + "".join(cells))
+    return "\n".join(lines)
+
+
+def main(argv):
+    """python backtest.py [country ...]
+    Backtests every model on the countries given (all regions by default).
+    """
+    begin = time.perf_counter()
+    table = backtest(argv or None)
+    print("{} regions backtested in {:.1f} s".format(
+        len(set(zip(table["country"], table["province"]))), time.perf_counter() - begin))
+    print(summary(table))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
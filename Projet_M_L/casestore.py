@@ -0,0 +1,253 @@
+""" Columnar on-disk store of the case time series.
+    Every series (confirmed, deaths, recovered, morocco) is a dense int32 matrix with one
+    row per date and one column per country (or per column of dataset_morocco.csv),
+    kept in a raw binary file next to a small JSON index of the countries and dates.
+    Rows are dates so new days are appended at the end of the file, without rewriting it,
+    and loads are memory maps: taking a country or a date range reads only that part.
+
+        python casestore.py store           # ingest (or update) the CSVs of this project
+        python casestore.py store Morocco   # print the series of one country
+
+        store = CaseStore("store")
+        confirmed = store.open("confirmed")
+        confirmed.country("Morocco", start="2020-03-26")
+"""
+import csv
+from datetime import datetime
+import json
+import os
+import sys
+
+import numpy as np
+
+MISSING = -1  # value of the empty cells (dataset_morocco.csv has some)
+DTYPE = np.dtype("<i4")
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# series name -> (CSV file, layout), the files of this project
+SOURCES = {
+    "confirmed": (os.path.join(HERE, "sir_model_data", "Confirmed.csv"), "wide"),
+    "deaths": (os.path.join(HERE, "sir_model_data", "deaths.csv"), "wide"),
+    "recovered": (os.path.join(HERE, "sir_model_data", "recovred.csv"), "wide"),
+    "morocco": (os.path.join(HERE, "Prophet_data", "dataset_morocco.csv"), "long"),
+}
+DEFAULT_PATH = os.path.join(HERE, "case_store")  # store used by the models of the project
+
+
+def _to_int(cell):
+    return int(float(cell)) if cell.strip() else MISSING
+
+
+def read_wide_csv(path):
+    """Reads a JHU style CSV (Province/State, Country/Region, Lat, Long, then one column
+    per date). Returns (keys, dates, values): keys are (country, province) tuples, dates
+    a datetime64[D] array and values a (dates, keys) int32 matrix.
+    """
+    with open(path, newline="", encoding="utf-8-sig") as csv_file:
+        rows = csv.reader(csv_file)
+        header = next(rows)
+        dates = np.array([datetime.strptime(date, "%m/%d/%y").date() for date in header[4:]],
+                         dtype="datetime64[D]")
+        keys, columns = [], []
+        for row in rows:
+            if not row:
+                continue
+            keys.append((row[1], row[0]))
+            columns.append([_to_int(cell) for cell in row[4:]])
+    return keys, dates, np.array(columns, dtype=DTYPE).reshape(len(keys), len(dates)).T
+
+
+def read_long_csv(path):
+    """Reads a CSV with one row per date (Date as dd/mm/YYYY) and one column per series,
+    like dataset_morocco.csv. Returns (keys, dates, values) like read_wide_csv, the keys
+    are (column name, "") tuples.
+    """
+    with open(path, newline="", encoding="utf-8-sig") as csv_file:
+        rows = csv.reader(csv_file)
+        header = next(rows)
+        dates, values = [], []
+        for row in rows:
+            if not row:
+                continue
+            dates.append(datetime.strptime(row[0], "%d/%m/%Y").date())
+            values.append([_to_int(cell) for cell in row[1:]])
+    keys = [(name, "") for name in header[1:]]
+    return keys, np.array(dates, dtype="datetime64[D]"), \
+        np.array(values, dtype=DTYPE).reshape(len(dates), len(keys))
+
+
+class Series:
+    """
+    Memory mapped series of the store
+
+    values[date, key] is the count of a key (country, province) at a date, MISSING when
+    unknown. country() and select() give the time series of one key.
+    """
+    def __init__(self, path, index):
+        self.path = path
+        self.keys = [tuple(key) for key in index["keys"]]
+        self.dates = np.array(index["dates"], dtype="datetime64[D]")
+        self.version = index["version"]  # increases with every ingest that changes data
+        self._columns = {}
+        for column, (country, province) in enumerate(self.keys):
+            self._columns.setdefault((country, province), column)
+        if len(self.dates) and self.keys:
+            self.values = np.memmap(path, dtype=DTYPE, mode="r",
+                                    shape=(len(self.dates), len(self.keys)))
+        else:
+            self.values = np.zeros((len(self.dates), len(self.keys)), dtype=DTYPE)
+
+    @property
+    def countries(self):
+        return sorted({country for country, _ in self.keys})
+
+    def column(self, country, province=None):
+        """Column of a country. Without province, the row of the whole country (empty
+        province) when there is one, else its first province.
+        """
+        if province is not None:
+            return self._columns[(country, province)]
+        if (country, "") in self._columns:
+            return self._columns[(country, "")]
+        for column, (key_country, _) in enumerate(self.keys):
+            if key_country == country:
+                return column
+        raise KeyError(country)
+
+    def date_slice(self, start=None, end=None):
+        """Rows of the dates from start to end (both included, ISO strings or dates)"""
+        first, last = 0, len(self.dates)
+        if start is not None:
+            first = int(np.searchsorted(self.dates, np.datetime64(start, "D")))
+        if end is not None:
+            last = int(np.searchsorted(self.dates, np.datetime64(end, "D"), side="right"))
+        return slice(first, last)
+
+    def country(self, country, province=None, start=None, end=None):
+        """(dates, values) of one country between start and end, values is a view of the
+        memory map (no copy)"""
+        rows = self.date_slice(start, end)
+        return self.dates[rows], self.values[rows, self.column(country, province)]
+
+    def select(self, countries, start=None, end=None):
+        """(dates, values) of several countries, values is a (dates, countries) array"""
+        rows = self.date_slice(start, end)
+        columns = [self.column(country) for country in countries]
+        return self.dates[rows], self.values[rows][:, columns]
+
+    def to_pandas(self, country, province=None, start=None, end=None):
+        """The series of one country as a pandas Series indexed by m/d/yy strings, like
+        the rows the SIR notebook reads from the CSVs"""
+        import pandas as pd
+        dates, values = self.country(country, province, start, end)
+        index = ["{}/{}/{}".format(date.month, date.day, date.year % 100)
+                 for date in dates.astype(object)]
+        return pd.Series(np.array(values), index=index, name=country)
+
+
+class CaseStore:
+    """
+    Directory holding one values file (<name>.i32) and one index (<name>.json) per series
+    """
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _paths(self, name):
+        return (os.path.join(self.path, name + ".i32"), os.path.join(self.path, name + ".json"))
+
+    def _read_index(self, name):
+        index_path = self._paths(name)[1]
+        if not os.path.exists(index_path):
+            return None
+        with open(index_path) as index_file:
+            return json.load(index_file)
+
+    def _write_index(self, name, index):
+        index_path = self._paths(name)[1]
+        with open(index_path + ".tmp", "w") as index_file:
+            json.dump(index, index_file)
+        os.replace(index_path + ".tmp", index_path)
+
+    def names(self):
+        return sorted(entry[:-5] for entry in os.listdir(self.path) if entry.endswith(".json"))
+
+    def open(self, name):
+        index = self._read_index(name)
+        if index is None:
+            raise KeyError("No series {} in {}".format(name, self.path))
+        return Series(self._paths(name)[0], index)
+
+    def append(self, name, keys, dates, values):
+        """Adds the dates after the last stored one to a series. The values file is only
+        appended to, unless the keys changed (then the series is written again).
+        Returns the number of dates added.
+        """
+        values_path, _ = self._paths(name)
+        keys = [tuple(key) for key in keys]
+        dates = np.asarray(dates, dtype="datetime64[D]")
+        index = self._read_index(name)
+        if index is None or [tuple(key) for key in index["keys"]] != keys:
+            # new series or new countries: rewrite everything
+            np.ascontiguousarray(values, dtype=DTYPE).tofile(values_path)
+            self._write_index(name, {"keys": keys,
+                                     "dates": [str(date) for date in dates],
+                                     "version": (index or {"version": 0})["version"] + 1})
+            return len(dates)
+
+        stored = len(index["dates"])
+        last = np.datetime64(index["dates"][-1], "D") if stored else None
+        new = dates > last if stored else np.ones(len(dates), dtype=bool)
+        if not new.any():
+            return 0
+        row_size = len(keys) * DTYPE.itemsize
+        with open(values_path, "r+b") as values_file:
+            # drop rows of an interrupted append (written but not in the index)
+            values_file.truncate(stored * row_size)
+            values_file.seek(stored * row_size)
+            values_file.write(np.ascontiguousarray(values[new], dtype=DTYPE).tobytes())
+        index["dates"].extend(str(date) for date in dates[new])
+        index["version"] += 1
+        self._write_index(name, index)
+        return int(new.sum())
+
+    def ingest(self, name, csv_path, layout="wide"):
+        """Reads a CSV (layout "wide": JHU style, "long": dataset_morocco.csv style) and
+        appends its new days to the series name. Returns the number of dates added."""
+        reader = read_wide_csv if layout == "wide" else read_long_csv
+        return self.append(name, *reader(csv_path))
+
+    def ingest_all(self, sources=None):
+        """Ingests every source (SOURCES by default), returns {name: dates added}"""
+        sources = SOURCES if sources is None else sources
+        return {name: self.ingest(name, csv_path, layout)
+                for name, (csv_path, layout) in sources.items()}
+
+
+def load(path=DEFAULT_PATH):
+    """The CaseStore at path, updated with the new days of the CSVs of this project"""
+    store = CaseStore(path)
+    store.ingest_all()
+    return store
+
+
+def main(argv):
+    if not argv:
+        print(__doc__)
+        return 1
+    store = CaseStore(argv[0])
+    if len(argv) == 1:
+        for name, added in store.ingest_all().items():
+            print("{}: {} new dates".format(name, added))
+        return 0
+    for name in store.names():
+        try:
+            dates, values = store.open(name).country(argv[1])
+        except KeyError:
+            continue
+        print(name, dict(zip((str(date) for date in dates[-10:]), values[-10:].tolist())))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,250 @@
+""" Prophet forecasts of the Moroccan series of dataset_morocco.csv, national and regional.
+    Analyse&prediction.ipynb fits one model after the other (m, m1, m2) for the confirmed
+    cases, new cases and deaths. Here one model per (series, region) is fitted in a process
+    pool, and models and forecasts are cached on disk, by (series, region) and settings:
+        - same data and settings: the cached model is used, its forecast is returned when
+          the same number of days was asked before and computed from it otherwise
+        - new days after the cached ones: the model is fitted again starting from the
+          parameters of the cached one (warm start)
+        - otherwise the model is fitted from scratch
+
+        forecasts = forecast_all(periods=10)
+        forecasts[("Confirmed", "Morocco")][["ds", "yhat", "yhat_lower", "yhat_upper"]]
+
+    Prophet (or fbprophet, the name of older versions) is only imported by the processes
+    fitting models.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import casestore
+import metrics
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CACHE = os.path.join(HERE, "forecast_cache")
+NATIONAL = "Morocco"  # region of the national series
+# columns of dataset_morocco.csv which are not regions
+NOT_REGIONS = ("Confirmed", "Deaths", "Recovered", "Excluded")
+SETTINGS = {"interval_width": 0.95}  # Prophet arguments of the notebook
+PERIODS = 10  # days forecast
+FORECAST_COLUMNS = ("yhat", "yhat_lower", "yhat_upper")
+
+last_run = {}  # {"cached", "warm", "cold"} number of series of the last forecast_all
+
+
+def _prophet():
+    try:
+        from prophet import Prophet
+    except ImportError:
+        from fbprophet import Prophet
+    return Prophet
+
+
+def _serialize():
+    try:
+        from prophet import serialize
+    except ImportError:
+        from fbprophet import serialize
+    return serialize
+
+
+def load_series(store=None):
+    """{(series, region): (dates, values)} of the national series (and their new cases) and
+    of the confirmed cases of every region. Days without a value are left out.
+    """
+    if store is None:
+        store = casestore.load()
+    morocco = store.open("morocco")
+    series = {}
+    for name, _ in morocco.keys:
+        if name == "Excluded":
+            continue
+        dates, values = morocco.country(name)
+        known = values != casestore.MISSING
+        key = (name, NATIONAL) if name in NOT_REGIONS else ("Confirmed", name)
+        series[key] = (dates[known], np.array(values[known], dtype=float))
+        if name == "Confirmed":
+            series[("new_cases", NATIONAL)] = (dates[known], metrics.deltas(values[known]))
+    return series
+
+
+def data_hash(dates, values):
+    """Hash of a series, identifies the data a model was fitted on"""
+    digest = hashlib.sha1(np.asarray(dates, dtype="datetime64[D]").tobytes())
+    digest.update(np.asarray(values, dtype=float).tobytes())
+    return digest.hexdigest()
+
+
+def _entry_name(key, settings):
+    """Cache file of a (series, region) model with some settings, and of its forecasts"""
+    description = json.dumps([list(key), settings], sort_keys=True)
+    return hashlib.sha1(description.encode()).hexdigest() + ".json"
+
+
+def _stan_init(model):
+    """Parameters of a fitted model, to start the next fit from (Prophet's warm start)"""
+    return {"k": float(model.params["k"][0][0]),
+            "m": float(model.params["m"][0][0]),
+            "sigma_obs": float(model.params["sigma_obs"][0][0]),
+            "delta": model.params["delta"][0],
+            "beta": model.params["beta"][0]}
+
+
+def fit_model(dates, values, settings=None, init_model=None):
+    """Prophet fitted to one series, starting from the parameters of init_model (a fitted
+    model) when given"""
+    for name in ("prophet", "fbprophet", "cmdstanpy"):
+        # the Stan backend only sets up its own (verbose) logger when there is no handler
+        logger = logging.getLogger(name)
+        if not logger.handlers:
+            logger.addHandler(logging.NullHandler())
+        logger.setLevel(logging.WARNING)
+    model = _prophet()(**(SETTINGS if settings is None else settings))
+    frame = pd.DataFrame({"ds": pd.to_datetime(dates), "y": values})
+    if init_model is None:
+        model.fit(frame)
+    else:
+        model.fit(frame, init=_stan_init(init_model))
+    return model
+
+
+def predict(model, periods=PERIODS):
+    """{"ds": [dates], "yhat": [...], ...} of a fitted model, the history followed by
+    periods days of forecast"""
+    prediction = model.predict(model.make_future_dataframe(periods=periods))
+    forecast = {"ds": [str(date.date()) for date in prediction["ds"]]}
+    for column in FORECAST_COLUMNS:
+        forecast[column] = prediction[column].tolist()
+    return forecast
+
+
+def load_model(model_json):
+    """Fitted model from its JSON (see fit_forecast)"""
+    return _serialize().model_from_json(model_json)
+
+
+def fit_forecast(dates, values, settings=None, periods=PERIODS, cached_model=None):
+    """Fits Prophet to one series and forecasts it periods days ahead, starting from the
+    parameters of cached_model (a model saved as JSON) when given.
+    Returns (the fitted model as JSON, {"ds": [dates], "yhat": [...], ...}).
+    """
+    init_model = None if cached_model is None else load_model(cached_model)
+    model = fit_model(dates, values, settings, init_model)
+    return _serialize().model_to_json(model), predict(model, periods)
+
+
+def _fit(job):
+    """Worker for forecast_all, needs to be at module level to be picklable"""
+    return fit_forecast(*job)
+
+
+def _predict(job):
+    """Worker for forecast_all, forecast of a cached model (as JSON) periods days ahead"""
+    model, periods = job
+    return predict(load_model(model), periods)
+
+
+def _read_entry(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as entry_file:
+        return json.load(entry_file)
+
+
+def _write_entry(path, entry):
+    with open(path + ".tmp", "w") as entry_file:
+        json.dump(entry, entry_file)
+    os.replace(path + ".tmp", path)
+
+
+def _to_frame(forecast):
+    frame = pd.DataFrame(forecast)
+    frame["ds"] = pd.to_datetime(frame["ds"])
+    return frame
+
+
+def forecast_all(keys=None, store=None, periods=PERIODS, settings=None, cache=DEFAULT_CACHE,
+                 processes=None):
+    """Forecasts every series of load_series (or the (series, region) keys given) periods
+    days ahead, fitting the models that are not cached in a process pool.
+
+    Returns {(series, region): DataFrame with the columns ds, yhat, yhat_lower and
+    yhat_upper}, the history followed by the forecast like Prophet.predict.
+    """
+    settings = dict(SETTINGS if settings is None else settings)
+    series = load_series(store)
+    if keys is not None:
+        series = {key: series[tuple(key)] for key in keys}
+    os.makedirs(cache, exist_ok=True)
+
+    forecasts = {}
+    jobs, pending = [], []
+    predictions, predicted = [], []  # cached models forecasting a new number of days
+    run = {"cached": 0, "warm": 0, "cold": 0}
+    for key, (dates, values) in series.items():
+        path = os.path.join(cache, _entry_name(key, settings))
+        entry = _read_entry(path)
+        digest = data_hash(dates, values)
+        if entry is not None and entry["data_hash"] == digest:
+            run["cached"] += 1
+            if str(periods) in entry["forecasts"]:
+                forecasts[key] = _to_frame(entry["forecasts"][str(periods)])
+            else:
+                predictions.append((entry["model"], periods))
+                predicted.append((key, path, entry))
+            continue
+        cached_model = None
+        if entry is not None and entry["days"] < len(dates):
+            days = entry["days"]
+            if data_hash(dates[:days], values[:days]) == entry["data_hash"]:
+                # only new trailing days, start from the cached model
+                cached_model = entry["model"]
+        run["warm" if cached_model else "cold"] += 1
+        jobs.append((dates, values, settings, periods, cached_model))
+        pending.append((key, path, digest, len(dates)))
+
+    if jobs or predictions:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            results = list(executor.map(_fit, jobs))
+            predictions = list(executor.map(_predict, predictions))
+        for (key, path, digest, days), (model, forecast) in zip(pending, results):
+            _write_entry(path, {"key": list(key), "settings": settings, "data_hash": digest,
+                                "days": days, "model": model,
+                                "forecasts": {str(periods): forecast}})
+            forecasts[key] = _to_frame(forecast)
+        for (key, path, entry), forecast in zip(predicted, predictions):
+            entry["forecasts"][str(periods)] = forecast
+            _write_entry(path, entry)
+            forecasts[key] = _to_frame(forecast)
+    last_run.clear()
+    last_run.update(run)
+    return forecasts
+
+
+def main(argv):
+    """python forecasting.py [periods]
+    Forecasts every national and regional series and prints the last forecast day.
+    """
+    periods = int(argv[0]) if argv else PERIODS
+    begin = time.perf_counter()
+    forecasts = forecast_all(periods=periods)
+    print("{} series in {:.2f} s ({})".format(len(forecasts), time.perf_counter() - begin,
+                                              last_run))
+    for (series, region), frame in sorted(forecasts.items()):
+        last = frame.iloc[-1]
+        print("{:10s} {:28s} {} {:10.0f} [{:.0f}, {:.0f}]".format(
+            series, region, last["ds"].date(), last["yhat"], last["yhat_lower"],
+            last["yhat_upper"]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
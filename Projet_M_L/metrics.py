@@ -0,0 +1,177 @@
+""" Metrics derived from the case counts, for every series at once.
+    The functions take arrays with one row per date and one column per series (or a single
+    series), missing values being NaN, and work on all the columns together:
+
+        features = global_metrics(store)      # every country of the JHU CSVs
+        features = morocco_metrics(store)     # Morocco and its regions
+        features["doubling_time"][:, features["keys"].index(("Morocco", ""))]
+
+    Gaps are either interpolated (interpolate, used for the cumulative counts) or left as
+    NaN and skipped (rolling_mean), never replaced by 0 like in Analyse&prediction.ipynb.
+"""
+import numpy as np
+
+import casestore
+
+WINDOW = 7  # days of the rolling averages, growth rates and doubling times
+
+
+def _columns(values):
+    """values as a float (dates, columns) array, and a function giving back the shape"""
+    values = np.asarray(values, dtype=float)
+    return values.reshape(len(values), -1), lambda result: result.reshape(values.shape)
+
+
+def mask_missing(values, missing=casestore.MISSING):
+    """Float copy of values with NaN where they are missing (casestore.MISSING)"""
+    values = np.array(values, dtype=float)
+    values[values == missing] = np.nan
+    return values
+
+
+def interpolate(values, leading=np.nan):
+    """Fills the gaps of every column linearly between the known values around them.
+    Values before the first known one are set to leading (0 for cumulative counts that
+    start before the first case), the ones after the last known one stay NaN.
+    """
+    values, shaped = _columns(values)
+    values = values.copy()
+    size = len(values)
+    rows = np.arange(size)[:, None]
+    known = ~np.isnan(values)
+    # last known row at or before every row, first known row at or after it
+    before = np.maximum.accumulate(np.where(known, rows, -1), axis=0)
+    after = np.minimum.accumulate(np.where(known, rows, size)[::-1], axis=0)[::-1]
+    gaps = ~known & (before >= 0) & (after < size)
+    before_values = np.take_along_axis(values, np.maximum(before, 0), axis=0)
+    after_values = np.take_along_axis(values, np.minimum(after, size - 1), axis=0)
+    weight = (rows - before) / np.maximum(after - before, 1)
+    values[gaps] = (before_values + weight * (after_values - before_values))[gaps]
+    values[before < 0] = leading
+    return shaped(values)
+
+
+def deltas(cumulative, clip=True):
+    """Daily increases of cumulative counts, 0 on the first day. With clip, corrections
+    (days where the count goes down) are 0 instead of negative, like the new_cases of the
+    notebook."""
+    cumulative, shaped = _columns(cumulative)
+    result = np.zeros_like(cumulative)
+    result[1:] = np.diff(cumulative, axis=0)
+    if clip:
+        np.maximum(result, 0, out=result, where=~np.isnan(result))
+    return shaped(result)
+
+
+def rolling_mean(values, window=WINDOW):
+    """Mean of the last window days (fewer at the start), NaN skipped. NaN when the whole
+    window is missing."""
+    values, shaped = _columns(values)
+    known = ~np.isnan(values)
+    sums = np.zeros((len(values) + 1, values.shape[1]))
+    counts = np.zeros_like(sums)
+    np.cumsum(np.where(known, values, 0), axis=0, out=sums[1:])
+    np.cumsum(known, axis=0, out=counts[1:])
+    start = np.maximum(np.arange(1, len(values) + 1) - window, 0)
+    total = sums[1:] - sums[start]
+    count = counts[1:] - counts[start]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return shaped(np.where(count > 0, total / count, np.nan))
+
+
+def _ratio_over(cumulative, window):
+    """cumulative[t] / cumulative[t - window], NaN for the first days and empty counts"""
+    cumulative, shaped = _columns(cumulative)
+    ratio = np.full_like(cumulative, np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ratio[window:] = np.where(cumulative[:-window] > 0,
+                                  cumulative[window:] / cumulative[:-window], np.nan)
+    return ratio, shaped
+
+
+def growth_rate(cumulative, window=WINDOW):
+    """Average daily growth rate of cumulative counts over the last window days
+    (0.1 is 10% more cases a day)"""
+    ratio, shaped = _ratio_over(cumulative, window)
+    return shaped(ratio ** (1.0 / window) - 1)
+
+
+def doubling_time(cumulative, window=WINDOW):
+    """Days for cumulative counts to double at the growth of the last window days, inf when
+    they do not grow"""
+    ratio, shaped = _ratio_over(cumulative, window)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        days = window * np.log(2) / np.log(ratio)
+    return shaped(np.where(ratio > 1, days, np.where(np.isnan(ratio), np.nan, np.inf)))
+
+
+def percent(part, whole):
+    """100 * part / whole, NaN where whole is 0"""
+    part, whole = np.asarray(part, dtype=float), np.asarray(whole, dtype=float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(whole > 0, 100 * part / whole, np.nan)
+
+
+def derive(confirmed, deaths, recovered, excluded=None, window=WINDOW):
+    """Every metric of cumulative confirmed, deaths and recovered counts (and excluded
+    tests, when known), arrays (dates, series). Returns {name: array}:
+        new_cases, new_deaths, new_recovered: clipped deltas
+        new_cases_average: rolling mean of new_cases
+        active: confirmed - recovered - deaths
+        growth_rate, doubling_time: of the confirmed cases
+        mortality: deaths in % of confirmed
+        active_percent, deaths_percent, recovered_percent: breakdown of confirmed in %
+        total_tests: confirmed + excluded (with excluded only)
+    """
+    metrics = {"new_cases": deltas(confirmed),
+               "new_deaths": deltas(deaths),
+               "new_recovered": deltas(recovered),
+               "active": np.asarray(confirmed) - recovered - deaths,
+               "growth_rate": growth_rate(confirmed, window),
+               "doubling_time": doubling_time(confirmed, window)}
+    metrics["new_cases_average"] = rolling_mean(metrics["new_cases"], window)
+    metrics["mortality"] = metrics["deaths_percent"] = percent(deaths, confirmed)
+    metrics["active_percent"] = percent(metrics["active"], confirmed)
+    metrics["recovered_percent"] = percent(recovered, confirmed)
+    if excluded is not None:
+        metrics["total_tests"] = np.asarray(confirmed) + excluded
+    return metrics
+
+
+def global_metrics(store, window=WINDOW):
+    """derive for every (country, province) key found in the confirmed, deaths and recovered
+    series of the store. Also returns "keys" and "dates"."""
+    confirmed, deaths, recovered = (store.open(name)
+                                    for name in ("confirmed", "deaths", "recovered"))
+    keys = [key for key in confirmed.keys
+            if key in deaths._columns and key in recovered._columns]
+
+    def columns(series):
+        values = mask_missing(series.values[:, [series.column(*key) for key in keys]])
+        return interpolate(values, leading=0)
+    metrics = derive(columns(confirmed), columns(deaths), columns(recovered), window=window)
+    metrics["keys"], metrics["dates"] = keys, confirmed.dates
+    return metrics
+
+
+def morocco_metrics(store, window=WINDOW):
+    """derive for Morocco (dataset_morocco.csv, with the tests) and the new cases, growth
+    rates and doubling times of the confirmed cases of its regions, "regions" being their
+    names. Missing days are interpolated. Also returns "dates"."""
+    morocco = store.open("morocco")
+    names = [name for name, _ in morocco.keys]
+    values = interpolate(mask_missing(morocco.values), leading=0)
+    column = {name: values[:, index] for index, name in enumerate(names)}
+    metrics = derive(column["Confirmed"], column["Deaths"], column["Recovered"],
+                     column["Excluded"], window)
+    regions = [name for name in names
+               if name not in ("Confirmed", "Deaths", "Recovered", "Excluded")]
+    regional = values[:, [names.index(name) for name in regions]]
+    new_cases = deltas(regional)
+    metrics.update(regions=regions, dates=morocco.dates,
+                   regional_confirmed=regional,
+                   regional_new_cases=new_cases,
+                   regional_new_cases_average=rolling_mean(new_cases, window),
+                   regional_growth_rate=growth_rate(regional, window),
+                   regional_doubling_time=doubling_time(regional, window))
+    return metrics
@@ -0,0 +1,340 @@
+""" Local forecast service: the case store is loaded once and the fitted models stay in
+    memory, so forecasts are answered without running the notebooks again.
+
+        python service.py serve [port]
+        python service.py sir Morocco 30                    # SIR, 30 days after the data
+        python service.py prophet Morocco 14 --plot morocco.png
+        python service.py reload                            # ingests new days of the CSVs
+        python service.py stats
+
+    Queries and answers are JSON lines over TCP. Answers are kept in an LRU cache keyed by
+    the model, country, horizon, parameters and the versions (casestore.Series.version) of
+    the series they use, so after a reload only the countries with new data are computed
+    again. Fits are kept apart from the horizon: another horizon only extends a fitted
+    model. A model fitted again on new days starts from its previous fit (warm start).
+
+    The client only uses the standard library, matplotlib is imported when a plot is asked
+    for; the service imports the numerical modules (sir, forecasting) when it starts, and
+    Prophet (which imports the plotting libraries) with the first Prophet query.
+"""
+from collections import OrderedDict
+import json
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+PORT = 8766
+CACHE_SIZE = 256  # answers kept by the service
+MODELS = ("sir", "prophet")
+# parameters of a query and their defaults (Learner's for SIR)
+PARAMETERS = {"sir": {"start_date": '3/26/20', "s_0": 20000, "i_0": 3, "r_0": 10},
+              "prophet": {"series": "confirmed", "start_date": None}}
+
+
+class LRUCache:
+    """Mapping keeping the maxsize entries used last"""
+
+    def __init__(self, maxsize=CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        if key not in self._entries:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return self._entries[key]
+
+    def put(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _checked(model, parameters):
+    """PARAMETERS[model] overridden by parameters, the numbers as floats. Raises
+    ValueError for unknown parameters and values of the wrong type."""
+    unknown = set(parameters) - set(PARAMETERS[model])
+    if unknown:
+        raise ValueError("Unknown parameters: {}".format(", ".join(sorted(unknown))))
+    checked = dict(PARAMETERS[model], **parameters)
+    for name, value in checked.items():
+        default = PARAMETERS[model][name]
+        if isinstance(default, (int, float)):
+            try:
+                number = float(value)
+            except (TypeError, ValueError):
+                number = None
+            if number is None or not 0 <= number < float("inf"):
+                raise ValueError("{} must be a non negative number, not {!r}".format(
+                    name, value))
+            checked[name] = number
+        elif not isinstance(value, str) and not (default is None and value is None):
+            raise ValueError("{} must be a string, not {!r}".format(name, value))
+    return checked
+
+
+def _floats(values):
+    """JSON friendly list of floats, None for NaN"""
+    return [None if value != value else float(value) for value in values]
+
+
+class ForecastService:
+    """
+    Forecasts of the countries of a casestore.CaseStore (casestore.load() by default)
+
+        service = ForecastService()
+        answer = service.forecast("sir", "Morocco", 30)
+        answer["dates"], answer["infected"]
+
+    Thread safe: answers in the cache are returned right away, fits run one at a time.
+    """
+    def __init__(self, store=None, cache_size=CACHE_SIZE):
+        # the numerical modules, only the service needs them, imported now rather than by
+        # the first query. Prophet is left to the first Prophet query, it imports matplotlib
+        # and tries plotly
+        import casestore
+        import forecasting  # noqa: F401
+        import sir  # noqa: F401
+        if store is None:
+            store = casestore.load()
+        self.store = store
+        self.answers = LRUCache(cache_size)
+        self.fits = LRUCache(cache_size)  # fitted models, without horizon
+        # last fit of a model, country and parameters, whatever the data version
+        self._warm = LRUCache(cache_size)
+        self._series = {}
+        self._lock = threading.Lock()  # cache and series
+        self._fitting = threading.Lock()
+        self.stats = {"queries": 0, "cold_fits": 0, "warm_fits": 0}
+
+    def series(self, name):
+        with self._lock:
+            if name not in self._series:
+                self._series[name] = self.store.open(name)
+            return self._series[name]
+
+    def reload(self):
+        """Ingests the new days of the CSVs, returns {series: dates added}"""
+        added = self.store.ingest_all()
+        with self._lock:
+            self._series.clear()
+        return added
+
+    def forecast(self, model, country, horizon, **parameters):
+        """Forecast of a country horizon days (a non negative integer) after its last day
+        of data. parameters override PARAMETERS[model], numbers for the numbers and strings
+        for the strings, or a ValueError is raised. Returns a dict (see _sir and _prophet)."""
+        if model not in MODELS:
+            raise ValueError("Unknown model: {}".format(model))
+        if isinstance(horizon, bool) or not isinstance(horizon, int) or horizon < 0:
+            raise ValueError("horizon must be a non negative number of days, not {!r}"
+                             .format(horizon))
+        parameters = _checked(model, parameters)
+        names = ("confirmed", "recovered", "deaths") if model == "sir" \
+            else (parameters["series"],)
+        versions = tuple(self.series(name).version for name in names)
+        fit_key = (model, country, json.dumps(parameters, sort_keys=True), versions)
+        key = fit_key + (horizon,)
+        with self._lock:
+            self.stats["queries"] += 1
+            answer = self.answers.get(key)
+        if answer is not None:
+            return answer
+        with self._fitting:
+            if model == "sir":
+                answer = self._sir(fit_key, country, horizon, **parameters)
+            else:
+                answer = self._prophet(fit_key, country, horizon, **parameters)
+        with self._lock:
+            self.answers.put(key, answer)
+        return answer
+
+    def _fitted(self, fit_key, fit):
+        """Model of fit_key, fit(warm) gives it from the previous fit of the same model and
+        country on other data (or None)"""
+        fitted = self.fits.get(fit_key)
+        if fitted is None:
+            warm = self._warm.get(fit_key[:3])
+            fitted = fit(warm)
+            self.stats["warm_fits" if warm is not None else "cold_fits"] += 1
+            self.fits.put(fit_key, fitted)
+            self._warm.put(fit_key[:3], fitted)
+        return fitted
+
+    def _sir(self, fit_key, country, horizon, start_date, s_0, i_0, r_0):
+        """dates, the active and recovered data (None after the last day) and the
+        susceptible, infected and recovered of the SIR fit, beta, gamma and R0"""
+        import sir
+        learner = sir.Learner(country, start_date=start_date, s_0=s_0, i_0=i_0, r_0=r_0,
+                              store=self.store)
+        data, recovered, _ = learner.load_data()
+
+        def fit(warm):
+            # like sir.fit_regions: from the previous fit, from the grid if that got worse
+            x0, previous_loss = (None, None) if warm is None else warm
+            x, loss, *_ = sir.fit_region(data, recovered, s_0, i_0, r_0, x0, previous_loss)
+            return tuple(x), loss
+        (beta, gamma), _ = self._fitted(fit_key, fit)
+        size = len(data) + horizon
+        y = sir.integrate(beta, gamma, s_0, i_0, r_0, size)
+        return {"model": "sir", "country": country,
+                "dates": list(learner.extend_index(data.index, size)),
+                "active": _floats(data.values) + [None] * horizon,
+                "recovered_data": _floats(recovered.values) + [None] * horizon,
+                "susceptible": _floats(y[:, 0]), "infected": _floats(y[:, 1]),
+                "recovered": _floats(y[:, 2]),
+                "beta": beta, "gamma": gamma, "R0": beta * s_0 / gamma}
+
+    def _prophet(self, fit_key, country, horizon, series, start_date):
+        """dates, the data (None after the last day) and Prophet's yhat, yhat_lower and
+        yhat_upper"""
+        import casestore
+        import forecasting
+        dates, values = self.series(series).country(country, start=start_date)
+        known = values != casestore.MISSING
+        dates, values = dates[known], values[known].astype(float)
+        model = self._fitted(fit_key, lambda warm: forecasting.fit_model(
+            dates, values, init_model=warm))
+        answer = {"model": "prophet", "country": country, "series": series}
+        for name, column in forecasting.predict(model, horizon).items():
+            answer["dates" if name == "ds" else name] = \
+                column if name == "ds" else _floats(column)
+        answer[series] = _floats(values) + [None] * horizon
+        return answer
+
+    def handle(self, request):
+        """Answer (dict) to a query: {"model", "country", "horizon", "parameters"} or
+        {"command": "reload" | "stats"}"""
+        begin = time.perf_counter()
+        try:
+            if not isinstance(request, dict):
+                raise ValueError("A request must be a JSON object, not {}".format(
+                    type(request).__name__))
+            command = request.get("command")
+            if command == "reload":
+                answer = {"added": self.reload()}
+            elif command == "stats":
+                answer = dict(self.stats, answers=len(self.answers), fits=len(self.fits),
+                              hits=self.answers.hits, misses=self.answers.misses)
+            elif command is None:
+                missing = [name for name in ("model", "country") if name not in request]
+                if missing:
+                    raise ValueError("Missing in the request: {}".format(", ".join(missing)))
+                if not isinstance(request.get("parameters", {}), dict):
+                    raise ValueError("parameters must be a JSON object")
+                answer = {"forecast": self.forecast(request["model"], request["country"],
+                                                    request.get("horizon", 30),
+                                                    **request.get("parameters", {}))}
+            else:
+                raise ValueError("Unknown command: {}".format(command))
+        except KeyError as error:
+            answer = {"error": "Unknown country or series: {}".format(error)}
+        except (ValueError, TypeError, ImportError) as error:
+            answer = {"error": str(error)}
+        answer["seconds"] = time.perf_counter() - begin
+        return answer
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                answer = self.server.service.handle(json.loads(line))
+            except ValueError:
+                answer = {"error": "Invalid JSON"}
+            self.wfile.write(json.dumps(answer).encode() + b"\n")
+
+
+class ForecastServer(socketserver.ThreadingTCPServer):
+    """TCP server answering the JSON line queries of the clients with a ForecastService"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, service, host="127.0.0.1", port=PORT):
+        self.service = service
+        super().__init__((host, port), _Handler)
+
+
+def query(request, host="127.0.0.1", port=PORT, timeout=600):
+    """Sends a query (see ForecastService.handle) to the service, returns its answer"""
+    with socket.create_connection((host, port), timeout=timeout) as connection:
+        connection.sendall(json.dumps(request).encode() + b"\n")
+        with connection.makefile("rb") as answers:
+            return json.loads(answers.readline())
+
+
+def plot(forecast, path):
+    """Saves a figure of a forecast answer to path"""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    columns = ("active", "recovered_data", "infected", "recovered") \
+        if forecast["model"] == "sir" else (forecast["series"], "yhat")
+    fig, ax = plt.subplots(figsize=(15, 10))
+    ax.set_title("{} ({})".format(forecast["country"], forecast["model"]))
+    days = range(len(forecast["dates"]))
+    for column in columns:
+        ax.plot(days, [float("nan") if value is None else value
+                       for value in forecast[column]], label=column)
+    if forecast["model"] == "prophet":
+        ax.fill_between(days, forecast["yhat_lower"], forecast["yhat_upper"], alpha=0.2)
+    step = max(len(days) // 10, 1)
+    ax.set_xticks(days[::step])
+    ax.set_xticklabels(forecast["dates"][::step], rotation=45)
+    ax.legend()
+    fig.savefig(path)
+    plt.close(fig)
+
+
+def main(argv):
+    """python service.py serve [port]
+    python service.py sir|prophet country [horizon] [--plot file]
+    python service.py reload|stats"""
+    if not argv:
+        print(main.__doc__)
+        return 1
+    if argv[0] == "serve":
+        begin = time.perf_counter()
+        server = ForecastServer(ForecastService(),
+                                port=int(argv[1]) if len(argv) > 1 else PORT)
+        print("Forecast service ready on port {} in {:.1f} s".format(
+            server.server_address[1], time.perf_counter() - begin))
+        server.serve_forever()
+        return 0
+    if argv[0] in ("reload", "stats"):
+        print(query({"command": argv[0]}))
+        return 0
+    arguments = list(argv)
+    path = None
+    if "--plot" in arguments:
+        index = arguments.index("--plot")
+        path = arguments[index + 1]
+        del arguments[index:index + 2]
+    model, country = arguments[:2]
+    horizon = int(arguments[2]) if len(arguments) > 2 else 30
+    answer = query({"model": model, "country": country, "horizon": horizon})
+    if "error" in answer:
+        print(answer["error"])
+        return 1
+    forecast = answer["forecast"]
+    value = "infected" if model == "sir" else "yhat"
+    print("{} {} on {}: {:.0f} ({:.1f} ms)".format(country, value, forecast["dates"][-1],
+                                                  forecast[value][-1],
+                                                  1000 * answer["seconds"]))
+    if path:
+        plot(forecast, path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
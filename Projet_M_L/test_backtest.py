@@ -0,0 +1,49 @@
+import os
+
+import numpy as np
+import pytest
+
+import backtest
+import casestore
+import sir
+
+
+def test_cutoffs():
+    assert backtest.cutoffs(100, initial=60, period=14, horizon=14) == [60, 74]
+    assert backtest.cutoffs(70, initial=60, period=14, horizon=14) == []
+
+
+@pytest.fixture(scope="module")
+def store(tmp_path_factory):
+    store = casestore.CaseStore(str(tmp_path_factory.mktemp("store")))
+    store.ingest_all()
+    return store
+
+
+def test_naive_scores(store):
+    table = backtest.backtest(["Morocco"], store, models=("naive",), horizon=3, cache=None)
+    _, active, _ = sir.load_regions(store, regions=["Morocco"])
+    days = backtest.cutoffs(len(active), horizon=3)
+    errors = [abs(active[cutoff + 1, 0] - active[cutoff - 1, 0]) for cutoff in days]
+    row = table[table["horizon"] == 2][0]
+    assert row["cutoffs"] == len(days) and np.isclose(row["mae"], np.mean(errors))
+
+
+def test_fits_are_cached(store, tmp_path):
+    cache = str(tmp_path / "cache")
+    first = backtest.backtest(["Morocco", "Tunisia"], store, models=("sir", "naive"),
+                              horizon=5, cache=cache, processes=1)
+    assert len(os.listdir(cache)) == 2 * len(backtest.cutoffs(132, horizon=5))
+    # Morocco alone: every fit is in the cache
+    again = backtest.backtest(["Morocco"], store, models=("sir",), horizon=5, cache=cache,
+                              processes=1)
+    assert len(os.listdir(cache)) == 2 * len(backtest.cutoffs(132, horizon=5))
+    assert np.allclose(again["mae"], first[(first["model"] == "sir")
+                                           & (first["country"] == "Morocco")]["mae"])
+    assert "sir" in backtest.summary(first)
+    # another horizon only fits the cutoffs it adds
+    shorter = backtest.backtest(["Morocco"], store, models=("sir",), horizon=2, cache=cache,
+                                processes=1)
+    added = len(backtest.cutoffs(132, horizon=2)) - len(backtest.cutoffs(132, horizon=5))
+    assert len(os.listdir(cache)) == 2 * len(backtest.cutoffs(132, horizon=5)) + added
+    assert set(shorter["horizon"]) == {1, 2}
@@ -0,0 +1,49 @@
+import os
+
+import numpy as np
+
+import casestore
+
+HEADER = "Province/State,Country/Region,Lat,Long"
+
+
+def write_wide_csv(path, days):
+    dates = ["3/{}/20".format(day) for day in range(1, days + 1)]
+    with open(path, "w") as csv_file:
+        csv_file.write(",".join([HEADER] + dates) + "\n")
+        csv_file.write(",Morocco,31.8,-7.1," + ",".join(str(10 * day) for day in range(days)) + "\n")
+        csv_file.write("Hubei,China,30.9,112.2," + ",".join(str(day) for day in range(days)) + "\n")
+        csv_file.write("\n")
+
+
+def test_incremental_ingest(tmp_path):
+    store = casestore.CaseStore(str(tmp_path / "store"))
+    write_wide_csv(tmp_path / "cases.csv", 3)
+    assert store.ingest("confirmed", tmp_path / "cases.csv") == 3
+    values_path = tmp_path / "store" / "confirmed.i32"
+    assert os.path.getsize(values_path) == 3 * 2 * 4
+
+    write_wide_csv(tmp_path / "cases.csv", 5)
+    assert store.ingest("confirmed", tmp_path / "cases.csv") == 2
+    assert store.ingest("confirmed", tmp_path / "cases.csv") == 0
+    assert os.path.getsize(values_path) == 5 * 2 * 4
+
+    series = store.open("confirmed")
+    assert series.countries == ["China", "Morocco"]
+    dates, values = series.country("Morocco", start="2020-03-02")
+    assert [str(date) for date in dates] == ["2020-03-02", "2020-03-03", "2020-03-04",
+                                             "2020-03-05"]
+    assert values.tolist() == [10, 20, 30, 40]
+    assert series.select(["China", "Morocco"], end="2020-03-02")[1].tolist() == [[0, 0], [1, 10]]
+    assert series.to_pandas("China").index[-1] == "3/5/20"
+
+
+def test_long_csv_missing_values(tmp_path):
+    path = tmp_path / "morocco.csv"
+    path.write_text("﻿Date,Confirmed,Casablanca-Settat\n"
+                    "02/03/2020,1,\n03/03/2020,,4\n")
+    store = casestore.CaseStore(str(tmp_path / "store"))
+    store.ingest("morocco", path, layout="long")
+    dates, values = store.open("morocco").select(["Confirmed", "Casablanca-Settat"])
+    assert dates[0] == np.datetime64("2020-03-02")
+    assert values.tolist() == [[1, casestore.MISSING], [casestore.MISSING, 4]]
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+import casestore
+import forecasting
+
+
+def test_load_series_leaves_out_missing_days(tmp_path):
+    store = casestore.CaseStore(str(tmp_path))
+    store.ingest_all()
+    series = forecasting.load_series(store)
+    assert ("new_cases", "Morocco") in series and ("Confirmed", "Oriental") in series
+    assert ("Excluded", "Morocco") not in series
+    dates, values = series[("Confirmed", "Casablanca-Settat")]
+    assert len(dates) == len(values) and (values >= 0).all()
+    assert np.datetime64("2020-04-14") not in dates
+
+
+def test_forecast_cache_and_warm_start(tmp_path):
+    pytest.importorskip("prophet")
+    full = casestore.CaseStore(str(tmp_path / "full"))
+    full.ingest_all()
+    store = casestore.CaseStore(str(tmp_path / "store"))
+    morocco = full.open("morocco")
+    store.append("morocco", morocco.keys, morocco.dates[:-1], np.array(morocco.values[:-1]))
+    keys = [("Confirmed", "Morocco"), ("Confirmed", "Oriental")]
+    cache = str(tmp_path / "cache")
+
+    first = forecasting.forecast_all(keys, store, periods=5, cache=cache, processes=1)
+    assert forecasting.last_run == {"cached": 0, "warm": 0, "cold": 2}
+    frame = first[("Confirmed", "Morocco")]
+    assert list(frame.columns) == ["ds", "yhat", "yhat_lower", "yhat_upper"]
+    assert str(frame["ds"].iloc[-1].date()) == "2020-08-04"
+
+    again = forecasting.forecast_all(keys, store, periods=5, cache=cache, processes=1)
+    assert forecasting.last_run["cached"] == 2
+    assert np.allclose(again[("Confirmed", "Oriental")]["yhat"],
+                       first[("Confirmed", "Oriental")]["yhat"])
+
+    # another horizon reuses the cached models, without fitting again
+    longer = forecasting.forecast_all(keys, store, periods=8, cache=cache, processes=1)
+    assert forecasting.last_run == {"cached": 2, "warm": 0, "cold": 0}
+    assert str(longer[("Confirmed", "Morocco")]["ds"].iloc[-1].date()) == "2020-08-07"
+    oriental = first[("Confirmed", "Oriental")]
+    assert np.allclose(longer[("Confirmed", "Oriental")]["yhat"][:len(oriental)],
+                       oriental["yhat"])
+
+    store.append("morocco", morocco.keys, morocco.dates, np.array(morocco.values))
+    forecasting.forecast_all(keys, store, periods=5, cache=cache, processes=1)
+    assert forecasting.last_run == {"cached": 0, "warm": 2, "cold": 0}
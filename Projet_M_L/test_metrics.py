@@ -0,0 +1,53 @@
+import numpy as np
+
+import casestore
+import metrics
+
+
+def test_deltas_clip_corrections():
+    assert metrics.deltas([1, 3, 3, 2, 6]).tolist() == [0, 2, 0, 0, 4]
+    assert metrics.deltas([1, 3, 3, 2, 6], clip=False).tolist() == [0, 2, 0, -1, 4]
+    columns = metrics.deltas(np.array([[1, 10], [4, 5], [6, 7]]))
+    assert columns.tolist() == [[0, 0], [3, 0], [2, 2]]
+
+
+def test_interpolate_gaps():
+    values = np.array([[np.nan, 1], [1, np.nan], [np.nan, np.nan], [3, 7], [np.nan, 8]])
+    filled = metrics.interpolate(values, leading=0)
+    assert np.allclose(filled[:4], [[0, 1], [1, 3], [2, 5], [3, 7]])
+    assert np.isnan(filled[4, 0]) and filled[4, 1] == 8
+    assert np.isnan(metrics.mask_missing([casestore.MISSING, 2])[0])
+
+
+def test_rolling_mean_skips_missing():
+    assert np.allclose(metrics.rolling_mean([1, np.nan, 3, 5], window=2), [1, 1, 3, 4])
+    assert np.isnan(metrics.rolling_mean([1, np.nan, np.nan], window=2)[2])
+
+
+def test_growth_and_doubling():
+    cumulative = 100 * 2 ** (np.arange(30) / 5)  # doubles every 5 days
+    assert np.allclose(metrics.doubling_time(cumulative)[7:], 5)
+    assert np.allclose(metrics.growth_rate(cumulative)[7:], 2 ** 0.2 - 1)
+    assert np.isnan(metrics.growth_rate(cumulative)[:7]).all()
+    assert np.isinf(metrics.doubling_time(np.full(10, 3.0))[-1])
+
+
+def test_derive_breakdown():
+    features = metrics.derive(np.array([10, 20]), np.array([1, 2]), np.array([4, 8]),
+                              excluded=np.array([100, 150]))
+    assert features["active"].tolist() == [5, 10]
+    assert np.allclose(features["active_percent"] + features["deaths_percent"]
+                       + features["recovered_percent"], 100)
+    assert features["total_tests"].tolist() == [110, 170]
+
+
+def test_store_metrics(tmp_path):
+    store = casestore.CaseStore(str(tmp_path))
+    store.ingest_all()
+    features = metrics.global_metrics(store)
+    assert features["new_cases"].shape == (len(features["dates"]), len(features["keys"]))
+    assert (features["new_cases"] >= 0).all()
+    morocco = metrics.morocco_metrics(store)
+    assert len(morocco["regions"]) == 12
+    # 14 and 15 April have no regional counts, they are interpolated
+    assert not np.isnan(morocco["regional_confirmed"]).any()
@@ -0,0 +1,117 @@
+import os
+import subprocess
+import sys
+import threading
+
+import numpy as np
+import pytest
+
+import casestore
+import service
+
+
+@pytest.fixture
+def store(tmp_path):
+    """A store without the last day of the CSVs"""
+    full = casestore.CaseStore(str(tmp_path / "full"))
+    full.ingest_all()
+    store = casestore.CaseStore(str(tmp_path / "store"))
+    for name in ("confirmed", "recovered", "deaths"):
+        series = full.open(name)
+        store.append(name, series.keys, series.dates[:-1], np.array(series.values[:-1]))
+    return store
+
+
+def test_lru_cache():
+    cache = service.LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None and cache.get("a") == 1 and len(cache) == 2
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_sir_answers_are_cached_and_refitted_warm(store):
+    forecasts = service.ForecastService(store)
+    first = forecasts.forecast("sir", "Morocco", 10)
+    assert len(first["dates"]) == len(first["infected"]) == len(first["active"])
+    assert first["active"][-11] is not None and first["active"][-10] is None
+    assert forecasts.forecast("sir", "Morocco", 10) is first
+    longer = forecasts.forecast("sir", "Morocco", 20)
+    assert longer["infected"][:len(first["infected"])] == pytest.approx(first["infected"])
+    assert forecasts.stats == {"queries": 3, "cold_fits": 1, "warm_fits": 0}
+
+    assert forecasts.reload()["confirmed"] == 1
+    updated = forecasts.forecast("sir", "Morocco", 10)
+    assert len(updated["dates"]) == len(first["dates"]) + 1
+    assert forecasts.stats["warm_fits"] == 1
+
+
+def test_queries_over_tcp(store):
+    server = service.ForecastServer(service.ForecastService(store), port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        port = server.server_address[1]
+        answer = service.query({"model": "sir", "country": "Morocco", "horizon": 5},
+                               port=port)
+        assert answer["forecast"]["R0"] > 0
+        assert "error" in service.query({"model": "sir", "country": "Atlantis"}, port=port)
+        assert service.query({"command": "stats"}, port=port)["answers"] == 1
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_prophet_answers_are_cached_and_refitted_warm(store):
+    pytest.importorskip("prophet")
+    forecasts = service.ForecastService(store)
+    first = forecasts.forecast("prophet", "Morocco", 5)
+    # the store is a day short of the CSVs
+    assert len(first["dates"]) == len(first["yhat"]) == len(first["confirmed"]) == 200
+    assert first["confirmed"][-6] is not None and first["confirmed"][-5] is None
+    assert forecasts.forecast("prophet", "Morocco", 5) is first
+    assert forecasts.reload()["confirmed"] == 1
+    updated = forecasts.forecast("prophet", "Morocco", 5)
+    assert len(updated["dates"]) == len(updated["yhat"]) == 201
+    assert forecasts.stats == {"queries": 3, "cold_fits": 1, "warm_fits": 1}
+
+
+def test_invalid_queries_are_rejected(store):
+    forecasts = service.ForecastService(store)
+    for horizon in (-1, 2.5, "10"):
+        with pytest.raises(ValueError, match="horizon"):
+            forecasts.forecast("sir", "Morocco", horizon)
+    with pytest.raises(ValueError, match="s_0 must be a non negative number"):
+        forecasts.forecast("sir", "Morocco", 5, s_0="abc")
+    with pytest.raises(ValueError, match="series must be a string"):
+        forecasts.forecast("prophet", "Morocco", 5, series=3)
+    assert "error" in forecasts.handle({"model": "sir", "country": "Morocco",
+                                        "horizon": -1})
+    assert len(forecasts.answers) == 0
+    # numbers given as strings or integers are the same query
+    assert forecasts.forecast("sir", "Morocco", 5, s_0="20000") \
+        is forecasts.forecast("sir", "Morocco", 5)
+
+
+def test_malformed_requests_get_specific_errors(store):
+    forecasts = service.ForecastService(store)
+    assert forecasts.handle([1])["error"] == "A request must be a JSON object, not list"
+    assert forecasts.handle({"country": "Morocco"})["error"] \
+        == "Missing in the request: model"
+    assert forecasts.handle({})["error"] == "Missing in the request: model, country"
+    assert forecasts.handle({"model": "sir", "country": "Morocco", "parameters": [1]})["error"] \
+        == "parameters must be a JSON object"
+    assert "Unknown country" in forecasts.handle({"model": "sir", "country": "Atlantis"})["error"]
+
+
+def test_prophet_is_imported_by_the_first_prophet_query(store):
+    # a fresh interpreter, the other tests may already have imported Prophet
+    code = ("import sys, casestore, service\n"
+            "service.ForecastService(casestore.CaseStore({!r}))\n"
+            "print(sorted({{'prophet', 'fbprophet', 'matplotlib.pyplot'}} & set(sys.modules)))"
+            ).format(store.path)
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(service.__file__)), check=True)
+    assert result.stdout.strip() == "[]"
@@ -0,0 +1,119 @@
+import numpy as np
+from scipy.integrate import solve_ivp
+
+import casestore
+import sir
+
+
+def test_integrate_matches_solve_ivp():
+    beta, gamma = 1e-5, 0.02
+    y = sir.integrate(beta, gamma, 20000, 3, 10, 120)
+    reference = solve_ivp(lambda t, y: [-beta*y[0]*y[1], beta*y[0]*y[1] - gamma*y[1],
+                                        gamma*y[1]],
+                          [0, 120], [20000, 3, 10], t_eval=np.arange(120), rtol=1e-10).y.T
+    assert np.abs(y - reference).max() < 0.005 * 20013
+    # conservative and positive even for steps far too large for explicit schemes
+    y = sir.integrate(0.4, 0.001, 20000, 3, 10, 30, steps_per_day=1)
+    assert np.allclose(y.sum(axis=1), 20013) and (y >= 0).all()
+
+
+def test_integrate_broadcasts_parameters():
+    betas = np.array([1e-5, 2e-5, 3e-5])
+    y = sir.integrate(betas, 0.02, 20000, 3, 10, 50)
+    assert y.shape == (50, 3, 3)
+    assert np.allclose(y[:, :, 1], sir.integrate(2e-5, 0.02, 20000, 3, 10, 50))
+
+
+def test_gradient_matches_finite_differences():
+    days = np.arange(60)
+    data, recovered = 50 * np.exp(0.05 * days), 10 * days
+    point = np.array([1e-5, 0.03, 3.0, 10.0])
+    value, gradient = sir.loss_and_gradient(point, data, recovered, 20000, 3, 10,
+                                            free=("i_0", "r_0"))
+    for index, step in enumerate([1e-10, 1e-7, 1e-4, 1e-4]):
+        shift = np.zeros(4)
+        shift[index] = step
+        numeric = (sir.loss_and_gradient(point + shift, data, recovered, 20000, 3, 10,
+                                         free=("i_0", "r_0"))[0]
+                   - sir.loss_and_gradient(point - shift, data, recovered, 20000, 3, 10,
+                                           free=("i_0", "r_0"))[0]) / (2 * step)
+        assert np.isclose(numeric, gradient[index], rtol=1e-4)
+    assert np.isclose(value, sir.loss(point[:2], data, recovered, 20000, 3, 10))
+
+
+def test_fit_recovers_parameters():
+    y = sir.integrate(1.2e-5, 0.03, 20000, 3, 10, 100)
+    result = sir.fit(y[:, 1], y[:, 2], 20000, 3, 10)
+    assert np.allclose(result.x, [1.2e-5, 0.03], rtol=1e-3)
+
+
+def test_learner_morocco(tmp_path):
+    store = casestore.CaseStore(str(tmp_path))
+    store.ingest_all()
+    learner = sir.Learner("Morocco", store=store)
+    data, recovered, death = learner.load_data()
+    assert data.index[0] == "3/26/20"
+    beta, gamma = learner.fit(data, recovered).x
+    # optimum found by the notebook with solve_ivp
+    assert np.allclose([beta, gamma], [1.079e-5, 0.01634], rtol=0.02)
+    new_index, actual, _, _, prediction = learner.predict(beta, gamma, data, recovered, death,
+                                                          "Morocco", 20000, 3, 10)
+    assert len(new_index) == prediction.shape[0] == 150
+    assert new_index[len(data)] == "8/5/20" and np.isnan(actual[len(data)])
+
+
+def test_fit_regions_warm_start(tmp_path):
+    full = casestore.CaseStore(str(tmp_path / "full"))
+    full.ingest_all()
+    store = casestore.CaseStore(str(tmp_path / "store"))
+    for name in ("confirmed", "recovered", "deaths"):
+        series = full.open(name)
+        store.append(name, series.keys, series.dates[:-1], np.array(series.values[:-1]))
+    table = sir.fit_regions(["Morocco", "Tunisia"], store=store, processes=1)
+    assert sorted(table["country"]) == ["Morocco", "Tunisia"]
+    assert np.allclose(table["R0"], table["beta"] * table["s_0"] / table["gamma"])
+
+    # same days: copied, a new day: fitted again from the previous optimum
+    assert (sir.fit_regions(["Morocco", "Tunisia"], store=store, previous=table,
+                            processes=1) == table).all()
+    for name in ("confirmed", "recovered", "deaths"):
+        series = full.open(name)
+        store.append(name, series.keys, series.dates, np.array(series.values))
+    warm = sir.fit_regions(["Morocco", "Tunisia"], store=store, previous=table, processes=1)
+    cold = sir.fit_regions(["Morocco", "Tunisia"], store=store, s_0=warm["s_0"], processes=1)
+    assert (warm["days"] == table["days"] + 1).all()
+    assert np.allclose(warm["loss"], cold["loss"], rtol=1e-3)
+    path = str(tmp_path / "fits.npy")
+    sir.save_fits(path, warm)
+    assert (sir.load_fits(path) == warm).all()
+
+
+def test_ensemble_quantiles_match_numpy():
+    rng = np.random.default_rng(0)
+    parameters = {"beta": 1e-5 * np.exp(0.05 * rng.standard_normal(3000)),
+                  "gamma": 0.02 * np.exp(0.05 * rng.standard_normal(3000)),
+                  "s_0": 20000, "i_0": 3, "r_0": 10}
+    bands = sir.ensemble_quantiles(parameters, 100, quantiles=(0.1, 0.5, 0.9), chunk_size=700)
+    y = sir.integrate(parameters["beta"], parameters["gamma"], 20000, 3, 10, 100)
+    expected = np.quantile(y, (0.1, 0.5, 0.9), axis=2)
+    assert bands.shape == (3, 100, 3)
+    assert np.allclose(bands, expected, rtol=0.02, atol=1)
+
+
+def test_sample_posterior_around_fit():
+    y = sir.integrate(1.2e-5, 0.03, 20000, 3, 10, 100)
+    noise = np.random.default_rng(1).normal(0, 50, (2, 100))
+    data, recovered = y[:, 1] + noise[0], y[:, 2] + noise[1]
+    point = sir.fit(data, recovered, 20000, 3, 10).x
+    parameters = sir.sample_posterior(point, data, recovered, 20000, 3, 10, 2000, seed=2)
+    assert parameters["beta"].shape == (2000,) and (parameters["gamma"] > 0).all()
+    assert np.isclose(np.median(parameters["beta"]), point[0], rtol=0.01)
+    assert 0 < parameters["gamma"].std() < 0.1 * point[1]
+    assert (parameters["s_0"] == 20000).all()
+
+
+def test_fit_region_from_x0_alone():
+    y = sir.integrate(1.2e-5, 0.03, 20000, 3, 10, 100)
+    x, loss, *_ = sir.fit_region(y[:, 1], y[:, 2], 20000, 3, 10, x0=[1e-5, 0.02])
+    assert np.allclose(x, [1.2e-5, 0.03], rtol=1e-3)
+    assert loss < 1